@@ -0,0 +1,61 @@
+"""
+Reports p99 location latency during a burst of new locations, with and without admission control, against a
+simulated slow provider, and how much of the degraded content was upgraded once the burst was over.
+
+usage: python bench_admission.py [burst] [delay_seconds]
+"""
+
+import asyncio
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+
+from bench_services import build_services
+from domain.classes import Player, World
+from domain.config import AdmissionConfig, ImageReuseConfig
+from services.admission import AdmissionController
+from services.aiengines import AiEngineTest
+from services.metrics import Metrics
+
+async def run_burst(burst: int, admission_enabled: bool, engine: AiEngineTest) -> tuple[Metrics, World, AdmissionController]:
+    services = build_services(
+        engine,
+        image_reuse=ImageReuseConfig(),
+        admission=AdmissionConfig(enabled=admission_enabled, upgrade_interval_seconds=0.2)
+    )
+    metrics, location_factory = services.metrics, services.location_factory
+
+    world = World(backstory="A benchmark backstory.", player=Player())
+
+    async def new_location(position: tuple[int, int]):
+        with metrics.timed("location"):
+            await location_factory.get_location(world, position)
+
+    await asyncio.gather(*(new_location((x, 0)) for x in range(burst)))
+    return metrics, world, services.admission
+
+def missing_images(world: World) -> int:
+    return sum(1 for location in world.locations.values() if not location.image)
+
+async def main(burst: int, delay_seconds: float):
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=64))
+    engine = AiEngineTest(delay_seconds=delay_seconds)
+
+    for admission_enabled in (False, True):
+        metrics, world, admission = await run_burst(burst, admission_enabled, engine)
+        location = metrics.latency("location").summary()
+        label = "with admission control   " if admission_enabled else "without admission control"
+        print(f"{label}: p50={location['p50']:.3f}s p99={location['p99']:.3f}s max={location['max']:.3f}s locations without an image={missing_images(world)}")
+
+        if admission_enabled:
+            while admission.report()["pending_upgrades"] or missing_images(world):
+                await asyncio.sleep(0.5)
+            tiers = {name: count for name, count in metrics.counters.items() if name.startswith("admission_")}
+            print(f"  after the burst: locations without an image={missing_images(world)} {tiers}")
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(main(
+        burst=int(args[0]) if len(args) > 0 else 40,
+        delay_seconds=float(args[1]) if len(args) > 1 else 0.5
+    ))
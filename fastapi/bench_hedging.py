@@ -0,0 +1,50 @@
+"""
+Reports p99 move latency with and without hedged AI calls, against a simulated long-tail provider.
+
+usage: python bench_hedging.py [moves] [tail_probability] [tail_seconds]
+"""
+
+import asyncio
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+
+from bench_services import build_services
+from domain.classes import Player, World
+from domain.config import HedgingConfig
+from services.aiengines import AiEngineTest
+from services.metrics import Metrics
+
+async def run_moves(moves: int, hedging: bool, engine: AiEngineTest) -> Metrics:
+    services = build_services(
+        engine,
+        hedging=HedgingConfig(enabled=hedging, hedge_percentile=90.0, min_samples=10, initial_hedge_seconds=1.0)
+    )
+    metrics, location_factory, combatant_factory = services.metrics, services.location_factory, services.combatant_factory
+
+    world = World(backstory="A benchmark backstory.", player=Player())
+    for step in range(moves):
+        with metrics.timed("move"):
+            world.player.move(dir_x=+1)
+            location = await location_factory.get_location(world, world.player.get_position())
+            if step % 10 == 0:
+                await combatant_factory.create_enemy(world.lore(), location)
+    return metrics
+
+async def main(moves: int, tail_probability: float, tail_seconds: float):
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=64))
+    engine = AiEngineTest(delay_seconds=0.05, tail_probability=tail_probability, tail_seconds=tail_seconds)
+
+    for hedging in (False, True):
+        metrics = await run_moves(moves, hedging, engine)
+        move = metrics.latency("move").summary()
+        label = "with hedging   " if hedging else "without hedging"
+        print(f"{label}: p50={move['p50']:.3f}s p99={move['p99']:.3f}s max={move['max']:.3f}s counters={metrics.counters}")
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(main(
+        moves=int(args[0]) if len(args) > 0 else 200,
+        tail_probability=float(args[1]) if len(args) > 1 else 0.05,
+        tail_seconds=float(args[2]) if len(args) > 2 else 2.0
+    ))
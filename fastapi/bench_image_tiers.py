@@ -0,0 +1,48 @@
+"""
+Reports the generation time (and PNG size) of each image resolution tier on the local image engine's worker,
+and the saving of each tier against the location tier.
+
+usage: python bench_image_tiers.py <image_library> [repeats]
+"""
+
+import statistics
+import sys
+import time
+
+from domain.config import ImageSizesConfig
+from services.image_worker import ImageWorker
+
+def main(image_library: str, repeats: int):
+    tiers = ImageSizesConfig()
+    worker = ImageWorker(image_library=image_library)
+    worker.start()
+    try:
+        worker.generate("warm up", size=tiers.location)
+
+        results = {}
+        for kind in ImageSizesConfig.model_fields:
+            size = tiers.for_kind(kind)
+            seconds, kilobytes = [], []
+            for repeat in range(repeats):
+                start = time.perf_counter()
+                png = worker.generate(f"a {kind}, dark fantasy illustration, variation {repeat}", size=size)
+                seconds.append(time.perf_counter() - start)
+                kilobytes.append(len(png) / 1024)
+            results[kind] = (size, statistics.mean(seconds), statistics.mean(kilobytes))
+    finally:
+        worker.stop()
+
+    baseline = results["location"][1]
+    for kind, (size, mean_seconds, mean_kilobytes) in results.items():
+        saving = 1 - mean_seconds / baseline if baseline else 0.0
+        print(f"{kind:>10} {size[0]}x{size[1]}: {mean_seconds:.3f}s {mean_kilobytes:.1f}KB, {saving:.0%} faster than location")
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+    main(
+        image_library=args[0],
+        repeats=int(args[1]) if len(args) > 1 else 5
+    )
@@ -0,0 +1,78 @@
+"""
+Reports the logging overhead per request on the thread handling it, with print based display() and DEBUG
+provider logging to stdout (as before), and with the queued structured log.  stdout is replaced by a sink that
+takes sink_ms per write, like a terminal or a pipe to a busy log shipper.
+
+usage: python bench_logging.py [requests] [sink_ms] [provider_records]
+"""
+
+import logging
+import sys
+import time
+
+from domain.config import LoggingConfig
+from services import structured_log
+from services.display import display
+from services.structured_log import StructuredLog
+
+class SlowSink:
+    def __init__(self, sink_seconds: float):
+        self.sink_seconds = sink_seconds
+        self.writes = 0
+
+    def write(self, text: str):
+        self.writes += 1
+        time.sleep(self.sink_seconds)
+
+    def flush(self):
+        pass
+
+def handle_request(step: int, provider_records: int):
+    # What one move logs: the provider client's records for it's engine calls, then the move itself.
+    for _ in range(provider_records):
+        logging.getLogger("httpx").debug("HTTP Request: POST https://api-inference.huggingface.co/v1/chat/completions headers={'authorization': '...', 'content-type': 'application/json'}")
+    display(f"You have moved position from {(step, 0)} to {(step + 1, 0)}", event="move")
+
+def run(requests: int, provider_records: int) -> float:
+    start = time.perf_counter()
+    for step in range(requests):
+        handle_request(step, provider_records)
+    return (time.perf_counter() - start) / requests
+
+def main(requests: int, sink_ms: float, provider_records: int):
+    stdout = sys.stdout
+    root = logging.getLogger()
+
+    # Before: a blocking stdout handler at DEBUG, and display() printing.
+    sink = SlowSink(sink_ms / 1000)
+    sys.stdout = sink
+    handler = logging.StreamHandler(sink)
+    root.addHandler(handler)
+    root.setLevel(logging.DEBUG)
+    logging.getLogger("httpx").setLevel(logging.DEBUG)
+    before = run(requests, provider_records)
+    root.removeHandler(handler)
+    before_writes = sink.writes
+
+    # After: the structured log, with it's default levels and sampling.
+    sink = SlowSink(sink_ms / 1000)
+    sys.stdout = sink
+    log = StructuredLog(LoggingConfig(queue_size=requests * (provider_records + 1)))
+    log.start()
+    after = run(requests, provider_records)
+    drain_start = time.perf_counter()
+    report = log.report()
+    log.stop()
+    drain = time.perf_counter() - drain_start
+    sys.stdout = stdout
+
+    print(f"before: {before * 1e6:.1f}us per request on the request thread, {before_writes} writes")
+    print(f"after:  {after * 1e6:.1f}us per request on the request thread, {sink.writes} writes (listener drained the rest in {drain:.2f}s) {report}")
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(
+        requests=int(args[0]) if len(args) > 0 else 2000,
+        sink_ms=float(args[1]) if len(args) > 1 else 0.05,
+        provider_records=int(args[2]) if len(args) > 2 else 4
+    )
@@ -0,0 +1,117 @@
+"""
+Reports how resident memory, save time and load time grow with the size of a world, for synthetic worlds of
+1k, 10k and 100k explored tiles: with images held as image store references (as the server does), and with
+images inline in the world (as before the image store), which is only run at the sizes that fit in memory.
+Each world is built in a fresh process, so the sizes do not skew one another.
+
+usage: python bench_memory.py [sizes] [description_chars] [image_kb] [max_inline_mb]
+       e.g. python bench_memory.py 1000,10000,100000 600 300 2048
+"""
+
+import asyncio
+import hashlib
+import os
+import sys
+import tempfile
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Any
+
+# Resident memory per explored tile that the stored layout must stay under, for 600 character descriptions and
+# an item at every fifth tile: 2.5KB, against the ~300KB per tile of inline images.
+TARGET_BYTES_PER_TILE = 2560
+
+def resident_bytes() -> int:
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        with open("/proc/self/statm", "r") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def build_world(tiles: int, layout: str, description_chars: int, image_kb: int):
+    from domain.classes import Location, Player, Weapon, World
+
+    world = World(backstory="A benchmark backstory.", player=Player())
+    prose = "Moss covered stones ring a still pool, and the reeds whisper of the old kings who once rode here. " * (description_chars // 90 + 1)
+    inline_image = "data:image/png;base64," + "A" * (image_kb * 1024)
+    side = int(tiles ** 0.5) + 1
+    for index in range(tiles):
+        if layout == "inline":
+            image = inline_image + str(index)  # a string of it's own, as every generated image is.
+        else:
+            image = "stored:" + hashlib.sha1(str(index).encode("utf-8")).hexdigest()[:20]
+        location = Location(name=f"Glade {index}", description=f"{index}: {prose}"[:description_chars], image=image)
+        if index % 5 == 0:
+            location.items.append(Weapon(name=f"Blade {index}", description=prose[:200], image=image, image_prompt="a blade", item_type="Weapon"))
+        world.add_location((index % side, index // side), location)
+    return world
+
+def measure(tiles: int, layout: str, description_chars: int, image_kb: int) -> dict[str, Any]:
+    from domain.config import Config, ImageStoreConfig
+    from services.image_store import ImageStore
+    from services.world_factory import WorldFactory
+
+    baseline = resident_bytes()
+    start = time.perf_counter()
+    world = build_world(tiles, layout, description_chars, image_kb)
+    build_seconds = time.perf_counter() - start
+    resident = resident_bytes() - baseline
+
+    with tempfile.TemporaryDirectory() as directory:
+        save_file = os.path.join(directory, "world.json")
+        world_factory = WorldFactory(
+            ai_object_factory=None,
+            combatant_factory=None,
+            item_factory=None,
+            # Disabled, so loading the inline layout does not move it's images into the store.
+            image_store=ImageStore(ImageStoreConfig(enabled=False, directory=directory)),
+            config=Config(chosen_aiengine=0, save_file=save_file)
+        )
+
+        start = time.perf_counter()
+        asyncio.run(world_factory.save_world(world))
+        save_seconds = time.perf_counter() - start
+        save_mb = os.path.getsize(save_file) / (1024 * 1024)
+        del world
+
+        start = time.perf_counter()
+        asyncio.run(world_factory.load_world(save_file))
+        load_seconds = time.perf_counter() - start
+
+    return {
+        "resident_mb": resident / (1024 * 1024),
+        "bytes_per_tile": resident / tiles,
+        "build_seconds": build_seconds,
+        "save_seconds": save_seconds,
+        "save_mb": save_mb,
+        "load_seconds": load_seconds
+    }
+
+def main(sizes: list[int], description_chars: int, image_kb: int, max_inline_mb: int):
+    for layout in ("stored", "inline"):
+        for tiles in sizes:
+            if layout == "inline" and tiles * image_kb * 1.2 / 1024 > max_inline_mb:
+                print(f"{layout:>6} {tiles:>7} tiles: skipped, would need over {max_inline_mb}MB")
+                continue
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                result = executor.submit(measure, tiles, layout, description_chars, image_kb).result()
+            verdict = ""
+            if layout == "stored":
+                verdict = "meets" if result["bytes_per_tile"] <= TARGET_BYTES_PER_TILE else "MISSES"
+                verdict = f" ({verdict} the {TARGET_BYTES_PER_TILE} bytes per tile target)"
+            print(
+                f"{layout:>6} {tiles:>7} tiles: {result['resident_mb']:.1f}MB resident, {result['bytes_per_tile']:.0f} bytes per tile{verdict}, "
+                f"save {result['save_seconds']:.2f}s ({result['save_mb']:.1f}MB), load {result['load_seconds']:.2f}s, build {result['build_seconds']:.2f}s"
+            )
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(
+        sizes=[int(size) for size in args[0].split(",")] if len(args) > 0 else [1000, 10000, 100000],
+        description_chars=int(args[1]) if len(args) > 1 else 600,
+        image_kb=int(args[2]) if len(args) > 2 else 300,
+        max_inline_mb=int(args[3]) if len(args) > 3 else 2048
+    )
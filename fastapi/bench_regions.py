@@ -0,0 +1,75 @@
+"""
+Reports the cost (chat completions, input tokens) and the latency per tile of walking over every tile of an area,
+generating locations one tile at a time and a region at a time, against a simulated provider whose latency grows
+with the length of it's response.
+
+usage: python bench_regions.py [side] [call_seconds] [seconds_per_output_token] [dwell_seconds]
+"""
+
+import asyncio
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+
+from bench_services import build_services
+from domain.classes import Player, World
+from domain.config import RegionsConfig
+from services.aiengines import AiChatContext, AiEngineTest
+from services.metrics import Metrics
+
+class AiEngineTokenLatency(AiEngineTest):
+    def __init__(self, call_seconds: float, seconds_per_output_token: float):
+        super().__init__(delay_seconds=call_seconds)
+        self.seconds_per_output_token = seconds_per_output_token
+
+    async def chat_completion_async(self, context: AiChatContext) -> str:
+        response = self._generate_text(context)
+        # Roughly 4 characters per token, and real descriptions are about 4 times longer than the test engine's.
+        output_tokens = len(response)
+        await asyncio.sleep(self.delay_seconds + output_tokens * self.seconds_per_output_token)
+        return response
+
+def snake(side: int) -> list[tuple[int, int]]:
+    # Every tile of the area, each next to the one before.
+    return [(x if y % 2 == 0 else side - 1 - x, y) for y in range(side) for x in range(side)]
+
+async def walk(side: int, regions: RegionsConfig, engine: AiEngineTest, dwell_seconds: float) -> Metrics:
+    services = build_services(engine, regions=regions)
+    metrics, location_factory = services.metrics, services.location_factory
+
+    world = World(backstory="A benchmark backstory.", player=Player())
+    previous = (0, 0)
+    for position in snake(side):
+        with metrics.timed("tile"):
+            await location_factory.get_location(world, position)
+        location_factory.prefetch_ahead(world, position, (position[0] - previous[0], position[1] - previous[1]))
+        previous = position
+        # The player spends a moment on each tile.
+        await asyncio.sleep(dwell_seconds)
+    await location_factory.images_filled()
+    return metrics
+
+async def main(side: int, call_seconds: float, seconds_per_output_token: float, dwell_seconds: float):
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=64))
+    engine = AiEngineTokenLatency(call_seconds=call_seconds, seconds_per_output_token=seconds_per_output_token)
+    tiles = side * side
+
+    for label, regions in (
+        ("a tile at a time", RegionsConfig(size=1)),
+        ("3x3 regions     ", RegionsConfig(size=3))
+    ):
+        metrics = await walk(side, regions, engine, dwell_seconds)
+        tile = metrics.latency("tile").summary()
+        prompts = [stats.summary() | {"mean": stats.mean()} for name, stats in metrics.distributions.items() if name.startswith("input_tokens_")]
+        chats = sum(prompt["count"] for prompt in prompts)
+        input_tokens = sum(prompt["mean"] * prompt["count"] for prompt in prompts)
+        print(f"{label}: per tile {chats / tiles:.2f} chat completions, {input_tokens / tiles:.0f} input tokens, wait mean={metrics.latency('tile').mean():.3f}s p50={tile['p50']:.3f}s p90={tile['p90']:.3f}s max={tile['max']:.3f}s")
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(main(
+        side=int(args[0]) if len(args) > 0 else 6,
+        call_seconds=float(args[1]) if len(args) > 1 else 0.5,
+        seconds_per_output_token=float(args[2]) if len(args) > 2 else 0.01,
+        dwell_seconds=float(args[3]) if len(args) > 3 else 0.2
+    ))
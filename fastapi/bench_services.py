@@ -0,0 +1,56 @@
+"""
+The services the benchmarks run the game's generation through, built afresh for each run (unlike those of
+services/composition.py, which are built once per process), against the given engine as both the primary and
+the secondary, with the image store disabled.
+"""
+
+from dataclasses import dataclass
+
+from domain.config import AdmissionConfig, HedgingConfig, ImageReuseConfig, ImageSizesConfig, ImageStoreConfig, RegionsConfig, SchedulerConfig
+from services.admission import AdmissionController
+from services.aiengines import AiEngine
+from services.ai_object_factory import AiObjectFactory
+from services.combatant_factory import CombatantFactory
+from services.event_bus import EventBus
+from services.generation_tracker import GenerationTracker
+from services.hedging import HedgedCaller
+from services.image_reuse import ImageReuseIndex
+from services.image_store import ImageStore
+from services.item_factory import ItemFactory
+from services.location_factory import LocationFactory
+from services.metrics import Metrics
+from services.scheduler import GenerationScheduler
+
+@dataclass
+class BenchServices:
+    metrics: Metrics
+    scheduler: GenerationScheduler
+    admission: AdmissionController
+    ai_object_factory: AiObjectFactory
+    item_factory: ItemFactory
+    location_factory: LocationFactory
+    combatant_factory: CombatantFactory
+
+def build_services(
+    engine: AiEngine,
+    hedging: HedgingConfig = HedgingConfig(enabled=False),
+    image_reuse: ImageReuseConfig = ImageReuseConfig(enabled=False),
+    admission: AdmissionConfig = AdmissionConfig(enabled=False),
+    regions: RegionsConfig = RegionsConfig(size=1)
+) -> BenchServices:
+    metrics = Metrics()
+    hedged_caller = HedgedCaller(primary=engine, secondary=engine, config=hedging, metrics=metrics)
+    scheduler = GenerationScheduler(config=SchedulerConfig(), metrics=metrics)
+    image_reuse_index = ImageReuseIndex(config=image_reuse, metrics=metrics)
+    admission_controller = AdmissionController(config=admission, scheduler=scheduler, metrics=metrics)
+    ai_object_factory = AiObjectFactory(hedged_caller=hedged_caller, scheduler=scheduler, image_reuse=image_reuse_index, metrics=metrics, admission=admission_controller, image_sizes=ImageSizesConfig(), image_store=ImageStore(ImageStoreConfig(enabled=False)))
+    item_factory = ItemFactory(ai_object_factory=ai_object_factory)
+    return BenchServices(
+        metrics=metrics,
+        scheduler=scheduler,
+        admission=admission_controller,
+        ai_object_factory=ai_object_factory,
+        item_factory=item_factory,
+        location_factory=LocationFactory(ai_object_factory=ai_object_factory, item_factory=item_factory, event_bus=EventBus(), generation_tracker=GenerationTracker(metrics), regions=regions),
+        combatant_factory=CombatantFactory(ai_object_factory=ai_object_factory, item_factory=item_factory)
+    )
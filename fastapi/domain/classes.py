@@ -8,11 +8,15 @@ Create a "Read" token at the HuggingFace website (free)
 '''
 
 from __future__ import annotations
-from random import randint, choice
+import copy
+from domain.dice import randint, choice
 from services.display import display, CYAN
+from domain.map_index import MapIndex
 
-from typing import Optional, Dict, Tuple
-from pydantic import BaseModel, Field
+from types import MappingProxyType
+from typing import Any, Iterable, Iterator, Optional, Dict, Tuple
+from pydantic import BaseModel, Field, GetCoreSchemaHandler, PrivateAttr
+from pydantic_core import core_schema
 
 class Item(BaseModel):
     item_type: str
@@ -24,7 +28,7 @@ class Item(BaseModel):
     def to_typed_item(self) -> Item:
         constructor = globals().get(self.item_type.capitalize(), None)
         if constructor:
-            typed = constructor(**self.dict())
+            typed = constructor(**self.model_dump())
             return typed
         else:
             raise ValueError(f"Unknown item type: {self.item_type}")
@@ -73,11 +77,125 @@ class Potion(Item):
 class Money(Item):
     amount: int = Field(default_factory=lambda: randint(1, 100))
 
+_NO_ITEMS = MappingProxyType({})
+
+class Inventory:
+    """
+    The items held by a combatant or lying at a location, indexed by name and by type, with aggregates
+    (total defence, equipped weapon, summed Relic and Gem bonuses) kept up to date as items come and go.
+
+    Saved as a plain list of items, exactly like the list[Item] it replaces.
+    """
+    BONUS_ITEM_TYPES = ("Relic", "Gem")
+
+    # There is one per location, and most locations never hold an item.
+    __slots__ = ("_items", "_by_name", "_by_type", "_total_defence", "_stat_bonuses")
+
+    def __init__(self, items: Iterable[Item] = ()):
+        # dicts keyed by id(item) keep insertion order and allow O(1) removal.  Until the first item arrives they
+        # are all the one read only empty mapping, rather than four empty dicts per inventory.
+        self._items: dict[int, Item] = _NO_ITEMS
+        self._by_name: dict[str, dict[int, Item]] = _NO_ITEMS
+        self._by_type: dict[str, dict[int, Item]] = _NO_ITEMS
+        self._total_defence = 0
+        self._stat_bonuses: dict[str, int] = _NO_ITEMS
+        self.extend(items)
+
+    def _update_aggregates(self, item: Item, sign: int):
+        if isinstance(item, Armour):
+            self._total_defence += sign * item.defence
+        if item.item_type in self.BONUS_ITEM_TYPES:
+            for field, value in item:
+                if field.endswith("_bonus"):
+                    self._stat_bonuses[field] = self._stat_bonuses.get(field, 0) + sign * value
+
+    #
+    # PUBLIC METHODS
+    #
+
+    def append(self, item: Item):
+        key = id(item)
+        if key in self._items:
+            return
+        if self._items is _NO_ITEMS:
+            self._items, self._by_name, self._by_type, self._stat_bonuses = {}, {}, {}, {}
+        self._items[key] = item
+        self._by_name.setdefault(item.name, {})[key] = item
+        self._by_type.setdefault(item.item_type, {})[key] = item
+        self._update_aggregates(item, +1)
+
+    def extend(self, items: Iterable[Item]):
+        for item in items:
+            self.append(item)
+
+    def remove(self, item: Item):
+        key = id(item)
+        if key not in self._items:
+            raise ValueError(f"Item not in inventory: {item.name}")
+        del self._items[key]
+        del self._by_name[item.name][key]
+        del self._by_type[item.item_type][key]
+        self._update_aggregates(item, -1)
+
+    def find(self, item_name: str) -> Optional[Item]:
+        return next(iter(self._by_name.get(item_name, {}).values()), None)
+
+    def of_type(self, item_type: str) -> list[Item]:
+        return list(self._by_type.get(item_type, {}).values())
+
+    @property
+    def weapon(self) -> Optional[Item]:
+        return next(iter(self._by_type.get("Weapon", {}).values()), None)
+
+    @property
+    def total_defence(self) -> int:
+        return self._total_defence
+
+    @property
+    def stat_bonuses(self) -> dict[str, int]:
+        return dict(self._stat_bonuses)
+
+    def __iter__(self) -> Iterator[Item]:
+        return iter(list(self._items.values()))
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, item: Item) -> bool:
+        return id(item) in self._items
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, Inventory) and list(self) == list(other)
+
+    def __repr__(self) -> str:
+        return f"Inventory({list(self)!r})"
+
+    # The indexes are keyed by object identity, so copies must be rebuilt rather than copied field by field.
+    def __copy__(self) -> Inventory:
+        return Inventory(self)
+
+    def __deepcopy__(self, memo: dict) -> Inventory:
+        return Inventory(copy.deepcopy(list(self), memo))
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source_type: Any, handler: GetCoreSchemaHandler) -> core_schema.CoreSchema:
+        items_schema = handler.generate_schema(list[Item])
+        from_list = core_schema.no_info_after_validator_function(
+            lambda items: cls(item if type(item) is not Item else item.to_typed_item() for item in items),
+            items_schema
+        )
+        return core_schema.union_schema(
+            [core_schema.is_instance_schema(cls), from_list],
+            serialization=core_schema.plain_serializer_function_ser_schema(
+                lambda inventory: list(inventory), return_schema=items_schema
+            )
+        )
+
 class Location(BaseModel):
     name: str
     description: str
     image: Optional[str] # a base64 encoded PNG
-    items: list[Item] = Field(default_factory=list)
+    items: Inventory = Field(default_factory=Inventory)
 
 def generate_ability_field() -> int:
     return Field(default_factory=lambda: randint(1, 20))
@@ -93,7 +211,7 @@ class Combatant(BaseModel):
     health: float = 1.0
     mana: float = 1.0
 
-    items: list[Item] = Field(default_factory=list)
+    items: Inventory = Field(default_factory=Inventory)
 
     def max_health(self) -> int:
         return self.consitution * self.level
@@ -101,10 +219,19 @@ class Combatant(BaseModel):
     def max_mana(self) -> int:
         return self.intelligence * self.level
 
+    def total_defence(self) -> int:
+        return self.items.total_defence
+
+    def find_weapon(self) -> Optional[Item]:
+        return self.items.weapon
+
+    def stat_bonuses(self) -> dict[str, int]:
+        return self.items.stat_bonuses
+
     def attack(self, opponent: Combatant, weapon: Item):
         to_hit = self.agility - opponent.agility + randint(0, 20)
         if to_hit > 0:
-            damage = randint(weapon.damage[0], weapon.damage[1]) + weapon.damage[2] + self.strength - sum(armour.defence for armour in opponent.items if isinstance(armour, Armour))
+            damage = randint(weapon.damage[0], weapon.damage[1]) + weapon.damage[2] + self.strength - opponent.total_defence()
             damage_percent = damage / opponent.max_health()
             opponent.health -= damage_percent
 
@@ -124,18 +251,18 @@ class Player(Combatant):
         self.x += dir_x
         self.y += dir_y
 
-    def find_item(self, item_name: str, items: list[Item]) -> Optional[Item]:
-        return next(filter(lambda x: x.name == item_name, items), None)
+    def find_item(self, item_name: str, items: Inventory) -> Optional[Item]:
+        return items.find(item_name)
 
     def take_item(self, item_name: str, location: Location) -> bool:
         item = self.find_item(item_name, location.items)
         if item:
             self.items.append(item)
             location.items.remove(item)
-            display(f"{CYAN}You have taken {item_name}")
+            display(f"{CYAN}You have taken {item_name}", event="take")
             return True
         else:
-            display(f"Could not find item: {item_name}")
+            display(f"Could not find item: {item_name}", event="take")
             return False
         
     def drop_item(self, item_name: str, location: Location) -> bool:
@@ -143,14 +270,15 @@ class Player(Combatant):
         if item:
             self.items.remove(item)
             location.items.append(item)
-            display(f"{CYAN}You have dropped {item_name}")
+            display(f"{CYAN}You have dropped {item_name}", event="drop")
             return True
         else:
-            display(f"Do not have item: {item_name}")
+            display(f"Do not have item: {item_name}", event="drop")
             return False
             
 class World(BaseModel):
     backstory: str
+    world_bible: Optional[str] = None  # a condensed backstory, used in per entity prompts.
     player: Player
     locations: Dict[Tuple[int, int], Location] = Field(default_factory=dict)
     enemy: Optional[Enemy] = None
@@ -165,6 +293,24 @@ class World(BaseModel):
         exclude=True
     )
 
+    _map_index: Optional[MapIndex] = PrivateAttr(default=None)
+
+    def add_location(self, position: Tuple[int, int], location: Location):
+        self.locations[position] = location
+        if self._map_index is not None:
+            self._map_index.add(position, location)
+
+    def lore(self) -> str:
+        return self.world_bible or self.backstory
+
+    def map_index(self) -> MapIndex:
+        # Built on first use, then kept up to date by add_location.
+        if self._map_index is None:
+            self._map_index = MapIndex()
+            for position, location in self.locations.items():
+                self._map_index.add(position, location)
+        return self._map_index
+
     def get_exit_locations(self, position: Tuple[int, int]) -> Dict[str, Location]:
         x, y = position
         return {
@@ -6,15 +6,123 @@ pip install pydantic
 Create a "Read" token at the HuggingFace website (free)
 
 '''
-from typing import Any, Optional
+from typing import Any, Literal, Optional, Tuple
 from pydantic import BaseModel, Field
 
 class AiEngineConfig(BaseModel):
     engine_class: str
     token_file: Optional[str]
     properties: dict[str, Any] = Field(default_factory=dict)
+    weight: float = Field(default=1.0, gt=0)  # share of traffic when this engine is a member of an engine pool.
+
+class HedgingConfig(BaseModel):
+    enabled: bool = True
+    secondary_aiengine: Optional[int] = None  # index into aiengines, or None to hedge against the chosen engine.
+    # Images are not hedged against the chosen engine itself, as it generates them one at a time; unless it is an
+    # engine pool of several image engines, which sends the duplicate to another one.
+    hedge_images_on_same_engine: bool = False
+    hedge_percentile: float = 95.0
+    min_samples: int = 20  # until this many latencies are known for a kind, initial_hedge_seconds is used.
+    initial_hedge_seconds: float = 30.0
+    default_deadline_seconds: float = 120.0
+    deadline_seconds: dict[str, float] = Field(default_factory=dict)  # per entity kind e.g. "location", "item_image"
+
+class EnginePoolConfig(BaseModel):
+    # Indexes into aiengines; each pool needs at least one member.
+    text_aiengines: list[int] = Field(min_length=1)
+    image_aiengines: list[int] = Field(min_length=1)
+    strategy: Literal["least_outstanding", "weighted"] = "least_outstanding"
+    eject_after_failures: int = 3
+    eject_seconds: float = 60.0
+
+class SchedulerConfig(BaseModel):
+    max_concurrent_jobs: int = 4
+    max_background_jobs: int = 2  # jobs that are not interactive may only use this many of the slots.
+
+class ImageReuseConfig(BaseModel):
+    enabled: bool = True
+    threshold: float = 0.6  # estimated Jaccard similarity of the image prompts, from 0 to 1.
+
+class AdmissionConfig(BaseModel):
+    enabled: bool = True
+    recent_seconds: float = 60.0  # engine latencies from this far back are used to judge the current load.
+    # Past either threshold, new locations, enemies and items get their image later (a pooled one meanwhile).
+    defer_image_queue_depth: int = 6
+    defer_image_latency_seconds: float = 20.0
+    # Past either of these, their text also comes from a local template instead of the engine.
+    template_queue_depth: int = 12
+    template_latency_seconds: float = 60.0
+    upgrade_interval_seconds: float = 2.0  # how often to check whether deferred images can be generated yet.
+
+class ImageSizesConfig(BaseModel):
+    # The resolution tier of each kind of image.  Every engine generates at the smallest size it natively
+    # can that is no smaller, and downscales only if that is bigger.
+    location: Tuple[int, int] = (768, 768)
+    enemy: Tuple[int, int] = (256, 256)
+    item: Tuple[int, int] = (128, 128)
+    thumbnail: Tuple[int, int] = (64, 64)  # the tiles of the map, downscaled from the location images.
+
+    def for_kind(self, kind: str) -> Tuple[int, int]:
+        if kind not in ImageSizesConfig.model_fields:
+            raise ValueError(f"No image size is configured for {kind} images")
+        return getattr(self, kind)
+
+class ImageStoreConfig(BaseModel):
+    enabled: bool = True  # keep images on disk, and only references to them in the world.
+    directory: str = "save/images"
+    cache_mb: float = 64.0  # recently used images kept in memory for responses.
+    # How long an image no world refers to is kept on disk, as it may be of content still being made (e.g. a
+    # spare world being built), before it is collected.  See WorldFactory.collect_images.
+    keep_unreferenced_seconds: float = 3600.0
+
+class RegionsConfig(BaseModel):
+    # New locations are generated a square region of size x size tiles at a time, by one chat completion, so
+    # that neighbours are coherent and the prompt is paid for once.  1 generates them one at a time.
+    size: int = 3
+    # When the player reaches the edge of a region, the uncharted region ahead of them is generated at near future
+    # priority, so that walking into it seldom waits at all.
+    prefetch: bool = True
+
+class LoopMonitorConfig(BaseModel):
+    enabled: bool = True
+    interval_seconds: float = 0.05  # how often the heartbeat checks the event loop's lag.
+    stall_seconds: float = 0.1  # lag from which the loop counts as stalled, and the blocking stack is kept.
+    keep_stalls: int = 50
+    log_stalls: bool = True
+    profiler_enabled: bool = False  # allows /admin/profile and /admin/stalls, which show the server's stacks to any client.
+    max_profile_seconds: float = 60.0
+
+class LoggingConfig(BaseModel):
+    level: str = "INFO"
+    # Per logger (module) levels, e.g. to keep the provider clients from logging every request's headers.
+    levels: dict[str, str] = Field(default_factory=lambda: {"httpx": "WARNING", "httpcore": "WARNING", "urllib3": "WARNING"})
+    # Fraction of each hot path event (see display) that is logged.
+    sample_rates: dict[str, float] = Field(default_factory=lambda: {"move": 0.1, "take": 0.25, "drop": 0.25})
+    queue_size: int = 10000  # records past this many waiting to be written are dropped, not waited on.
+
+class SpareWorldsConfig(BaseModel):
+    enabled: bool = True
+    count: int = 2  # ready to play worlds kept in stock for new games.
+    directory: str = "save/spares"
+    retry_seconds: float = 30.0  # wait after a failed build, or while the engines are overloaded.
+
+class TraceConfig(BaseModel):
+    record_file: Optional[str] = None  # record the session (HTTP actions and AI responses) to this file.
+    replay_file: Optional[str] = None  # serve AI responses from this recorded session instead of any engine.
 
 class Config(BaseModel):
     aiengines: list[AiEngineConfig] = Field(default_factory=list)
     chosen_aiengine: int
     save_file: str
+    hedging: HedgingConfig = Field(default_factory=HedgingConfig)
+    scheduler: SchedulerConfig = Field(default_factory=SchedulerConfig)
+    image_reuse: ImageReuseConfig = Field(default_factory=ImageReuseConfig)
+    trace: TraceConfig = Field(default_factory=TraceConfig)
+    admission: AdmissionConfig = Field(default_factory=AdmissionConfig)
+    image_sizes: ImageSizesConfig = Field(default_factory=ImageSizesConfig)
+    regions: RegionsConfig = Field(default_factory=RegionsConfig)
+    image_store: ImageStoreConfig = Field(default_factory=ImageStoreConfig)
+    loop_monitor: LoopMonitorConfig = Field(default_factory=LoopMonitorConfig)
+    spare_worlds: SpareWorldsConfig = Field(default_factory=SpareWorldsConfig)
+    logging: LoggingConfig = Field(default_factory=LoggingConfig)
+    engine_pool: Optional[EnginePoolConfig] = None  # when set, used instead of chosen_aiengine.
@@ -0,0 +1,17 @@
+"""
+All of the game's own randomness (stats, encounters, loot) comes from here rather than the shared random module,
+so that it can be seeded for deterministic replays without being disturbed by AI engines or other libraries.
+"""
+
+import random
+
+_rng = random.Random()
+
+def seed(value: int):
+    _rng.seed(value)
+
+def randint(a: int, b: int) -> int:
+    return _rng.randint(a, b)
+
+def choice(seq):
+    return _rng.choice(seq)
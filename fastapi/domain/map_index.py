@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import hashlib
+
+from typing import TYPE_CHECKING, Any, Iterator, Optional, Tuple
+
+if TYPE_CHECKING:
+    from domain.classes import Location
+
+CHUNK_SIZE = 16
+
+class _MapTile:
+    __slots__ = ("location", "image", "image_hash")
+
+    def __init__(self, location: Location):
+        self.location = location
+        self.image: Optional[str] = None
+        self.image_hash: Optional[str] = None
+
+    def get_image_hash(self) -> Optional[str]:
+        # Recomputed only when the location's image has been replaced.
+        if self.location.image is not self.image:
+            self.image = self.location.image
+            self.image_hash = hashlib.sha1(self.image.encode("utf-8")).hexdigest()[:12] if self.image else None
+        return self.image_hash
+
+class MapIndex:
+    """
+    A spatial index over explored locations, bucketed into square chunks, for answering viewport queries
+    without walking every location in the world.
+    """
+    def __init__(self):
+        self.chunks: dict[Tuple[int, int], dict[Tuple[int, int], _MapTile]] = {}
+        self.images_by_hash: dict[str, Location] = {}
+
+    def _tiles_in(self, min_x: int, min_y: int, max_x: int, max_y: int) -> Iterator[Tuple[Tuple[int, int], _MapTile]]:
+        for chunk_y in range(min_y // CHUNK_SIZE, max_y // CHUNK_SIZE + 1):
+            for chunk_x in range(min_x // CHUNK_SIZE, max_x // CHUNK_SIZE + 1):
+                for position, tile in self.chunks.get((chunk_x, chunk_y), {}).items():
+                    x, y = position
+                    if min_x <= x <= max_x and min_y <= y <= max_y:
+                        yield position, tile
+
+    #
+    # PUBLIC METHODS
+    #
+
+    def add(self, position: Tuple[int, int], location: Location):
+        x, y = position
+        self.chunks.setdefault((x // CHUNK_SIZE, y // CHUNK_SIZE), {})[position] = _MapTile(location)
+
+    def query(self, min_x: int, min_y: int, max_x: int, max_y: int, cursor: int = 0, limit: int = 500) -> dict[str, Any]:
+        """
+        Returns the explored tiles inside the bounding box (inclusive) in a compact encoding:
+        each tile is [x, y, index into names, image hash], in row order, a page at a time.
+        """
+        tiles = sorted(self._tiles_in(min_x, min_y, max_x, max_y), key=lambda entry: (-entry[0][1], entry[0][0]))
+        page = tiles[cursor:cursor + limit]
+
+        names: list[str] = []
+        name_indexes: dict[str, int] = {}
+        encoded = []
+        for (x, y), tile in page:
+            name = tile.location.name
+            if name not in name_indexes:
+                name_indexes[name] = len(names)
+                names.append(name)
+            image_hash = tile.get_image_hash()
+            if image_hash:
+                self.images_by_hash[image_hash] = tile.location
+            encoded.append([x, y, name_indexes[name], image_hash])
+
+        next_cursor = cursor + limit if cursor + limit < len(tiles) else None
+        return {
+            "bbox": [min_x, min_y, max_x, max_y],
+            "total": len(tiles),
+            "names": names,
+            "tiles": encoded,
+            "next_cursor": next_cursor
+        }
+
+    def image_hash(self, position: Tuple[int, int]) -> Optional[str]:
+        # The hash to fetch the image at a single position with, see find_image.
+        x, y = position
+        tile = self.chunks.get((x // CHUNK_SIZE, y // CHUNK_SIZE), {}).get(position)
+        image_hash = tile.get_image_hash() if tile else None
+        if image_hash:
+            self.images_by_hash[image_hash] = tile.location
+        return image_hash
+
+    def find_image(self, image_hash: str) -> Optional[str]:
+        location = self.images_by_hash.get(image_hash)
+        return location.image if location else None
@@ -6,103 +6,318 @@ pip install fastapi
 pip install aiofiles
 
 '''
+import time
+_process_started = time.perf_counter()  # before the heavier imports, for measuring time to first request.
+
+import asyncio
+import json
 import logging
+import threading
 
-from typing import Tuple, Any
-from random import randint
+from typing import Tuple, Any, Callable, Optional, TypeVar
+from domain.dice import randint
 from enum import Enum, auto
 
-from fastapi import FastAPI, Body
+from fastapi import FastAPI, Body, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse
 from contextlib import asynccontextmanager
 
-from domain.classes import Player, Enemy, Location, Item
-from services.composition import get_world_factory, get_location_factory, get_combatant_factory, get_item_factory
+from domain.classes import Player, Enemy, Inventory, Location, Item, World
+from services.engine_pool import AiEnginePool
+from services.composition import get_admission, get_config, get_structured_log, get_loop_monitor, get_profiler, get_metrics, get_event_bus, get_generation_tracker, get_ai_engine, get_scheduler, get_image_reuse, get_image_store, get_trace_recorder, warm_up_ai_engines, get_world_factory, get_spare_worlds, get_location_factory, get_combatant_factory, get_item_factory
+from services.combat_simulator import CombatSimulator, unarmed_outcome
 from services.display import display
+from services.event_bus import diff_state
+from services.generation_tracker import GenerationCancelledError
+from services.readiness import Readiness
+from services.tracing import begin_replay
+from services.world_actor import WorldActor, WorldSnapshot
 from services.util import result
 
-logging.basicConfig(level=logging.DEBUG)
-logging.getLogger("httpx").setLevel(logging.DEBUG)  # for httpx
-logging.getLogger("urllib3").setLevel(logging.DEBUG)  # for requests
+T = TypeVar("T")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
 
+    app.state.config = await get_config()
+    app.state.structured_log = await get_structured_log()
+    app.state.structured_log.start()
+
+    # Seeds the dice, so sessions can be replayed deterministically.
+    app.state.trace_recorder = await get_trace_recorder()
+    if app.state.trace_recorder:
+        app.state.trace_recorder.begin(app.state.config.save_file)
+    elif app.state.config.trace.replay_file:
+        begin_replay(app.state.config.trace.replay_file)
+
+    app.state.metrics = await get_metrics()
+    app.state.loop_monitor = await get_loop_monitor()
+    app.state.loop_monitor.start()
+    app.state.profiler = await get_profiler()
+    app.state.event_bus = await get_event_bus()
+    app.state.generation_tracker = await get_generation_tracker()
+    app.state.ai_engine = await get_ai_engine()
+    app.state.scheduler = await get_scheduler()
+    app.state.image_reuse = await get_image_reuse()
+    app.state.image_store = await get_image_store()
+    app.state.admission = await get_admission()
+    app.state.admission.upgrade_hook = apply_upgrade
+    app.state.admission.stale_check = live_world_replaced
     app.state.world_factory = await get_world_factory()
     app.state.location_factory = await get_location_factory()
+    app.state.location_factory.apply_change = apply_upgrade
+    app.state.location_factory.is_replaced = is_replaced
     app.state.combatant_factory = await get_combatant_factory()
     app.state.item_factory = await get_item_factory()
+    app.state.spare_worlds = await get_spare_worlds()
+
+    # Engine construction (which may load model weights) and loading or creating the world happen in the
+    # background, so the server accepts requests straight away.  See /ready.
+    app.state.world = None
+    app.state.image_collector = None
+    app.state.world_actor = None
+    app.state.readiness = Readiness(started=_process_started)
+    startup = asyncio.create_task(
+        app.state.readiness.run({
+            "engines": warm_up_ai_engines(),
+            "world": load_world()
+        })
+    )
 
-    # Ensure the world exists.
-    app.state.world = await app.state.world_factory.get_world()
+    display(f"Accepting requests {time.perf_counter() - _process_started:.2f}s after process start.")
 
     yield
 
     # teardown logic here
-    if app.state.world:
+    app.state.loop_monitor.stop()
+    app.state.spare_worlds.stop()
+    if app.state.image_collector:
+        app.state.image_collector.cancel()
+    if app.state.world_actor:
+        app.state.world_actor.stop()
+    if not startup.done():
+        startup.cancel()
+        display("Startup did not finish; game state left untouched.")
+    elif app.state.readiness.steps.get("world") != "done":
+        display("The world never loaded; game state left untouched.")
+    elif app.state.world:
         await app.state.world_factory.save_world(app.state.world)
         display("Game state saved.")
     else:
         app.state.world_factory.delete_world()
+        await app.state.world_factory.collect_images([])
         display("Game state deleted, starting new game on restart.")
 
+    if app.state.trace_recorder:
+        app.state.trace_recorder.close()
+    app.state.structured_log.stop()
+
+async def load_world():
+    # Ensure the world exists, from a spare if there is no saved one, then top up the spares.
+    set_world(await app.state.world_factory.get_world(create=app.state.spare_worlds.new_world))
+    app.state.spare_worlds.refill()
+    collect_images()
+
+def collect_images():
+    # The images no world refers to any more (e.g. those of a world lost, or deleted before a restart) are removed in
+    # the background, one collection at a time.
+    if app.state.image_collector is None or app.state.image_collector.done():
+        app.state.image_collector = asyncio.create_task(app.state.world_factory.collect_images([app.state.world]))
+
+async def apply_upgrade(change):
+    # Content that was degraded under load (see AdmissionController) is upgraded by a command, like any change.
+    await app.state.world_actor.execute(lambda world: change())
+    app.state.event_bus.publish("content_upgraded")
+
+def is_replaced(world: World) -> bool:
+    # The world has been lost, and is (being) replaced by another one.
+    return world is not app.state.world or app.state.world_actor.retired
+
+def live_world_replaced() -> Optional[Callable[[], bool]]:
+    # Whether the world live right now has since been replaced, for background work that is only of use to it.
+    world = app.state.world
+    if world is None:
+        return None  # still being loaded (or created).
+    return lambda: is_replaced(world)
+
+def set_world(world: World):
+    # Every world gets it's own actor, through which all changes to it are made.
+    if app.state.world_actor:
+        app.state.world_actor.stop()
+    app.state.world = world
+    app.state.world_actor = WorldActor(world=world, metrics=app.state.metrics)
+
 app = FastAPI(
     root_path="/api",
     lifespan=lifespan
 )
 
+# Paths that answer while the background startup is still running.
+UNGATED_PATHS = ("/ready", "/stats", "/admin/stalls", "/admin/profile")
+# How long clients are asked to wait before trying again while the startup is still running (or has failed).
+RETRY_AFTER_SECONDS = 5
+
+@app.middleware("http")
+async def refuse_until_ready(request: Request, call_next):
+    # Refused straight away rather than held open until startup is done, which (warming up models, creating the
+    # world) can outlast a proxy's timeout.
+    readiness = app.state.readiness
+    if not request.url.path.endswith(UNGATED_PATHS) and not readiness.is_ready():
+        return JSONResponse(
+            status_code=503,
+            content=readiness.report(),
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)}
+        )
+
+    response = await call_next(request)
+    readiness.request_served()
+    return response
+
+@app.middleware("http")
+async def record_session(request: Request, call_next):
+    recorder = app.state.trace_recorder
+    if not recorder or request.url.path.endswith(UNGATED_PATHS):
+        return await call_next(request)
+
+    body = (await request.body()).decode("utf-8")
+    start = time.perf_counter()
+    response = await call_next(request)
+    recorder.record_http(
+        method=request.method,
+        path=request.url.path,
+        query=request.url.query,
+        body=body,
+        status=response.status_code,
+        seconds=time.perf_counter() - start
+    )
+    return response
+
+@app.middleware("http")
+async def announce_actions(request: Request, call_next):
+    # So that open websocket sessions also see what HTTP clients did.
+    response = await call_next(request)
+    if request.method == "POST":
+        app.state.event_bus.publish("state_changed", source=request.url.path)
+    return response
+
+@app.exception_handler(GenerationCancelledError)
+async def generation_cancelled(request: Request, error: GenerationCancelledError):
+    # A later action (e.g. another move, or a lost fight replacing the world, see WorldReplacedError) made what
+    # this request was waiting on obsolete.
+    return JSONResponse(status_code=409, content=result("SUPERSEDED"))
+
 #
 # Helper functions for INFORMATION HANDLERS
 #
 
+# Reads are served from the snapshot published after the latest command, see WorldActor.
+def obtain_snapshot() -> WorldSnapshot:
+    return app.state.world_actor.snapshot
+
 def obtain_player() -> Player:
-    return app.state.world.player
+    return obtain_snapshot().player
 
 def obtain_position() -> Tuple[int, int]:
-    return obtain_player().get_position()
+    return obtain_snapshot().position
+
+async def obtain_location(position: Tuple[int, int]) -> Location:
+    # Generated outside the world actor (so no command waits on it) and then added by a command.
+    world = app.state.world
+    location = world.locations.get(position)
+    if location is None:
+        region = await app.state.location_factory.generate_region(world, position)
+        location = await app.state.world_actor.execute(
+            lambda world: app.state.location_factory.add_region(world, position, region)
+        )
+    return location
 
 async def obtain_player_location() -> Location:
-    return await app.state.location_factory.get_location(
-        world=app.state.world,
-        position=obtain_position()
-    )
+    snapshot = obtain_snapshot()
+    if snapshot.location is not None:
+        return snapshot.location
+    return await obtain_location(snapshot.position)
 
 def obtain_enemies() -> list[Enemy]:
-    if app.state.world.enemy:
-        return [app.state.world.enemy]
+    enemy = obtain_snapshot().enemy
+    if enemy:
+        return [enemy]
     else:
         return []
 
-# TODO: Make a class in utils.py called ActionResponse
-async def obtain_allowed_buttons(result_value: str = "OK") -> dict[str, Any]:
-    movement_allowed = not app.state.world.enemy
-    allowed_buttons = {
+def build_allowed_buttons(snapshot: WorldSnapshot) -> dict[str, bool]:
+    movement_allowed = not snapshot.enemy
+    return {
         "n": movement_allowed,
         "e": movement_allowed,
         "w": movement_allowed,
         "s": movement_allowed,
-        "local_items": any((await obtain_player_location()).items),
-        "inventory": any(obtain_player().items),
-        "combat": len(obtain_enemies()) > 0
+        "local_items": snapshot.location is not None and len(snapshot.location.items) > 0,
+        "inventory": len(snapshot.player.items) > 0,
+        "combat": snapshot.enemy is not None
     }
+
+# TODO: Make a class in utils.py called ActionResponse
+async def obtain_allowed_buttons(result_value: str = "OK") -> dict[str, Any]:
+    allowed_buttons = build_allowed_buttons(obtain_snapshot())
     return result(result_value) | {"allowed_buttons": allowed_buttons}
 
+async def with_images(entities: list[T]) -> list[T]:
+    # The world holds references into the image store; responses carry the images themselves, resolved together
+    # (those of a location's items too).
+    items = [item for entity in entities if isinstance(entity, Location) for item in entity.items]
+    images = await app.state.image_store.resolve_many([entity.image for entity in entities + items])
+    resolved = {id(entity): image for entity, image in zip(entities + items, images)}
+
+    def copy(entity: T) -> T:
+        update = {"image": resolved[id(entity)]}
+        if isinstance(entity, Location):
+            update["items"] = Inventory(copy(item) for item in entity.items)
+        return entity.model_copy(update=update)
+    return [copy(entity) for entity in entities]
+
+async def obtain_session_state() -> dict[str, Any]:
+    # What a websocket session mirrors, kept compact: images are sent as hashes for /map/image, apart from the
+    # enemy's, which is sent once when it appears.  Never generates anything; a location that is still being
+    # generated is None.
+    snapshot = obtain_snapshot()
+    location = snapshot.location
+    enemy = snapshot.enemy
+    return {
+        "position": list(snapshot.position),
+        "health": snapshot.player.health,
+        "location": {
+            "name": location.name,
+            "description": location.description,
+            "image": app.state.world.map_index().image_hash(snapshot.position)
+        } if location else None,
+        "location_items": [item.name for item in location.items] if location else [],
+        "inventory": [item.name for item in snapshot.player.items],
+        "enemy": {
+            "name": enemy.name,
+            "description": enemy.description,
+            "image": await app.state.image_store.resolve(enemy.image)
+        } if enemy else None,
+        "enemy_health": enemy.health if enemy else None,
+        "allowed_buttons": build_allowed_buttons(snapshot)
+    }
+
 #
 # INFORMATION HANDLERS
 #
 
 @app.get("/")
 async def read_root():
-    return app.state.world.backstory
+    return obtain_snapshot().backstory
 
 @app.get("/location")
 async def get_location() -> Location:
-    return await obtain_player_location()
+    return (await with_images([await obtain_player_location()]))[0]
 
 @app.get("/location/items")
 async def get_location_items() -> list[Item]:
     location = await obtain_player_location()
-    return location.items
+    return await with_images(list(location.items))
 
 '''
 # not actually async, not actually used either.
@@ -113,61 +328,199 @@ async def get_location_exits() -> str:
 
 @app.get("/inventory")
 async def get_inventory() -> list[Item]:
-    return obtain_player().items
+    return await with_images(list(obtain_player().items))
+
+@app.get("/map")
+async def get_map(radius: int = 8, cursor: int = 0, limit: int = 500) -> dict[str, Any]:
+    # A minimap sized viewport around the player, in a compact encoding (see MapIndex.query), with the images of
+    # the tiles by hash, for /map/thumbnail.
+    radius = max(0, min(radius, 64))
+    limit = max(1, min(limit, 2000))
+    x, y = obtain_position()
+    return app.state.world.map_index().query(
+        x - radius, y - radius, x + radius, y + radius, cursor=cursor, limit=limit
+    ) | {"player": [x, y]}
+
+@app.get("/map/image/{image_hash}")
+async def get_map_image(image_hash: str) -> str:
+    image = await app.state.image_store.resolve(app.state.world.map_index().find_image(image_hash))
+    if image is None:
+        raise HTTPException(status_code=404, detail="Unknown image hash")
+    return image
+
+@app.get("/map/thumbnail/{image_hash}")
+async def get_map_thumbnail(image_hash: str) -> str:
+    # The same image as /map/image, at the (much smaller) thumbnail size, for drawing the tiles of the map.
+    image = await app.state.image_store.resolve_thumbnail(
+        app.state.world.map_index().find_image(image_hash), app.state.config.image_sizes.thumbnail
+    )
+    if image is None:
+        raise HTTPException(status_code=404, detail="Unknown image hash")
+    return image
+
+@app.get("/odds")
+async def get_odds(fights: int = 10000) -> dict[str, Any]:
+    # Monte Carlo odds of the current fight, without touching the actual combatants.
+    snapshot = obtain_snapshot()
+    if not snapshot.enemy:
+        return result("NO_ENEMY")
+    # As /attack, which does not exchange blows while a side is unarmed.
+    outcome = unarmed_outcome(snapshot.player, snapshot.enemy)
+    if outcome is not None:
+        return result(outcome)
+    fights = max(1, min(fights, 20000))
+    # Off the event loop, as a stalemate runs every fight to max_rounds.
+    odds = await asyncio.get_running_loop().run_in_executor(
+        None, lambda: CombatSimulator().simulate(snapshot.player, snapshot.enemy, fights=fights)
+    )
+    return result("OK") | odds
+
+@app.get("/ready")
+async def get_ready() -> dict[str, Any]:
+    return app.state.readiness.report()
+
+@app.get("/stats")
+async def get_stats() -> dict[str, Any]:
+    stats = app.state.metrics.report() | {
+        "scheduler": app.state.scheduler.report(),
+        "image_reuse": app.state.image_reuse.report(),
+        "image_store": app.state.image_store.report(),
+        "admission": app.state.admission.report()
+    }
+    stats["loop_monitor"] = app.state.loop_monitor.report()
+    stats["logging"] = app.state.structured_log.report()
+    stats["event_bus"] = app.state.event_bus.report()
+    stats["generation_tracker"] = app.state.generation_tracker.report()
+    stats["spare_worlds"] = app.state.spare_worlds.report()
+    if app.state.world_actor:
+        stats["world_actor"] = app.state.world_actor.report()
+    if isinstance(app.state.ai_engine, AiEnginePool):
+        stats["engine_pool"] = app.state.ai_engine.report()
+    return stats
+
+@app.get("/admin/stalls")
+async def get_stalls() -> list[dict[str, Any]]:
+    # The most recent event loop stalls, with the stack that was blocking the loop.
+    if not app.state.config.loop_monitor.profiler_enabled:
+        raise HTTPException(status_code=404, detail="The profiler is disabled")
+    return list(app.state.loop_monitor.stalls)
+
+@app.get("/admin/profile")
+async def get_profile(seconds: float = 10.0, interval_ms: float = 5.0, all_threads: bool = False) -> PlainTextResponse:
+    """
+    A sampling profile of the running server, in the folded stack format for flamegraph.pl or speedscope.
+    Only the event loop's thread is sampled, unless all_threads.
+    """
+    loop_monitor_config = app.state.config.loop_monitor
+    if not loop_monitor_config.profiler_enabled:
+        raise HTTPException(status_code=404, detail="The profiler is disabled")
+    if app.state.profiler.busy():
+        raise HTTPException(status_code=409, detail="A profile is already being captured")
+
+    seconds = max(0.1, min(seconds, loop_monitor_config.max_profile_seconds))
+    interval_seconds = max(0.001, interval_ms / 1000)
+    thread_id = None if all_threads else threading.get_ident()  # this handler runs on the event loop's thread.
+    folded = await asyncio.get_running_loop().run_in_executor(
+        None, lambda: app.state.profiler.capture(seconds, interval_seconds, thread_id)
+    )
+    return PlainTextResponse(
+        folded,
+        headers={"Content-Disposition": f'attachment; filename="profile-{int(time.time())}.folded"'}
+    )
 
 @app.get("/enemies")
 async def get_enemies() -> list[dict[str, str]]:
+    enemies = obtain_enemies()
+    images = await app.state.image_store.resolve_many([x.image for x in enemies])
     return [{
         "item_type": "Enemy",
         "name": x.name,
         "description": x.description,
-        "image": x.image
-    } for x in obtain_enemies()] 
+        "image": image
+    } for x, image in zip(enemies, images)]
 
 #
 # Helper functions for ACTION HANDLERS
 #
 
 async def start_new_game():
+    # Several actions may lose the same world at once; only the first replaces it.
+    world_actor = app.state.world_actor
+    if world_actor.retired:
+        return
+    world_actor.retired = True
+
     display("Starting new game...")
-    app.state.world = await app.state.world_factory.create_world()
+    app.state.generation_tracker.cancel_world(app.state.world)
+    set_world(await app.state.spare_worlds.new_world())
+    app.state.event_bus.publish("new_game")
+    collect_images()
+
+# The player's change in position for each move.
+MOVES = {
+    "n": {"dir_y": +1},
+    "s": {"dir_y": -1},
+    "e": {"dir_x": +1},
+    "w": {"dir_x": -1}
+}
 
 #
 # ACTION HANDLERS
 #
+# Each change to the world is a command run by the world actor; generation is awaited between commands.
+#
 
 @app.post("/move")
 async def move(player_choice: str = Body()) -> dict[str, Any]:
+    # Recorded separately so p99 move latency can be compared with hedging switched on and off.
+    hedging = "hedged" if app.state.config.hedging.enabled else "unhedged"
+    with app.state.metrics.timed(f"move_{hedging}"):
+        return await _move(player_choice)
+
+async def _move(player_choice: str) -> dict[str, Any]:
 
     class MoveResult(Enum):
         UNKNOWN_COMMAND = auto(),
         ENEMY_PRESENT = auto()
 
-    player = obtain_player()
-    old_position = player.get_position()
-
-    if player_choice == "n":
-        player.move(dir_y=+1)
-    elif player_choice == "s":
-        player.move(dir_y=-1)
-    elif player_choice == "e":
-        player.move(dir_x=+1)
-    elif player_choice == "w":
-        player.move(dir_x=-1)
-    else:
+    if player_choice not in MOVES:
         return await obtain_allowed_buttons(MoveResult.UNKNOWN_COMMAND)
 
-    display(f"You have moved position from {old_position} to {player.get_position()}")
+    def move_player(world: World) -> Tuple[int, int]:
+        player = world.player
+        old_position = player.get_position()
+        player.move(**MOVES[player_choice])
+        display(f"You have moved position from {old_position} to {player.get_position()}", event="move")
+        app.state.generation_tracker.cancel_elsewhere(world, player.get_position())
+        return player.get_position()
+
+    world = app.state.world
+    position = await app.state.world_actor.execute(move_player)
+    location = await obtain_location(position)
+    heading = (MOVES[player_choice].get("dir_x", 0), MOVES[player_choice].get("dir_y", 0))
+    app.state.location_factory.prefetch_ahead(world, position, heading)
 
     # random encounter ?
     if randint(0, 100) < 10:  # 10% chance
-        app.state.world.enemy = await app.state.combatant_factory.create_enemy(
-            backstory=app.state.world.backstory,
-            location=await obtain_player_location()
+        enemy = await app.state.generation_tracker.run(
+            world, position, "enemy",
+            lambda: app.state.combatant_factory.create_enemy(
+                backstory=world.lore(),
+                location=location
+            )
         )
 
-        display(f"You have encountered an enemy: {app.state.world.enemy.name}!")
-        return await obtain_allowed_buttons(MoveResult.ENEMY_PRESENT)
+        def encounter(world: World) -> bool:
+            # Only if the player is still here, and not already fighting.
+            if world.player.get_position() != position or world.enemy:
+                return False
+            world.enemy = enemy
+            return True
+
+        if await app.state.world_actor.execute(encounter):
+            display(f"You have encountered an enemy: {enemy.name}!")
+            app.state.event_bus.publish("enemy_appeared", name=enemy.name)
+            return await obtain_allowed_buttons(MoveResult.ENEMY_PRESENT)
 
     return await obtain_allowed_buttons()
 
@@ -181,46 +534,153 @@ async def attack() -> dict[str, Any]:
         VICTORY = auto(),
         DEFEAT = auto()
 
-    player = obtain_player()
-    enemy = app.state.world.enemy
-    if not enemy:
-        return await obtain_allowed_buttons(AttackResult.NO_ENEMY)
+    def attack_enemy(world: World) -> Any:
+        player = world.player
+        enemy = world.enemy
+        if player.health <= 0:
+            return AttackResult.DEFEAT  # already lost, and the world is being replaced.
+        if not enemy:
+            return AttackResult.NO_ENEMY
 
-    player_weapon = next(
-        filter(lambda x: x.item_type == "Weapon", player.items),
-        None
-    )
-    if player_weapon is None:
-        return await obtain_allowed_buttons(AttackResult.NO_PLAYER_WEAPON)
+        player_weapon = player.find_weapon()
+        if player_weapon is None:
+            return AttackResult.NO_PLAYER_WEAPON
 
-    player.attack(opponent=enemy, weapon=player_weapon)
-    if enemy.health <= 0:
-        app.state.world.enemy = None
-        return await obtain_allowed_buttons(AttackResult.VICTORY)
+        player.attack(opponent=enemy, weapon=player_weapon)
+        if enemy.health <= 0:
+            world.enemy = None
+            app.state.event_bus.publish("enemy_defeated", name=enemy.name)
+            return AttackResult.VICTORY
 
-    enemy_weapon = next(
-        filter(lambda x: x.item_type == "Weapon", enemy.items),
-        None
-    )
-    if enemy_weapon is None:
-        return await obtain_allowed_buttons(AttackResult.NO_ENEMY_WEAPON)
+        enemy_weapon = enemy.find_weapon()
+        if enemy_weapon is None:
+            return AttackResult.NO_ENEMY_WEAPON
 
-    enemy.attack(opponent=player, weapon=enemy_weapon)
-    if player.health <= 0:
-        await start_new_game()
-        return await obtain_allowed_buttons(AttackResult.DEFEAT)
+        enemy.attack(opponent=player, weapon=enemy_weapon)
+        if player.health <= 0:
+            return AttackResult.DEFEAT
 
-    else:
-        return await obtain_allowed_buttons()
+        return "OK"
+
+    outcome = await app.state.world_actor.execute(attack_enemy)
+    if outcome == AttackResult.DEFEAT:
+        await start_new_game()
+    return await obtain_allowed_buttons(outcome)
 
 @app.post("/take")
 async def take(item_name: str = Body()) -> dict[str, Any]:
-    location = await obtain_player_location()
-    obtain_player().take_item(item_name, location)
+    await obtain_player_location()
+
+    def take_item(world: World):
+        location = world.locations.get(world.player.get_position())
+        if location is not None:
+            world.player.take_item(item_name, location)
+
+    await app.state.world_actor.execute(take_item)
     return await obtain_allowed_buttons()
 
 @app.post("/drop")
 async def drop(item_name: str = Body()) -> dict[str, Any]:
-    location = await obtain_player_location()
-    obtain_player().drop_item(item_name, location)
+    await obtain_player_location()
+
+    def drop_item(world: World):
+        location = world.locations.get(world.player.get_position())
+        if location is not None:
+            world.player.drop_item(item_name, location)
+
+    await app.state.world_actor.execute(drop_item)
     return await obtain_allowed_buttons()
+
+#
+# SESSION CHANNEL
+#
+
+# Websocket actions, taking the message's "argument".
+SESSION_ACTIONS = {
+    "move": lambda argument: move(argument),
+    "attack": lambda argument: attack(),
+    "take": lambda argument: take(argument),
+    "drop": lambda argument: drop(argument)
+}
+
+def record_session_action(websocket: WebSocket, action: str, argument: Any, seconds: float):
+    # Recorded as the equivalent HTTP action, so replay.py can replay sessions that used the websocket.
+    recorder = app.state.trace_recorder
+    if recorder:
+        recorder.record_http(
+            method="POST",
+            path=websocket.url.path.removesuffix("/session") + f"/{action}",
+            query="",
+            body=json.dumps(argument) if argument is not None else "",
+            status=200,
+            seconds=seconds
+        )
+
+@app.websocket("/session")
+async def session(websocket: WebSocket):
+    """
+    A channel per game client, instead of an HTTP request per action followed by polling.  The client sends
+    {"action": ..., "argument": ..., "id": ...}; the server answers each action, and also pushes events as they
+    happen.  Every message carries "changes": only the parts of the session state that changed since the
+    previous message (the first message carries all of it).
+    """
+    if not app.state.readiness.is_ready():
+        await websocket.close(code=1013)  # try again later
+        return
+
+    await websocket.accept()
+    event_bus = app.state.event_bus
+    events = event_bus.subscribe()
+    sent_state: dict[str, Any] = {}
+    send_lock = asyncio.Lock()
+
+    async def send(message: dict[str, Any], only_if_changed: bool = False):
+        nonlocal sent_state
+        async with send_lock:
+            state = await obtain_session_state()
+            changes = diff_state(sent_state, state)
+            if only_if_changed and not changes:
+                return
+            sent_state = state
+            await websocket.send_json(message | {"changes": changes})
+
+    async def push_events():
+        while True:
+            event = await events.get()
+            # A bare state change (e.g. an HTTP action, or this session's own) is only worth a message if it
+            # changed something this session shows.
+            await send({"type": "event"} | event, only_if_changed=event["event"] == "state_changed")
+
+    pusher = asyncio.create_task(push_events())
+    try:
+        await send({"type": "state"})
+        while True:
+            try:
+                message = await websocket.receive_json()
+                action = SESSION_ACTIONS.get(message.get("action"))
+            except (ValueError, AttributeError):
+                await send({"type": "error", "detail": "Expected a JSON object"})
+                continue
+            if action is None:
+                await send({"type": "error", "id": message.get("id"), "detail": f"Unknown action: {message.get('action')}"})
+                continue
+
+            start = time.perf_counter()
+            try:
+                response = await action(message.get("argument"))
+            except GenerationCancelledError:
+                await send({"type": "result", "id": message.get("id"), "action": message["action"]} | result("SUPERSEDED"))
+                continue
+            except Exception as error:
+                # e.g. a malformed argument; only this action fails, not the session.
+                display(f"Session action {message['action']} failed: {error!r}", level=logging.ERROR)
+                await send({"type": "error", "id": message.get("id"), "detail": f"The {message['action']} action failed"})
+                continue
+            record_session_action(websocket, message["action"], message.get("argument"), time.perf_counter() - start)
+            await send({"type": "result", "id": message.get("id"), "action": message["action"]} | response)
+            event_bus.publish("state_changed", source=f"session/{message['action']}")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        pusher.cancel()
+        event_bus.unsubscribe(events)
@@ -0,0 +1,118 @@
+"""
+Pre-generates the locations around the origin of a saved world, so they can be served with no generation latency.
+Progress is checkpointed into the save file itself, so an interrupted run simply resumes where it left off.
+
+usage: python pregenerate.py <save_file> [--size N] [--order grid|spiral] [--workers K] [--checkpoint-every M]
+"""
+
+import argparse
+import asyncio
+import time
+
+from typing import Iterator, Tuple
+
+from domain.classes import World
+from services.composition import get_config, get_ai_object_factory, get_image_store, get_combatant_factory, get_item_factory, get_location_factory
+from services.display import display, GREEN, RED
+from services.scheduler import Priority, generation_priority
+from services.world_factory import WorldFactory
+
+def grid_positions(size: int) -> Iterator[Tuple[int, int]]:
+    half = size // 2
+    for y in range(half, half - size, -1):
+        for x in range(-half, size - half):
+            yield x, y
+
+def spiral_positions(size: int) -> Iterator[Tuple[int, int]]:
+    # Walks outwards from the origin: 1 east, 1 north, 2 west, 2 south, 3 east... keeping to the same region as the grid.
+    region = set(grid_positions(size))
+    x, y = 0, 0
+    step = 1
+    directions = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+    direction = 0
+    yield x, y
+    for _ in range(2 * size):
+        for _ in range(2):
+            dir_x, dir_y = directions[direction % 4]
+            for _ in range(step):
+                x, y = x + dir_x, y + dir_y
+                if (x, y) in region:
+                    yield x, y
+            direction += 1
+        step += 1
+
+async def pregenerate(world: World, world_factory: WorldFactory, positions: list[Tuple[int, int]], workers: int, checkpoint_every: int):
+    location_factory = await get_location_factory()
+    queue: asyncio.Queue = asyncio.Queue()
+    for position in positions:
+        queue.put_nowait(position)
+
+    completed = 0
+    failed = 0
+    save_failed = 0
+    started = time.perf_counter()
+
+    async def checkpoint():
+        nonlocal save_failed
+        try:
+            await world_factory.save_world(world)
+        except Exception as error:
+            # The tiles stay generated in memory, and are saved by the next checkpoint.
+            save_failed += 1
+            display(f"{RED}Failed to save a checkpoint: {error!r}")
+
+    async def worker():
+        nonlocal completed, failed
+        while not queue.empty():
+            position = queue.get_nowait()
+            try:
+                await location_factory.get_location(world=world, position=position)
+            except Exception as error:
+                # Left for the next run to retry.
+                failed += 1
+                display(f"{RED}Failed to generate {position}: {error!r}")
+                continue
+
+            completed += 1
+            rate = completed / (time.perf_counter() - started)
+            display(f"{GREEN}[{completed}/{len(positions)}] Generated {position} ({rate:.2f} tiles/s)")
+            if completed % checkpoint_every == 0:
+                await checkpoint()
+
+    try:
+        # Nobody is waiting on any one location, so the regions are left to generate as a whole.
+        with generation_priority(Priority.NEAR_FUTURE):
+            await asyncio.gather(*(worker() for _ in range(workers)))
+        # The images of the other tiles of each region are generated in the background.
+        await location_factory.images_filled()
+    finally:
+        await world_factory.save_world(world)
+        display(f"Generated {completed} locations ({failed} failed, {save_failed} checkpoint saves failed) in {time.perf_counter() - started:.1f}s.")
+
+async def main(args: argparse.Namespace):
+    config = await get_config()
+    world_factory = WorldFactory(
+        ai_object_factory=await get_ai_object_factory(),
+        combatant_factory=await get_combatant_factory(),
+        item_factory=await get_item_factory(),
+        image_store=await get_image_store(),
+        config=config.model_copy(update={"save_file": args.save_file})
+    )
+
+    # Creates (and saves) a new world if the save file does not exist yet.
+    world = await world_factory.get_world()
+
+    order = spiral_positions if args.order == "spiral" else grid_positions
+    positions = [position for position in order(args.size) if position not in world.locations]
+    display(f"{len(positions)} of {args.size * args.size} locations still to generate.")
+
+    await pregenerate(world, world_factory, positions, workers=args.workers, checkpoint_every=args.checkpoint_every)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-generate the locations around the origin of a saved world.")
+    parser.add_argument("save_file")
+    parser.add_argument("--size", type=int, default=9, help="generate a size x size region centred on the origin")
+    parser.add_argument("--order", choices=["grid", "spiral"], default="spiral")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--checkpoint-every", type=int, default=10, help="save after every this many locations")
+    asyncio.run(main(parser.parse_args()))
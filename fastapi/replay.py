@@ -0,0 +1,86 @@
+"""
+Replays a recorded session trace (see TraceConfig.record_file) against the server at full speed, with AI responses
+served from the trace, and reports CPU time, allocations and latency, for comparing performance between commits.
+
+usage: python replay.py <trace_file> [--no-allocations]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+import httpx
+
+import main
+from domain.config import TraceConfig
+from services.composition import get_config
+from services.metrics import Metrics
+from services.tracing import load_trace
+
+async def replay(trace_file: str, trace_allocations: bool) -> dict:
+    header, actions = load_trace(trace_file)
+
+    # Replay into a scratch save file, starting from the save the session was recorded from.
+    config = await get_config()
+    config.save_file = os.path.join(tempfile.mkdtemp(), "world.json")
+    config.trace = TraceConfig(replay_file=trace_file)
+    if header["initial_save"] is not None:
+        with open(config.save_file, "w") as file:
+            file.write(header["initial_save"])
+
+    metrics = Metrics()
+    mismatches = 0
+    if trace_allocations:
+        tracemalloc.start()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+
+    async with main.lifespan(main.app):
+        # Requests before startup is done are refused (see refuse_until_ready), and the session was recorded after.
+        await main.app.state.readiness.ready.wait()
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://replay") as client:
+            for action in actions:
+                url = action["path"] + (f"?{action['query']}" if action["query"] else "")
+                start = time.perf_counter()
+                response = await client.request(
+                    action["method"], url, content=action["body"] or None, headers={"content-type": "application/json"}
+                )
+                metrics.latency(f"{action['method']} {action['path']}").record(time.perf_counter() - start)
+                if response.status_code != action["status"]:
+                    mismatches += 1
+
+    cpu_seconds = time.process_time() - cpu_start
+    wall_seconds = time.perf_counter() - wall_start
+    allocations = None
+    if trace_allocations:
+        current, peak = tracemalloc.get_traced_memory()
+        allocations = {"current_bytes": current, "peak_bytes": peak}
+        tracemalloc.stop()
+
+    # The same trace must always end in the same world.
+    with open(config.save_file, "rb") as file:
+        world_hash = hashlib.sha1(file.read()).hexdigest()
+
+    return {
+        "trace_file": trace_file,
+        "actions": len(actions),
+        "status_mismatches": mismatches,
+        "cpu_seconds": cpu_seconds,
+        "wall_seconds": wall_seconds,
+        "allocations": allocations,
+        "final_world_sha1": world_hash,
+        "latency_seconds": metrics.report()["latency_seconds"]
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a recorded session trace and report it's performance.")
+    parser.add_argument("trace_file")
+    parser.add_argument("--no-allocations", action="store_true", help="skip tracemalloc, which slows the replay down")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(replay(args.trace_file, trace_allocations=not args.no_allocations)), indent=4))
@@ -0,0 +1,116 @@
+"""
+requirements:
+"""
+
+import asyncio
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Optional
+
+from domain.config import AdmissionConfig
+from services.display import display
+from services.metrics import Metrics
+from services.scheduler import GenerationScheduler, Priority, StaleJobError, generation_priority
+
+# Applies an upgrade to the world, e.g. through it's world actor.
+UpgradeHook = Callable[[Callable[[], None]], Awaitable[None]]
+
+class Tier(IntEnum):
+    FULL = 0  # text and image from the engines.
+    DEFERRED_IMAGE = 1  # text from the engines, a pooled image (or none) until the real one can be generated.
+    TEMPLATE = 2  # text from a local template too.
+
+async def apply_directly(change: Callable[[], None]):
+    change()
+
+# Where the upgrades of content degraded by the calling task are applied, if not through the admission controller's
+# upgrade_hook: e.g. straight to a spare world being built, which is no world actor's.
+current_upgrade_hook: ContextVar[Optional[UpgradeHook]] = ContextVar("current_upgrade_hook", default=None)
+
+@contextmanager
+def upgrades_applied_by(hook: UpgradeHook):
+    token = current_upgrade_hook.set(hook)
+    try:
+        yield
+    finally:
+        current_upgrade_hook.reset(token)
+
+class AdmissionController:
+    """
+    Decides, from the scheduler's queue depth and recent engine latency, how much new content may ask of the
+    engines, so that latency stays bounded during bursts.  Content that was degraded is upgraded in the
+    background (at speculative priority) once the load has dropped back.
+    """
+    def __init__(self, config: AdmissionConfig, scheduler: GenerationScheduler, metrics: Metrics):
+        self.config = config
+        self.scheduler = scheduler
+        self.metrics = metrics
+        self.upgrade_hook: UpgradeHook = apply_directly  # replaced by main.py, to go through the world actor.
+        # Made when content is degraded: whether it's upgrade has gone stale, e.g. as it's world was replaced since.
+        # Replaced by main.py.
+        self.stale_check: Callable[[], Optional[Callable[[], bool]]] = lambda: None
+        self._upgrades: list[tuple[Callable[[], Awaitable[Callable[[], None]]], Optional[UpgradeHook], Optional[Callable[[], bool]]]] = []
+        self._upgrader: asyncio.Task = None
+
+    def _recent_latency(self) -> float:
+        return max(
+            self.metrics.latency(f"ai_{kind}").recent_percentile(90, self.config.recent_seconds)
+            for kind in ("location", "enemy", "item")
+        )
+
+    async def _run_upgrades(self):
+        while self._upgrades:
+            if self.tier() != Tier.FULL or self.scheduler.queue_depth() > 0:
+                await asyncio.sleep(self.config.upgrade_interval_seconds)
+                continue
+
+            upgrade, hook, is_stale = self._upgrades.pop(0)
+            try:
+                with generation_priority(Priority.SPECULATIVE, is_stale):
+                    change = await upgrade()
+                await (hook or self.upgrade_hook)(change)
+                self.metrics.increment("admission_upgraded")
+            except StaleJobError:
+                self.metrics.increment("admission_upgrades_stale")
+            except Exception as error:
+                self.metrics.increment("admission_upgrade_failures")
+                display(f"Could not upgrade degraded content: {error!r}")
+
+    #
+    # PUBLIC METHODS
+    #
+
+    def tier(self) -> Tier:
+        if not self.config.enabled:
+            return Tier.FULL
+
+        depth = self.scheduler.queue_depth()
+        latency = self._recent_latency()
+        if depth >= self.config.template_queue_depth or latency >= self.config.template_latency_seconds:
+            return Tier.TEMPLATE
+        if depth >= self.config.defer_image_queue_depth or latency >= self.config.defer_image_latency_seconds:
+            return Tier.DEFERRED_IMAGE
+        return Tier.FULL
+
+    def admit(self, kind: str) -> Tier:
+        tier = self.tier()
+        self.metrics.increment(f"admission_{tier.name.lower()}_{kind}")
+        return tier
+
+    def defer(self, upgrade: Callable[[], Awaitable[Callable[[], None]]]):
+        # upgrade generates the real content, and returns the change that puts it in place.  Upgrades applied
+        # elsewhere than through upgrade_hook are not to the live world, so do not go stale with it.
+        hook = current_upgrade_hook.get()
+        self._upgrades.append((upgrade, hook, None if hook else self.stale_check()))
+        if self._upgrader is None or self._upgrader.done():
+            self._upgrader = asyncio.create_task(self._run_upgrades())
+
+    def report(self) -> dict[str, Any]:
+        return {
+            "tier": self.tier().name.lower(),
+            "queue_depth": self.scheduler.queue_depth(),
+            "recent_latency_seconds": self._recent_latency(),
+            "pending_upgrades": len(self._upgrades)
+        }
@@ -2,34 +2,216 @@
 requirements:
 """
 
-import random
+import asyncio
+import hashlib
 import json
 
+from typing import Any, Callable, Optional, Tuple
+from domain import dice
 from domain.classes import Location, Item, Player, Enemy
-from services.aiengines import AiChatContext, AiEngine
+from domain.config import ImageSizesConfig
+from services.admission import AdmissionController, Tier
+from services.aiengines import AiChatContext
+from services.content_templates import ContentTemplates
+from services.hedging import HedgedCaller
+from services.image_reuse import ImageReuseIndex
+from services.image_store import ImageStore
+from services.metrics import Metrics
+from services.scheduler import GenerationScheduler
+
+GAME_PREAMBLE = "You are playing a fantasy rogue-like game."
+
+ITEM_TYPES = "Weapon,Spellbook,Money,Gem,Armour,Relic,Potion".split(",")
+
+# What to ask for, per kind of entity, when several entities share one chat completion.
+ENTITY_GUIDANCE = {
+    "Location": "a location that has just been discovered. Describe what you see in this location only (do not describe exits, or other locations).  Do not describe items.",
+    "Enemy": "an enemy that has just been encountered. Describe ONLY the enemy, and not anything else e.g. it's surrounds, stats, nor any sort of random sidequest associated with it.",
+    "Item": "a {kind} that has just been found. Describe ONLY the {kind}, and not anything else e.g. it's surrounds, stats, nor any sort of random sidequest associated with it.",
+}
 
 class AiObjectFactory:
-    def __init__(self, ai_engine: AiEngine):
-        self.ai_engine = ai_engine
+    def __init__(self, hedged_caller: HedgedCaller, scheduler: GenerationScheduler, image_reuse: ImageReuseIndex, metrics: Metrics, admission: AdmissionController, image_sizes: ImageSizesConfig, image_store: ImageStore):
+        self.hedged_caller = hedged_caller
+        self.image_store = image_store
+        self.image_sizes = image_sizes
+        self.metrics = metrics
+        self.scheduler = scheduler
+        self.image_reuse = image_reuse
+        self.admission = admission
+        self.templates = ContentTemplates()
 
-    async def create_backstory(self) -> str:
+    #
+    # PRIVATE METHODS
+    #
+
+    # Every engine call is a job on the scheduler, at the priority of the calling task.
+
+    async def _chat(self, kind: str, context: AiChatContext) -> str:
+        self.metrics.distribution(f"input_tokens_{kind}").record(context.estimate_tokens())
+        return await self.scheduler.submit(
+            lambda: self.hedged_caller.call(
+                kind, lambda engine: engine.chat_completion_async(context)
+            )
+        )
+
+    async def _image(self, kind: str, prompt: str, size: Tuple[int, int]) -> str:
+        # Returns a reference into the image store, rather than the image itself.
+        image = await self.scheduler.submit(
+            lambda: self.hedged_caller.call(
+                f"{kind}_image", lambda engine: engine.text_to_image_async(prompt, size=size)
+            )
+        )
+        return await asyncio.get_running_loop().run_in_executor(None, self.image_store.put, image)
+
+    # New locations, enemies and items are admitted at the tier the current load allows, see AdmissionController.
+
+    async def _entity_chat(self, kind: str, context: AiChatContext, kinds: list[str]) -> str:
+        # Answers in the same JSON format as the engine would, from a local template when under heavy load.
+        if self.admission.admit(kind) == Tier.TEMPLATE:
+            entities = [self.templates.entity(entity_kind) for entity_kind in kinds]
+            if context.entity_kinds:
+                return json.dumps({"entities": [{"kind": entity_kind} | entity for entity_kind, entity in zip(kinds, entities)]})
+            return json.dumps(entities[0])
+
+        return await self._chat(kind, context)
+
+    async def _generate_image(self, kind: str, prompt: str, size: Tuple[int, int], scope: str) -> str:
+        image = await self._image(kind, prompt, size=size)
+        if scope:
+            self.image_reuse.add(scope, prompt, image)
+        return image
+
+    async def _upgrade_image(self, entity: Any, kind: str, prompt: str, size: Tuple[int, int], scope: str) -> Callable[[], None]:
+        image = await self._generate_image(kind, prompt, size, scope)
+        return lambda: setattr(entity, "image", image)
+
+    async def _obtain_image(self, entity: Any, kind: str, prompt: str, scope: str, reuse: bool = True) -> Optional[str]:
+        """
+        The entity's image: a reused one, a newly generated one or, under load, a pooled one (or none) for now,
+        with the real one generated once there is capacity again.
+        """
+        size = self.image_sizes.for_kind(kind)
+        if reuse:
+            image = self.image_reuse.find(scope, prompt, kind)
+            if image:
+                return image
+
+        if self.admission.admit(f"{kind}_image") == Tier.FULL:
+            return await self._generate_image(kind, prompt, size, scope)
+
+        pooled = self.image_reuse.find_pooled(scope, prompt)
+        self.admission.defer(lambda: self._upgrade_image(entity, kind, prompt, size, scope))
+        return pooled if pooled is not None else ("" if isinstance(entity, Item) else None)
+
+    async def _fill_image(self, entity: Any, kind: str, prompt: str, scope: str, reuse: bool = True):
+        entity.image = await self._obtain_image(entity, kind, prompt, scope, reuse)
+
+    def _prompt_prefix(self, backstory: str) -> AiChatContext:
+        """
+        Every per entity prompt starts with exactly these messages, and only then the parts that vary, so that
+        engines can reuse their prefix (KV) cache for it.
+        """
         context = AiChatContext()
-        context.add_system_message(
-            "You are playing a fantasy rogue-like game."
+        context.add_system_messages(
+            [
+                GAME_PREAMBLE,
+                f"Backstory: {backstory}"
+            ]
+        )
+        return context
+
+    def _reuse_scope(self, backstory: str, item_type: str) -> str:
+        # Images are only ever reused within the same world, and for the same type of thing.
+        return f"{hashlib.sha1(backstory.encode('utf-8')).hexdigest()[:12]}:{item_type}"
+
+    def _describe_entities(self, kinds: list[str]) -> list[str]:
+        # Once per kind, rather than once per entity, as a region is mostly entities of the same kind.
+        numbers: dict[str, list[int]] = {}
+        for index, kind in enumerate(kinds):
+            numbers.setdefault(kind, []).append(index + 1)
+        descriptions = []
+        for kind, indices in numbers.items():
+            guidance = ENTITY_GUIDANCE.get(kind, ENTITY_GUIDANCE["Item"]).format(kind=kind)
+            label = f"Entity {indices[0]}" if len(indices) == 1 else f"Entities {', '.join(map(str, indices))}"
+            descriptions.append(f"{label} ({kind}): each {guidance}  Keep it focussed.")
+        return descriptions
+
+    async def _create_entities(self, backstory: str, scene: list[str], kinds: list[str]) -> list[dict]:
+        """
+        Generates several entities with a single chat completion, and returns their raw JSON dicts in the order of kinds.
+        Images are NOT generated here.
+        """
+        context = self._prompt_prefix(backstory)
+        context.entity_kinds = kinds
+        context.add_system_messages(
+            scene + [
+                f"Come up with {len(kinds)} entities, in this order:"
+            ] + self._describe_entities(kinds) + [
+                "For each entity, come up with a short, unique name (ONLY the name, no other guff please), a description, and a prompt for an image generator not exceeding 77 tokens."
+            ]
+        )
+        context.add_user_message(
+            'Give the response in this JSON format, with one entry per entity, in the order above: {"entities": [{"kind": "<the kind of the entity>", "name": "<the name>", "description": "<the description>", "image_prompt": "<the prompt for the image generator (max 77 tokens)>"}, ...]}'
         )
+
+        kind = kinds[0].lower() if kinds[0] in ENTITY_GUIDANCE else "item"
+        responseJsonStr = await self._entity_chat(kind, context, kinds)
+        entities = json.loads(responseJsonStr)["entities"]
+        if len(entities) != len(kinds):
+            raise ValueError(f"Expected {len(kinds)} entities but got {len(entities)}")
+
+        for entity, kind in zip(entities, kinds):
+            entity.pop("kind", None)
+            if kind not in ENTITY_GUIDANCE:
+                entity["item_type"] = kind
+
+        return entities
+
+    async def _create_items_from_entities(self, backstory: str, entities: list[dict]) -> list[Item]:
+        # Typed straight away, so that a deferred image is upgraded on the very item that ends up in the world.
+        items = [Item(**entity, image="").to_typed_item() for entity in entities]
+        await asyncio.gather(
+            *(
+                self._fill_image(
+                    item, "item", item.image_prompt, scope=self._reuse_scope(backstory, item.item_type)
+                ) for item in items
+            )
+        )
+        return items
+
+    #
+    # PUBLIC METHODS
+    #
+
+    def random_item_type(self) -> str:
+        return dice.choice(ITEM_TYPES)
+
+    async def create_backstory(self) -> str:
+        context = AiChatContext()
+        context.add_system_message(GAME_PREAMBLE)
         context.add_user_message(
             "Come up with a backstory for the game that will allow cohesive generation of locations and items.  The tone should be of a narrator to a player, so avoid meta talk.  Do not mention inventory, or ask what to do next.  Just describe the backstory itself."
         )
 
-        return await self.ai_engine.chat_completion_async(context)
+        return await self._chat("backstory", context)
+
+    async def create_world_bible(self, backstory: str) -> str:
+        # Generated once per world, and used in place of the (much longer) backstory in every per entity prompt.
+        context = AiChatContext()
+        context.add_system_message(GAME_PREAMBLE)
+        context.add_user_message(
+            "Condense the following backstory into a compact world bible of no more than 100 words: the setting, tone, key factions and places, and the visual style.  Use terse notes rather than prose, and say nothing else.\n\n"
+            f"Backstory: {backstory}"
+        )
+
+        return await self._chat("world_bible", context)
 
     async def create_location(self, exits: dict[str, str], backstory: str, locations: dict[str, Location]) -> Location:
 
-        context = AiChatContext()
+        context = self._prompt_prefix(backstory)
         context.add_system_messages(
             [
-                "You are playing a fantasy rogue-like game.",
-                f"Backstory: {backstory}"
                 "You are looking about a new location you have discovered.",
                 f"These are the surrounding locations in a dictionary.  Please make the new location consistent with it's known (charted) surrounds: \n{exits}",
                 f"Come up with a short, unique name for this location, and say ONLY the name, no other guff please. The following names are already taken: {list(map(lambda x: x.name, locations.values()))}",
@@ -41,34 +223,33 @@ class AiObjectFactory:
             'Give the response in this JSON format: {"name": "<the name of the location>", "description": "<the description of the location>", "image_prompt: "<the prompt for the image generator (max 77 tokens)>"}'
         )
 
-        responseJsonStr = await self.ai_engine.chat_completion_async(context)
+        responseJsonStr = await self._entity_chat("location", context, ["Location"])
         responseJson = json.loads(responseJsonStr)
-        responseJson["image"] = await self.ai_engine.text_to_image_async(
-            responseJson["image_prompt"],
-            size=(768,768)
+        location = Location(**responseJson, image=None)
+        await self._fill_image(
+            location, "location", responseJson["image_prompt"],
+            scope=self._reuse_scope(backstory, "Location"), reuse=False
         )
 
-        return Location(**responseJson)
+        return location
 
-    async def create_item_image(self, image_prompt: str) -> str:
-        return await self.ai_engine.text_to_image_async(
-            image_prompt, 
-            size=(128,128)  # TODO: Actually make this work.
-        )
+    async def create_item_image(self, image_prompt: str, kind: str = "item", scope: str = None) -> str:
+        if scope:
+            image = self.image_reuse.find(scope, image_prompt, kind)
+            if image:
+                return image
+
+        return await self._generate_image(kind, image_prompt, self.image_sizes.for_kind(kind), scope)
 
     async def create_item(self, backstory: str) -> Item:
-        item_type = random.choice(
-            "Weapon,Spellbook,Money,Gem,Armour,Relic,Potion".split(",")
-        )
+        item_type = self.random_item_type()
         return await self.create_item_of_type(backstory=backstory, item_type=item_type)
 
     async def create_item_of_type(self, backstory: str, item_type: str) -> Item:
 
-        context = AiChatContext()
+        context = self._prompt_prefix(backstory)
         context.add_system_messages(
             [
-                "You are playing a fantasy rogue-like game.",
-                f"Backstory: {backstory}",
                 f"You have found a new {item_type} at the current game location.",
                 f"Come up with a short, unique name for this item, and say ONLY the name, no other guff please. Example: 'Ebony Sword'",
                 f"Also describe the {item_type} you have just found.  Describe ONLY the {item_type}, and not anything else e.g. it's surrounds, stats, nor any sort of random sidequest associated with it.  Keep it focussed.",
@@ -79,14 +260,17 @@ class AiObjectFactory:
             'Give the response in this JSON format: {"name": "<the name of the item>", "description": "<the description of the item>", "image_prompt: "<the prompt for the image generator (max 77 tokens)>"}'
         )
 
-        responseJsonStr = await self.ai_engine.chat_completion_async(context)
+        responseJsonStr = await self._entity_chat("item", context, [item_type])
         responseJson = json.loads(responseJsonStr)
         responseJson["item_type"] = item_type
 
         # Create an image for the item.
-        responseJson["image"] = await self.create_item_image(responseJson["image_prompt"])
+        item = Item(**responseJson, image="").to_typed_item()
+        await self._fill_image(
+            item, "item", item.image_prompt, scope=self._reuse_scope(backstory, item_type)
+        )
 
-        return Item(**responseJson)
+        return item
     '''
     async def create_player(self) -> Player:
         items = [
@@ -101,11 +285,9 @@ class AiObjectFactory:
         return Player(x=0, y=0, items=items)
     '''
     async def create_enemy(self, backstory: str, surroundings: str) -> Item:
-        context = AiChatContext()
+        context = self._prompt_prefix(backstory)
         context.add_system_messages(
             [
-                "You are playing a fantasy rogue-like game.",
-                f"Backstory: {backstory}",
                 f"You have just encountered an enemy. Location: {surroundings}",
                 f"Come up with a short, unique name for this enemy, and say ONLY the name, no other guff please. Example: 'Flesh Reaping Worm'",
                 f"Also describe the enemy you have just found.  Describe ONLY the enemy, and not anything else e.g. it's surrounds, stats, nor any sort of random sidequest associated with it.  Keep it focussed.",
@@ -116,13 +298,105 @@ class AiObjectFactory:
             'Give the response in this JSON format: {"name": "<the name of the enemy>", "description": "<the description of the enemy>", "image_prompt: "<the prompt for the image generator (max 77 tokens)>"}'
         )
 
-        responseJsonStr = await self.ai_engine.chat_completion_async(context)
+        responseJsonStr = await self._entity_chat("enemy", context, ["Enemy"])
         responseJson = json.loads(responseJsonStr)
 
         # Create an image for the item.
-        responseJson["image"] = await self.create_item_image(responseJson["image_prompt"])
+        enemy = Enemy(**responseJson)
+        await self._fill_image(
+            enemy, "enemy", responseJson["image_prompt"], scope=self._reuse_scope(backstory, "Enemy")
+        )
 
-        return Enemy(**responseJson)
-    
+        return enemy
 
+    async def create_enemy_with_items(self, backstory: str, surroundings: str, item_types: list[str]) -> Tuple[Enemy, list[Item]]:
+        entities = await self._create_entities(
+            backstory=backstory,
+            scene=[f"You have just encountered an enemy, carrying items. Location: {surroundings}"],
+            kinds=["Enemy"] + item_types
+        )
+        enemy_json, item_entities = entities[0], entities[1:]
+
+        enemy = Enemy(**enemy_json)
+        _, items = await asyncio.gather(
+            self._fill_image(
+                enemy, "enemy", enemy_json["image_prompt"], scope=self._reuse_scope(backstory, "Enemy")
+            ),
+            self._create_items_from_entities(backstory, item_entities)
+        )
+
+        return enemy, items
+
+    async def create_location_with_items(self, exits: dict[str, str], backstory: str, locations: dict[str, Location], item_types: list[str]) -> Tuple[Location, list[Item]]:
+        entities = await self._create_entities(
+            backstory=backstory,
+            scene=[
+                "You are looking about a new location you have discovered, and the items lying there.",
+                f"These are the surrounding locations in a dictionary.  Please make the new location consistent with it's known (charted) surrounds: \n{exits}",
+                f"The following location names are already taken: {list(map(lambda x: x.name, locations.values()))}"
+            ],
+            kinds=["Location"] + item_types
+        )
+        location_json, item_entities = entities[0], entities[1:]
+
+        location = Location(**location_json, image=None)
+        _, items = await asyncio.gather(
+            self._fill_image(
+                location, "location", location_json["image_prompt"],
+                scope=self._reuse_scope(backstory, "Location"), reuse=False
+            ),
+            self._create_items_from_entities(backstory, item_entities)
+        )
+
+        return location, items
+
+    async def create_region(self, backstory: str, tiles: list[Tuple[int, int]], charted: dict[Tuple[int, int], Location], taken_names: list[str], item_types: dict[Tuple[int, int], str]) -> dict[Tuple[int, int], Tuple[Location, str]]:
+        """
+        Generates the locations at several adjacent tiles, and the items lying there, with a single chat
+        completion, so that neighbouring locations fit together.  Returns each location (with it's items) and
+        it's image prompt.  Images are NOT generated here, see create_location_images.
+        """
+        item_tiles = [tile for tile in tiles if tile in item_types]
+        charted_surrounds = {f"{x},{y}": f"{location.name}: {location.description}" for (x, y), location in charted.items()}
+        scene = [
+            "You are charting a region of adjacent locations that have just been discovered, on a grid where x increases to the east and y to the north.  Neighbouring locations should fit together, as parts of the same area.",
+            f"These are the locations already charted in and around the region, by their x,y position, in a dictionary.  Please make the new locations consistent with them: \n{charted_surrounds}",
+            f"The following location names are already taken: {taken_names}",
+            f"The locations are at these x,y positions, in order: {[f'{x},{y}' for x, y in tiles]}"
+        ]
+        if item_tiles:
+            scene.append(f"The items lie in the locations at these x,y positions, in order: {[f'{x},{y}' for x, y in item_tiles]}")
+
+        entities = await self._create_entities(
+            backstory=backstory,
+            scene=scene,
+            kinds=["Location"] * len(tiles) + [item_types[tile] for tile in item_tiles]
+        )
+        location_entities, item_entities = entities[:len(tiles)], entities[len(tiles):]
+
+        region = {
+            tile: (Location(**location_json, image=None), location_json["image_prompt"])
+            for tile, location_json in zip(tiles, location_entities)
+        }
+        for tile, item_json in zip(item_tiles, item_entities):
+            region[tile][0].items.append(Item(**item_json, image="").to_typed_item())
+        return region
+
+    async def create_location_images(self, backstory: str, location: Location, image_prompt: str) -> Callable[[], None]:
+        """
+        Generates the images of a location from create_region and of it's items, and returns the change that
+        puts them in place, which is to be made through the world actor once the location is in the world.
+        """
+        entities = [(location, "location", image_prompt, self._reuse_scope(backstory, "Location"), False)] + [
+            (item, "item", item.image_prompt, self._reuse_scope(backstory, item.item_type), True) for item in location.items
+        ]
+        images = await asyncio.gather(
+            *(self._obtain_image(entity, kind, prompt, scope, reuse) for entity, kind, prompt, scope, reuse in entities)
+        )
 
+        def change():
+            # Unless a deferred upgrade got there first.
+            for (entity, *_), image in zip(entities, images):
+                if not entity.image:
+                    entity.image = image
+        return change
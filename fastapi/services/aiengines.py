@@ -2,6 +2,7 @@
 requirements:
 
 pip install huggingface_hub
+pip install aiohttp # for huggingface_hub's AsyncInferenceClient
 pip install Pillow # for HuggingFace image processing
 pip install wonderwords
 
@@ -10,25 +11,27 @@ Create a "Read" token at the HuggingFace website (free)
 """
 import asyncio
 import base64
+import hashlib
 import json
 import random
-
-import importlib, os, sys
+import threading
+import time
 
 from io import BytesIO
-from PIL import Image
 from typing import Protocol, Tuple
 
-# AI providers (and test provider)
-
-from wonderwords import RandomSentence, RandomWord
-from huggingface_hub import InferenceClient 
+# AI providers (and test provider) are imported lazily by the engines that use them,
+# so that importing this module (and starting the server) stays cheap.
 
-local_image_lock = asyncio.Lock()
+from services.display import display
+from services.image_sizes import fit_to_size, native_size
+from services.image_worker import ImageWorker
+from services.scheduler import PriorityLock
 
 class AiChatContext:
     def __init__(self):
         self.messages = []
+        self.entity_kinds: list[str] = []  # set when several entities are requested in one completion.
 
     def add_message(self, role: str, content: str):
         self.messages.append({"role": role, "content": content})
@@ -46,7 +49,13 @@ class AiChatContext:
     def add_assistant_message(self, content: str):
         self.add_message("assistant", content)
 
+    def estimate_tokens(self) -> int:
+        # Roughly 4 characters per token for English text, plus a few tokens of chat template per message.
+        return sum(len(message["content"]) // 4 + 4 for message in self.messages)
+
 # Abstract base class for AI engines.
+# text_to_image must return an image of exactly size (when given), generating at the smallest size the model
+# natively supports that is no smaller (see services/image_sizes.py), and downscaling only if that is bigger.
 class AiEngine(Protocol):
     def chat_completion(self, context: AiChatContext) -> str:
         ...
@@ -62,31 +71,66 @@ class AiEngine(Protocol):
 
 # A fake AI engine for testing the rest of the application without using an actual AI service.
 class AiEngineTest(AiEngine):
-    def chat_completion(self, context: AiChatContext) -> str:
+    def __init__(self, delay_seconds: float = 0.0, tail_probability: float = 0.0, tail_seconds: float = 0.0):
+        # Optional simulated provider latency, with a long tail, for benchmarking.
+        self.delay_seconds = delay_seconds
+        self.tail_probability = tail_probability
+        self.tail_seconds = tail_seconds
+
+    def _latency(self) -> float:
+        delay = self.delay_seconds
+        if random.random() < self.tail_probability:
+            delay += self.tail_seconds
+        return delay
+
+    def _generate_text(self, context: AiChatContext) -> str:
+        from wonderwords import RandomSentence, RandomWord
+
         rnd_word = RandomWord()
         rnd_sentence = RandomSentence()
-        if any("JSON" in msg["content"] for msg in context.messages):
+        if context.entity_kinds:
+            return json.dumps({
+                "entities": [
+                    {
+                        "kind": kind,
+                        "name": rnd_word.word(),
+                        "description": rnd_sentence.sentence(),
+                        "image_prompt": rnd_sentence.sentence()
+                    } for kind in context.entity_kinds
+                ]
+            })
+        elif any("JSON" in msg["content"] for msg in context.messages):
             return json.dumps({
                 "name": rnd_word.word(), 
-                "description": rnd_sentence.sentence()
+                "description": rnd_sentence.sentence(),
+                "image_prompt": rnd_sentence.sentence()
             })
         else:
             # Return some randomnly generated text for testing
             return rnd_sentence.sentence()
 
+    def chat_completion(self, context: AiChatContext) -> str:
+        time.sleep(self._latency())
+        return self._generate_text(context)
+
     async def chat_completion_async(self, context: AiChatContext) -> str:
-            return await asyncio.get_running_loop().run_in_executor(
-                None, lambda: self.chat_completion(context)
-            )
+        # The simulated latency is awaited rather than slept on an executor thread, so it can be cancelled.
+        await asyncio.sleep(self._latency())
+        return await asyncio.get_running_loop().run_in_executor(
+            None, lambda: self._generate_text(context)
+        )
 
-    def text_to_image(self, prompt: str, size: Tuple[int,int]=None) -> str:
-        # Use PIL to generate a 512x512 png with random scribbles.
-        image = Image.new("RGB", (512, 512), color=(255, 255, 255))
+    def _generate_image(self, size: Tuple[int,int] = None) -> str:
+        from PIL import Image
+
+        # Use PIL to generate a png (512x512 unless sized) with random scribbles.
+        width, height = size or (512, 512)
+        image = Image.new("RGB", (width, height), color=(255, 255, 255))
 
-        # Generate random scribbles
-        for _ in range(1000):
-            x = random.randint(0, 511)
-            y = random.randint(0, 511)
+        # Generate random scribbles, as densely as at 512x512.
+        for _ in range(max(1, 1000 * width * height // (512 * 512))):
+            x = random.randint(0, width - 1)
+            y = random.randint(0, height - 1)
             image.putpixel((x, y), (0, 0, 0))
         buffer = BytesIO()
         image.save(buffer, format="PNG")  # PIL compatible.
@@ -96,9 +140,14 @@ class AiEngineTest(AiEngine):
         image_base64 = f"data:image/png;base64,{base64_str}"
         return image_base64
 
+    def text_to_image(self, prompt: str, size: Tuple[int,int]=None) -> str:
+        time.sleep(self._latency())
+        return self._generate_image(size)
+
     async def text_to_image_async(self, prompt, size: Tuple[int,int]=None):
+        await asyncio.sleep(self._latency())
         return await asyncio.get_running_loop().run_in_executor(
-            None, lambda: self.text_to_image(prompt)
+            None, lambda: self._generate_image(size)
         )
 
 # A fake AI engine for testing the rest of the application without using an actual AI service.
@@ -116,17 +165,22 @@ class AiEngineError(AiEngine):
         raise "Fake text to image async error"
     
 class AiEngineHuggingFace(AiEngine):
+    # The smallest size, and the granularity, that hosted diffusion models reliably generate at.
+    MIN_IMAGE_SIZE = 256
+    IMAGE_SIZE_MULTIPLE = 64
+
     def __init__(self, text_model: str, image_model: str, token: str): 
+        from huggingface_hub import InferenceClient, AsyncInferenceClient
+
         self.text_model = text_model
         self.image_model = image_model
         self.token = token
         self.client = InferenceClient(token=token)
+        # The async client's requests are aborted when the awaiting task is cancelled, unlike a blocking
+        # request running on an executor thread.
+        self.async_client = AsyncInferenceClient(token=token)
 
-    def chat_completion(self, context: AiChatContext) -> str:
-
-        response = self.client.chat_completion(
-            context.messages, model=self.text_model)
-
+    def _reply(self, response) -> str:
         if len(response.choices) > 1:
             print("ERROR: Multiple response blocks.")
             exit()
@@ -137,62 +191,157 @@ class AiEngineHuggingFace(AiEngine):
 
         return reply
 
+    def chat_completion(self, context: AiChatContext) -> str:
+
+        response = self.client.chat_completion(
+            context.messages, model=self.text_model)
+
+        return self._reply(response)
+
     async def chat_completion_async(self, context: AiChatContext) -> str:
-        return await asyncio.get_running_loop().run_in_executor(
-            None, lambda: self.chat_completion(context)
-        )
+        response = await self.async_client.chat_completion(
+            context.messages, model=self.text_model)
 
-    def text_to_image(self, prompt: str, size: Tuple[int,int]=None) -> str:
+        return self._reply(response)
+
+    def _image_parameters(self, size: Tuple[int,int]) -> dict:
         if size:
-            image = self.client.text_to_image(
-                prompt, width=size[0], height=size[1], model=self.image_model
-            )
-        else:
-            image = self.client.text_to_image(prompt, model=self.image_model)
+            width, height = native_size(size, self.MIN_IMAGE_SIZE, self.IMAGE_SIZE_MULTIPLE)
+            return {"width": width, "height": height, "model": self.image_model}
+        return {"model": self.image_model}
+
+    def _encode_image(self, image, size: Tuple[int,int] = None) -> str:
+        image = fit_to_size(image, size)
         buffer = BytesIO()
         image.save(buffer, format="PNG")  # PIL compatible.
         base64_str = base64.b64encode(buffer.getvalue()).decode("utf-8")
         image_base64 = f"data:image/png;base64,{base64_str}"
         return image_base64
 
+    def text_to_image(self, prompt: str, size: Tuple[int,int]=None) -> str:
+        image = self.client.text_to_image(prompt, **self._image_parameters(size))
+        return self._encode_image(image, size)
+
     async def text_to_image_async(self, prompt: str, size: Tuple[int,int]=None) -> str:
+        image = await self.async_client.text_to_image(prompt, **self._image_parameters(size))
         return await asyncio.get_running_loop().run_in_executor(
-            None, lambda: self.text_to_image(prompt, size)
+            None, lambda: self._encode_image(image, size)
         )
 
 class AiEngineHuggingFaceWithLocalImageGeneration(AiEngineHuggingFace):
 
-    def __init__(self, text_model: str, image_library: str, token: str):
+    def __init__(self, text_model: str, image_library: str, token: str, shared_memory_mb: int = 64):
         super().__init__(text_model=text_model, image_model=None, token=token)
 
-        module_dir = os.path.dirname(image_library)
-        sys.path.insert(0, module_dir)  # Add image.py's directory to sys.path, allowing it to load it's local sublibraries.
-
-        spec = importlib.util.spec_from_file_location(name="image_module", location=image_library)
-        self.image_module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(self.image_module)
-
-        print(f"Dynamically loaded image model library: {image_library}")
+        # One lock per engine (i.e. per local model), so several configured local GPUs can generate concurrently.
+        # Interactive generation jumps the queue for it, ahead of background work.
+        self.local_image_lock = PriorityLock()
 
-        sys.path.pop(0)  # Clean up after import
+        # The image library runs (and keeps it's model loaded) in a supervised worker process.
+        self.image_worker = ImageWorker(image_library=image_library, shared_memory_mb=shared_memory_mb)
+        self.image_worker.start()  # stopped at exit.
 
     # DarkAgesAI:AiEngine compatible.
-    def text_to_image(self, prompt: str, size: Tuple[int,int]=None) -> str:
+    def text_to_image(self, prompt: str, size: Tuple[int,int]=None, request_id: int = None) -> str:
         
-        image_pil = self.image_module.generate_image(
+        png = self.image_worker.generate(
             prompt=prompt,
-            image_size=size
+            size=size,
+            request_id=request_id
         )
 
-        buffer = BytesIO()
-        image_pil.save(buffer, format="PNG")
-        base64_str = base64.b64encode(buffer.getvalue()).decode("utf-8")
+        base64_str = base64.b64encode(png).decode("utf-8")
         image_base64 = f"data:image/png;base64,{base64_str}"
         return image_base64
     
     async def text_to_image_async(self, prompt: str, size: Tuple[int,int]=None) -> str:
 
-        async with local_image_lock:
-            return await asyncio.get_running_loop().run_in_executor(
-                None, lambda: self.text_to_image(prompt, size)
+        async with self.local_image_lock:
+            request_id = self.image_worker.new_request_id()
+            generation = asyncio.get_running_loop().run_in_executor(
+                None, lambda: self.text_to_image(prompt, size, request_id)
             )
+            try:
+                return await asyncio.shield(generation)
+            except asyncio.CancelledError:
+                # Stop the worker (between diffusion steps, if the library allows) and keep holding the lock
+                # until it has, so the next image does not queue up behind one nobody wants.
+                self.image_worker.cancel(request_id)
+                try:
+                    await asyncio.shield(generation)
+                except Exception:
+                    pass  # ImageGenerationCancelled, most likely.
+                raise
+
+def request_key(call: str, *parts) -> str:
+    # Identifies an AI request by it's content, for recording and replaying sessions.
+    return hashlib.sha1(json.dumps([call, *parts], default=str).encode("utf-8")).hexdigest()
+
+def chat_request_key(context: AiChatContext) -> str:
+    return request_key("chat", context.messages, context.entity_kinds)
+
+def image_request_key(prompt: str, size: Tuple[int,int] = None) -> str:
+    return request_key("image", prompt, size)
+
+# Serves the AI responses recorded in a session trace (see services/tracing.py), for replaying sessions offline.
+class AiEngineReplay(AiEngine):
+    def __init__(self, trace_file: str):
+        self.responses: dict[str, list[str]] = {}
+        with open(trace_file, "r") as file:
+            for line in file:
+                event = json.loads(line)
+                if event["type"] == "ai":
+                    self.responses.setdefault(event["key"], []).append(event["response"])
+
+    def _respond(self, key: str) -> str:
+        # Responses to identical requests are served in the order they were recorded, the last one repeating.
+        responses = self.responses.get(key)
+        if not responses:
+            raise KeyError(f"No recorded response for AI request {key}")
+        return responses.pop(0) if len(responses) > 1 else responses[0]
+
+    def chat_completion(self, context: AiChatContext) -> str:
+        return self._respond(chat_request_key(context))
+
+    async def chat_completion_async(self, context: AiChatContext) -> str:
+        return self.chat_completion(context)
+
+    def text_to_image(self, prompt: str, size: Tuple[int,int] = None) -> str:
+        return self._respond(image_request_key(prompt, size))
+
+    async def text_to_image_async(self, prompt: str, size: Tuple[int,int] = None) -> str:
+        return self.text_to_image(prompt, size)
+
+# Constructs the configured engine on first use (or when warmed up) on an executor thread, so that importing
+# provider libraries and loading model weights does not hold up the server accepting requests.
+class AiEngineLazy(AiEngine):
+    def __init__(self, engine_class: str, parameters: dict):
+        self.engine_class = engine_class
+        self.parameters = parameters
+        self._engine: AiEngine = None
+        self._construction_lock = threading.Lock()
+
+    def _construct(self) -> AiEngine:
+        with self._construction_lock:
+            if self._engine is None:
+                start = time.perf_counter()
+                self._engine = globals()[self.engine_class](**self.parameters)
+                display(f"Constructed {self.engine_class} in {time.perf_counter() - start:.2f}s")
+        return self._engine
+
+    async def warm_up(self) -> AiEngine:
+        if self._engine is None:
+            return await asyncio.get_running_loop().run_in_executor(None, self._construct)
+        return self._engine
+
+    def chat_completion(self, context: AiChatContext) -> str:
+        return self._construct().chat_completion(context)
+
+    async def chat_completion_async(self, context: AiChatContext) -> str:
+        return await (await self.warm_up()).chat_completion_async(context)
+
+    def text_to_image(self, prompt: str, size: Tuple[int,int] = None) -> str:
+        return self._construct().text_to_image(prompt, size)
+
+    async def text_to_image_async(self, prompt: str, size: Tuple[int,int] = None) -> str:
+        return await (await self.warm_up()).text_to_image_async(prompt, size)
@@ -0,0 +1,91 @@
+"""
+requirements:
+
+pip install numpy
+
+"""
+
+import numpy as np
+
+from typing import Any, Optional
+
+from domain.classes import Combatant, Item, Player, Enemy
+
+def unarmed_outcome(player: Player, enemy: Enemy) -> Optional[str]:
+    # What /attack answers, without an exchange of blows, when a side has no weapon; None when both have one.
+    if player.find_weapon() is None:
+        return "NO_PLAYER_WEAPON"
+    if enemy.find_weapon() is None:
+        return "NO_ENEMY_WEAPON"
+    return None
+
+class _Side:
+    # The per blow constants of one combatant, so the simulation never touches the pydantic models.
+    def __init__(self, combatant: Combatant, weapon: Item):
+        self.agility = combatant.agility
+        self.strength = combatant.strength
+        self.defence = combatant.total_defence()
+        self.max_health = combatant.max_health()
+        self.health = combatant.health
+        self.weapon = weapon.damage
+
+class CombatSimulator:
+    """
+    Simulates many complete fights at once, following the same rules as Combatant.attack and the /attack
+    handler: the player strikes first, then the enemy strikes back if it is still standing.  Only fights in
+    which both sides are armed are simulated, see unarmed_outcome.
+    """
+    def __init__(self, max_rounds: int = 500, seed: Optional[int] = None):
+        self.max_rounds = max_rounds
+        self.rng = np.random.default_rng(seed)
+
+    def _blows(self, attacker: _Side, defender: _Side, count: int) -> np.ndarray:
+        # Fraction of the defenders health taken off by each of count blows (0 for a miss).
+        to_hit = attacker.agility - defender.agility + self.rng.integers(0, 21, size=count)
+        low, high, bonus = attacker.weapon
+        damage = self.rng.integers(low, high + 1, size=count) + bonus + attacker.strength - defender.defence
+        return np.where(to_hit > 0, damage / defender.max_health, 0.0)
+
+    #
+    # PUBLIC METHODS
+    #
+
+    def simulate(self, player: Player, enemy: Enemy, fights: int = 10000) -> dict[str, Any]:
+        unarmed = unarmed_outcome(player, enemy)
+        if unarmed is not None:
+            raise ValueError(f"No fight to simulate: {unarmed}")
+        player_side = _Side(player, player.find_weapon())
+        enemy_side = _Side(enemy, enemy.find_weapon())
+
+        player_health = np.full(fights, player_side.health)
+        enemy_health = np.full(fights, enemy_side.health)
+        rounds = np.zeros(fights, dtype=np.int32)
+        outcome = np.zeros(fights, dtype=np.int8)  # 0 unresolved, 1 player won, -1 enemy won
+        active = np.arange(fights)
+
+        for round_number in range(1, self.max_rounds + 1):
+            if active.size == 0:
+                break
+
+            enemy_health[active] -= self._blows(player_side, enemy_side, active.size)
+            enemy_down = enemy_health[active] <= 0
+            outcome[active[enemy_down]] = 1
+            rounds[active[enemy_down]] = round_number
+            active = active[~enemy_down]
+
+            player_health[active] -= self._blows(enemy_side, player_side, active.size)
+            player_down = player_health[active] <= 0
+            outcome[active[player_down]] = -1
+            rounds[active[player_down]] = round_number
+            active = active[~player_down]
+
+        won = outcome == 1
+        lost = outcome == -1
+        return {
+            "fights": fights,
+            "win_probability": float(won.mean()),
+            "loss_probability": float(lost.mean()),
+            "unresolved_probability": float((outcome == 0).mean()),
+            "expected_turns_to_kill_enemy": float(rounds[won].mean()) if won.any() else None,
+            "expected_turns_to_be_killed": float(rounds[lost].mean()) if lost.any() else None
+        }
@@ -17,12 +17,13 @@ class CombatantFactory:
     #
 
     async def create_enemy(self, backstory: str, location: Location) -> Enemy:
-        enemy = await self.ai_object_factory.create_enemy(
+        # One chat completion for both the enemy and it's weapon.
+        enemy, items = await self.ai_object_factory.create_enemy_with_items(
             backstory=backstory,
-            surroundings=location.description
+            surroundings=location.description,
+            item_types=["Weapon"]
         )
-        enemy_weapon = await self.item_factory.create_item_of_type(backstory=backstory, item_type="Weapon")
-        enemy.items.append(enemy_weapon)
+        enemy.items.extend(self.item_factory.subtypify_item(item) for item in items)
         return enemy
 
     async def create_player(self, backstory: str) -> Player:
@@ -2,12 +2,27 @@
 # This is a hand-rolled dependency injection system.
 
 import aiofiles
+import asyncio
 import importlib
 
-from domain.config import Config
+from domain.config import Config, AiEngineConfig
 
-from services.aiengines import AiEngine
+from services.admission import AdmissionController
+from services.aiengines import AiEngine, AiEngineLazy, AiEngineReplay
 from services.ai_object_factory import AiObjectFactory
+from services.event_bus import EventBus
+from services.generation_tracker import GenerationTracker
+from services.engine_pool import AiEnginePool, PoolMember
+from services.hedging import HedgedCaller
+from services.image_reuse import ImageReuseIndex
+from services.image_store import ImageStore
+from services.loop_monitor import LoopLagMonitor
+from services.metrics import Metrics
+from services.profiler import SamplingProfiler
+from services.scheduler import GenerationScheduler
+from services.spare_worlds import SpareWorlds
+from services.structured_log import StructuredLog
+from services.tracing import AiEngineRecording, TraceRecorder
 from services.world_factory import WorldFactory
 from services.location_factory import LocationFactory
 from services.combatant_factory import CombatantFactory
@@ -15,8 +30,23 @@ from services.item_factory import ItemFactory
 
 _config: Config = None
 _ai_engine: AiEngine = None
+_configured_ai_engines: dict[int, AiEngine] = {}
+_secondary_ai_engine: AiEngine = None
+_metrics: Metrics = None
+_structured_log: StructuredLog = None
+_event_bus: EventBus = None
+_loop_monitor: LoopLagMonitor = None
+_profiler: SamplingProfiler = None
+_generation_tracker: GenerationTracker = None
+_hedged_caller: HedgedCaller = None
+_scheduler: GenerationScheduler = None
+_image_reuse: ImageReuseIndex = None
+_image_store: ImageStore = None
+_admission: AdmissionController = None
+_trace_recorder: TraceRecorder = None
 _ai_object_factory: AiObjectFactory = None
 _world_factory: WorldFactory = None
+_spare_worlds: SpareWorlds = None
 _location_factory: LocationFactory = None
 _combatant_factory: CombatantFactory = None
 _item_factory: ItemFactory = None
@@ -29,35 +59,237 @@ async def get_config() -> Config:
             _config = Config.model_validate_json(config_data)
     return _config
 
+async def _create_ai_engine(engine_config: AiEngineConfig) -> AiEngine:
+    # Check the AiEngine provider exists; it is not actually constructed until it is used or warmed up.
+    aiengines_module = importlib.import_module("services.aiengines")
+    getattr(aiengines_module, engine_config.engine_class)
+
+    if engine_config.token_file:
+        # Read the token from the file specified in the config, and add the token value to the parameters.
+        async with aiofiles.open(engine_config.token_file, "r") as file:
+            token_value = await file.read()
+        parameters = engine_config.properties | {"token": token_value}
+    else:
+        parameters = engine_config.properties | {}
+    return AiEngineLazy(engine_class=engine_config.engine_class, parameters=parameters)
+
+async def _get_configured_ai_engine(index: int) -> AiEngine:
+    # Each configured engine is only ever constructed once, even when it is shared between pools.
+    if index not in _configured_ai_engines:
+        config = await get_config()
+        _configured_ai_engines[index] = await _create_ai_engine(config.aiengines[index])
+    return _configured_ai_engines[index]
+
+async def _create_pool_members(indexes: list[int]) -> list[PoolMember]:
+    config = await get_config()
+    return [
+        PoolMember(
+            name=f"{index}:{config.aiengines[index].engine_class}",
+            engine=await _get_configured_ai_engine(index),
+            weight=config.aiengines[index].weight
+        ) for index in indexes
+    ]
+
+async def warm_up_ai_engines():
+    # get dependencies
+    await get_ai_engine()
+    await get_secondary_ai_engine()
+
+    await asyncio.gather(*(engine.warm_up() for engine in _configured_ai_engines.values()))
+
 async def get_ai_engine() -> AiEngine:
     global _ai_engine
     if not _ai_engine:
         # get dependencies
         config = await get_config()
 
-        # Get the constructor for the AiEngine provider.
-        engine_config = config.aiengines[config.chosen_aiengine]
-        aiengines_module = importlib.import_module("services.aiengines")
-        constructor = getattr(aiengines_module, engine_config.engine_class)
-
-        if engine_config.token_file:
-            # Read the token from the file specified in the config, and add the token value to the parameters.
-            async with aiofiles.open(engine_config.token_file, "r") as file:
-                token_value = await file.read()
-            parameters = engine_config.properties | {"token": token_value}
+        if config.trace.replay_file:
+            _ai_engine = AiEngineReplay(trace_file=config.trace.replay_file)
+        elif config.engine_pool:
+            metrics = await get_metrics()
+            _ai_engine = AiEnginePool(
+                text_members=await _create_pool_members(config.engine_pool.text_aiengines),
+                image_members=await _create_pool_members(config.engine_pool.image_aiengines),
+                config=config.engine_pool,
+                metrics=metrics
+            )
         else:
-            parameters = engine_config.properties | {}
-        _ai_engine = constructor(**parameters)
+            _ai_engine = await _get_configured_ai_engine(config.chosen_aiengine)
+
+        if config.trace.record_file:
+            _ai_engine = AiEngineRecording(engine=_ai_engine, recorder=await get_trace_recorder())
     return _ai_engine
 
+async def get_trace_recorder() -> TraceRecorder:
+    global _trace_recorder
+    if not _trace_recorder:
+        # get dependencies
+        config = await get_config()
+
+        if config.trace.record_file:
+            _trace_recorder = TraceRecorder(trace_file=config.trace.record_file)
+    return _trace_recorder
+
+async def get_secondary_ai_engine() -> AiEngine:
+    global _secondary_ai_engine
+    if not _secondary_ai_engine:
+        # get dependencies
+        config = await get_config()
+
+        secondary = config.hedging.secondary_aiengine
+        if secondary is None or config.trace.replay_file:
+            # Hedge against the chosen engine (or pool, which will route the duplicate to the least busy member).
+            _secondary_ai_engine = await get_ai_engine()
+        else:
+            _secondary_ai_engine = await _get_configured_ai_engine(secondary)
+            if config.trace.record_file:
+                _secondary_ai_engine = AiEngineRecording(engine=_secondary_ai_engine, recorder=await get_trace_recorder())
+    return _secondary_ai_engine
+
+async def get_structured_log() -> StructuredLog:
+    global _structured_log
+    if not _structured_log:
+        # get dependencies
+        config = await get_config()
+
+        _structured_log = StructuredLog(config=config.logging)
+    return _structured_log
+
+async def get_metrics() -> Metrics:
+    global _metrics
+    if not _metrics:
+        _metrics = Metrics()
+    return _metrics
+
+async def get_loop_monitor() -> LoopLagMonitor:
+    global _loop_monitor
+    if not _loop_monitor:
+        # get dependencies
+        config = await get_config()
+        metrics = await get_metrics()
+
+        _loop_monitor = LoopLagMonitor(
+            config=config.loop_monitor,
+            metrics=metrics
+        )
+    return _loop_monitor
+
+async def get_profiler() -> SamplingProfiler:
+    global _profiler
+    if not _profiler:
+        _profiler = SamplingProfiler()
+    return _profiler
+
+async def get_event_bus() -> EventBus:
+    global _event_bus
+    if not _event_bus:
+        _event_bus = EventBus()
+    return _event_bus
+
+async def get_generation_tracker() -> GenerationTracker:
+    global _generation_tracker
+    if not _generation_tracker:
+        # get dependencies
+        metrics = await get_metrics()
+
+        _generation_tracker = GenerationTracker(
+            metrics=metrics
+        )
+    return _generation_tracker
+
+async def get_hedged_caller() -> HedgedCaller:
+    global _hedged_caller
+    if not _hedged_caller:
+        # get dependencies
+        config = await get_config()
+        ai_engine = await get_ai_engine()
+        secondary_ai_engine = await get_secondary_ai_engine()
+        metrics = await get_metrics()
+
+        _hedged_caller = HedgedCaller(
+            primary=ai_engine,
+            secondary=secondary_ai_engine,
+            config=config.hedging,
+            metrics=metrics
+        )
+    return _hedged_caller
+
+async def get_scheduler() -> GenerationScheduler:
+    global _scheduler
+    if not _scheduler:
+        # get dependencies
+        config = await get_config()
+        metrics = await get_metrics()
+
+        _scheduler = GenerationScheduler(
+            config=config.scheduler,
+            metrics=metrics
+        )
+    return _scheduler
+
+async def get_image_store() -> ImageStore:
+    global _image_store
+    if not _image_store:
+        # get dependencies
+        config = await get_config()
+
+        _image_store = ImageStore(config=config.image_store)
+    return _image_store
+
+async def get_image_reuse() -> ImageReuseIndex:
+    global _image_reuse
+    if not _image_reuse:
+        # get dependencies
+        config = await get_config()
+        metrics = await get_metrics()
+
+        _image_reuse = ImageReuseIndex(
+            config=config.image_reuse,
+            metrics=metrics
+        )
+    return _image_reuse
+
+async def get_admission() -> AdmissionController:
+    global _admission
+    if not _admission:
+        # get dependencies
+        config = await get_config()
+        scheduler = await get_scheduler()
+        metrics = await get_metrics()
+
+        admission_config = config.admission
+        if config.trace.record_file or config.trace.replay_file:
+            # The tier follows wall clock latency and queue depth, so a session replayed under a different load
+            # would take other paths than it was recorded along, and ask for responses that were never recorded.
+            admission_config = admission_config.model_copy(update={"enabled": False})
+
+        _admission = AdmissionController(
+            config=admission_config,
+            scheduler=scheduler,
+            metrics=metrics
+        )
+    return _admission
+
 async def get_ai_object_factory() -> AiObjectFactory:
     global _ai_object_factory
     if not _ai_object_factory:
         # get dependencies
-        ai_engine = await get_ai_engine()
+        hedged_caller = await get_hedged_caller()
+        scheduler = await get_scheduler()
+        image_reuse = await get_image_reuse()
+        metrics = await get_metrics()
+        admission = await get_admission()
+        image_store = await get_image_store()
+        config = await get_config()
 
         _ai_object_factory = AiObjectFactory(
-            ai_engine=ai_engine
+            hedged_caller=hedged_caller,
+            scheduler=scheduler,
+            image_reuse=image_reuse,
+            metrics=metrics,
+            admission=admission,
+            image_sizes=config.image_sizes,
+            image_store=image_store
         )
     return _ai_object_factory
 
@@ -69,14 +301,50 @@ async def get_world_factory() -> WorldFactory:
         ai_object_factory = await get_ai_object_factory()
         combatant_factory = await get_combatant_factory()
         item_factory = await get_item_factory()
+        image_store = await get_image_store()
 
         _world_factory =  WorldFactory(
             ai_object_factory=ai_object_factory,
             combatant_factory=combatant_factory,
             item_factory=item_factory,
+            image_store=image_store,
             config=config
         )
     return _world_factory
+
+async def get_spare_worlds() -> SpareWorlds:
+    global _spare_worlds
+    if not _spare_worlds:
+        # get dependencies
+        config = await get_config()
+        world_factory = await get_world_factory()
+        ai_object_factory = await get_ai_object_factory()
+        item_factory = await get_item_factory()
+        admission = await get_admission()
+        metrics = await get_metrics()
+
+        spare_worlds_config = config.spare_worlds
+        if config.trace.record_file or config.trace.replay_file:
+            # A spare is built from engine responses and dice rolls outside of any session trace.
+            spare_worlds_config = spare_worlds_config.model_copy(update={"enabled": False})
+
+        # Of the spares' own: with an event bus nobody listens to, and changes made straight to the spare.
+        location_factory = LocationFactory(
+            ai_object_factory=ai_object_factory,
+            item_factory=item_factory,
+            event_bus=EventBus(),
+            generation_tracker=GenerationTracker(metrics),
+            regions=config.regions
+        )
+
+        _spare_worlds = SpareWorlds(
+            config=spare_worlds_config,
+            world_factory=world_factory,
+            location_factory=location_factory,
+            admission=admission,
+            metrics=metrics
+        )
+    return _spare_worlds
     
 async def get_location_factory() -> LocationFactory:
     global _location_factory
@@ -84,10 +352,21 @@ async def get_location_factory() -> LocationFactory:
         # get dependencies
         ai_object_factory = await get_ai_object_factory()
         item_factory = await get_item_factory()
+        event_bus = await get_event_bus()
+        generation_tracker = await get_generation_tracker()
+        config = await get_config()
+
+        regions_config = config.regions
+        if config.trace.record_file or config.trace.replay_file:
+            # A prefetch rolls the dice whenever it happens to start, so it would not replay in the same order.
+            regions_config = regions_config.model_copy(update={"prefetch": False})
 
         _location_factory = LocationFactory(
             ai_object_factory=ai_object_factory,
-            item_factory=item_factory
+            item_factory=item_factory,
+            event_bus=event_bus,
+            generation_tracker=generation_tracker,
+            regions=regions_config
         )
     return _location_factory
 
@@ -0,0 +1,90 @@
+"""
+requirements:
+
+pip install wonderwords
+
+"""
+
+from domain import dice
+
+# Fantasy nouns per kind of entity, for the template grammar; anything else is treated as an item.
+NOUNS = {
+    "Location": ["Hollow", "Crypt", "Glade", "Ruins", "Marsh", "Keep", "Barrow", "Shrine", "Causeway", "Warren"],
+    "Enemy": ["Wraith", "Ghoul", "Brigand", "Wolf", "Cultist", "Wyrm", "Revenant", "Bog Hag", "Sellsword"],
+    "Weapon": ["Blade", "Axe", "Mace", "Spear", "Flail"],
+    "Spellbook": ["Grimoire", "Codex", "Tome"],
+    "Money": ["Coins", "Purse", "Hoard"],
+    "Gem": ["Opal", "Garnet", "Shard"],
+    "Armour": ["Hauberk", "Cuirass", "Shield"],
+    "Relic": ["Idol", "Reliquary", "Talisman"],
+    "Potion": ["Draught", "Tincture", "Elixir"],
+    "Item": ["Trinket", "Curio", "Bauble"]
+}
+
+NAME_TEMPLATES = [
+    "The {adjective} {noun}",
+    "{noun} of the {adjective} {word}",
+    "{adjective} {noun}"
+]
+
+DESCRIPTION_TEMPLATES = {
+    "Location": "A {adjective} {noun_lower}, quiet but for the wind.  {sentence}",
+    "Enemy": "A {adjective} {noun_lower} bars your way, watching you closely.  {sentence}",
+    "Item": "A {adjective} {noun_lower}, worn by age and use.  {sentence}"
+}
+
+class ContentTemplates:
+    """
+    Names and descriptions made up locally from a small template grammar (much as AiEngineTest does), for
+    when the engines are too busy to wait for, see services/admission.py.  Generic, but instant.  Every choice
+    is a roll of domain.dice, so templated content replays like the rest of a session.
+    """
+    def __init__(self):
+        self.words: dict[str, list[str]] = {}
+
+    def _load(self):
+        # wonderwords is imported on first use, so importing this module stays cheap.  Only it's word lists are
+        # used, as it picks from them with the shared random module.
+        if not self.words:
+            from wonderwords import RandomWord
+
+            random_word = RandomWord()
+            self.words = {
+                part: sorted(random_word.filter(include_parts_of_speech=[part]))
+                for part in ("adjectives", "nouns", "verbs")
+            }
+
+    def _word(self, part: str) -> str:
+        return dice.choice(self.words[part])
+
+    def _sentence(self) -> str:
+        # e.g. "An old lantern sways."
+        adjective = self._word("adjectives").lower()
+        article = "An" if adjective[0] in "aeiou" else "A"
+        verb = self._word("verbs")
+        verb = verb + "es" if verb.endswith(("s", "sh", "ch", "x", "z", "o")) else verb + "s"
+        return f"{article} {adjective} {self._word('nouns')} {verb}."
+
+    #
+    # PUBLIC METHODS
+    #
+
+    def entity(self, kind: str) -> dict[str, str]:
+        # kind is Location, Enemy or an item type; returns the same fields the engines are asked for.
+        self._load()
+        noun = dice.choice(NOUNS.get(kind, NOUNS["Item"]))
+        name = dice.choice(NAME_TEMPLATES).format(
+            adjective=self._word("adjectives").capitalize(),
+            noun=noun,
+            word=self._word("nouns").capitalize()
+        )
+        description = DESCRIPTION_TEMPLATES.get(kind, DESCRIPTION_TEMPLATES["Item"]).format(
+            adjective=self._word("adjectives").lower(),
+            noun_lower=noun.lower(),
+            sentence=self._sentence()
+        )
+        return {
+            "name": name,
+            "description": description,
+            "image_prompt": f"{name}, {description} Dark fantasy illustration."
+        }
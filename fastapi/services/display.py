@@ -1,4 +1,9 @@
-from typing import Any
+import logging
+import sys
+
+from typing import Any, Optional
+
+from services import structured_log
 
 # ANSI escape codes
 RESET = "\033[0m"
@@ -25,5 +30,14 @@ BG_MAGENTA = "\033[45m"
 BG_CYAN = "\033[46m"
 BG_WHITE = "\033[47m"
         
-def display(message: Any): 
-    print(f"{RESET}\n\n{message}")
+def display(message: Any, event: Optional[str] = None, level: int = logging.INFO):
+    # Logged under the caller's module, once logging has been started (see StructuredLog); printed before that,
+    # and in processes that never start it such as the console game and the image worker.
+    # event names a hot path event, which logging.sample_rates may sample.
+    if structured_log.active is None:
+        print(f"{RESET}\n\n{message}")
+        return
+
+    logger = logging.getLogger(sys._getframe(1).f_globals.get("__name__", "display"))
+    if logger.isEnabledFor(level):
+        logger.log(level, message, extra={"event": event} if event else None)
@@ -0,0 +1,110 @@
+"""
+requirements:
+"""
+
+import random
+import time
+
+from typing import Any, Awaitable, Callable, Tuple, TypeVar
+
+from domain.config import EnginePoolConfig
+from services.aiengines import AiChatContext, AiEngine
+from services.display import display
+from services.metrics import Metrics
+
+T = TypeVar("T")
+
+class PoolMember:
+    def __init__(self, name: str, engine: AiEngine, weight: float):
+        self.name = name
+        self.engine = engine
+        self.weight = weight
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+
+    def is_healthy(self, now: float) -> bool:
+        return self.ejected_until <= now
+
+# Spreads calls over several configured engines, with separate pools for text and image capabilities.
+class AiEnginePool(AiEngine):
+    def __init__(self, text_members: list[PoolMember], image_members: list[PoolMember], config: EnginePoolConfig, metrics: Metrics):
+        self.text_members = text_members
+        self.image_members = image_members
+        self.config = config
+        self.metrics = metrics
+
+    def _choose(self, members: list[PoolMember]) -> PoolMember:
+        now = time.monotonic()
+        # If every member has been ejected, fail open rather than refusing all work.
+        candidates = [member for member in members if member.is_healthy(now)] or members
+
+        if self.config.strategy == "weighted":
+            return random.choices(candidates, weights=[member.weight for member in candidates])[0]
+        else:
+            # Ties are broken randomly so idle members share the load.
+            return min(candidates, key=lambda member: ((member.outstanding + 1) / member.weight, random.random()))
+
+    def _record_failure(self, member: PoolMember, error: Exception):
+        member.consecutive_failures += 1
+        self.metrics.increment(f"engine_failures_{member.name}")
+        if member.consecutive_failures >= self.config.eject_after_failures:
+            member.ejected_until = time.monotonic() + self.config.eject_seconds
+            member.consecutive_failures = 0
+            display(f"Ejected AI engine {member.name} from the pool for {self.config.eject_seconds}s after: {error!r}")
+
+    def _call(self, members: list[PoolMember], request: Callable[[AiEngine], T]) -> T:
+        member = self._choose(members)
+        member.outstanding += 1
+        try:
+            result = request(member.engine)
+        except Exception as error:
+            self._record_failure(member, error)
+            raise
+        finally:
+            member.outstanding -= 1
+        member.consecutive_failures = 0
+        return result
+
+    async def _call_async(self, members: list[PoolMember], request: Callable[[AiEngine], Awaitable[T]]) -> T:
+        member = self._choose(members)
+        member.outstanding += 1
+        self.metrics.increment(f"engine_calls_{member.name}")
+        try:
+            result = await request(member.engine)
+        except Exception as error:
+            self._record_failure(member, error)
+            raise
+        finally:
+            member.outstanding -= 1
+        member.consecutive_failures = 0
+        return result
+
+    #
+    # PUBLIC METHODS
+    #
+
+    def chat_completion(self, context: AiChatContext) -> str:
+        return self._call(self.text_members, lambda engine: engine.chat_completion(context))
+
+    async def chat_completion_async(self, context: AiChatContext) -> str:
+        return await self._call_async(self.text_members, lambda engine: engine.chat_completion_async(context))
+
+    def text_to_image(self, prompt: str, size: Tuple[int,int] = None) -> str:
+        return self._call(self.image_members, lambda engine: engine.text_to_image(prompt, size))
+
+    async def text_to_image_async(self, prompt: str, size: Tuple[int,int] = None) -> str:
+        return await self._call_async(self.image_members, lambda engine: engine.text_to_image_async(prompt, size))
+
+    def report(self) -> dict[str, Any]:
+        now = time.monotonic()
+        return {
+            pool_name: [
+                {
+                    "name": member.name,
+                    "weight": member.weight,
+                    "outstanding": member.outstanding,
+                    "healthy": member.is_healthy(now)
+                } for member in members
+            ] for pool_name, members in (("text", self.text_members), ("image", self.image_members))
+        }
@@ -0,0 +1,47 @@
+"""
+requirements:
+"""
+
+import asyncio
+
+from typing import Any
+
+class EventBus:
+    """
+    Fans game events (location ready, enemy appeared, ...) out to every subscriber, e.g. each open
+    websocket session.  Publishing never waits: a subscriber that falls behind loses its oldest events.
+    """
+    def __init__(self, max_queued: int = 100):
+        self.max_queued = max_queued
+        self.subscribers: set[asyncio.Queue] = set()
+        self.dropped = 0
+
+    #
+    # PUBLIC METHODS
+    #
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.max_queued)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+    def publish(self, event: str, **data: Any):
+        message = {"event": event} | data
+        for queue in self.subscribers:
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(message)
+
+    def report(self) -> dict[str, Any]:
+        return {
+            "subscribers": len(self.subscribers),
+            "dropped": self.dropped
+        }
+
+def diff_state(old: dict[str, Any], new: dict[str, Any]) -> dict[str, Any]:
+    # Only the top level keys whose values changed, so unchanged parts (e.g. an image) are not resent.
+    return {key: value for key, value in new.items() if key not in old or old[key] != value}
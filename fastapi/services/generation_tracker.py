@@ -0,0 +1,79 @@
+"""
+requirements:
+"""
+
+import asyncio
+
+from typing import Any, Awaitable, Callable, Iterable, Tuple, TypeVar
+
+from domain.classes import World
+from services.display import display
+from services.metrics import Metrics
+
+T = TypeVar("T")
+
+class GenerationCancelledError(Exception):
+    """Raised to the callers waiting on generation that was cancelled because it became obsolete."""
+    pass
+
+class GenerationTracker:
+    """
+    Keeps track of the generation in progress for each world and position (a location, an enemy), so that it
+    can be cancelled once nobody will see it: when the player moves on, or the world is replaced.  Cancelling
+    the task cancels everything it awaits, down to the engine requests.
+
+    Concurrent requests for the same generation share one task.
+    """
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+        self._tasks: dict[Tuple[int, Tuple[int, int], str], Tuple[World, asyncio.Task]] = {}
+        self._covers: dict[Tuple[int, Tuple[int, int], str], frozenset[Tuple[int, int]]] = {}
+
+    def _forget(self, key: Tuple[int, Tuple[int, int], str], task: asyncio.Task):
+        if key in self._tasks and self._tasks[key][1] is task:
+            del self._tasks[key]
+            del self._covers[key]
+
+    def _cancel(self, keys: list[Tuple[int, Tuple[int, int], str]], reason: str):
+        for key in keys:
+            _, task = self._tasks.pop(key)
+            del self._covers[key]
+            if not task.done():
+                task.cancel()
+                self.metrics.increment(f"generation_cancelled_{key[2]}")
+                display(f"Cancelled generation of {key[2]} at {key[1]}: {reason}")
+
+    #
+    # PUBLIC METHODS
+    #
+
+    async def run(self, world: World, position: Tuple[int, int], kind: str, generate: Callable[[], Awaitable[T]], covers: Iterable[Tuple[int, int]] = ()) -> T:
+        # covers are further positions the generation is for (e.g. the rest of a region), and stays needed at.
+        key = (id(world), position, kind)
+        if key in self._tasks:
+            task = self._tasks[key][1]
+        else:
+            task = asyncio.ensure_future(generate())
+            self._tasks[key] = (world, task)
+            self._covers[key] = frozenset(covers) | {position}
+            task.add_done_callback(lambda done: self._forget(key, done))
+
+        try:
+            # Shielded, so one caller giving up does not cancel generation others may be waiting on.
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled() and not asyncio.current_task().cancelling():
+                raise GenerationCancelledError(f"Generation of {kind} at {position} is obsolete.")
+            raise
+
+    def cancel_elsewhere(self, world: World, position: Tuple[int, int]):
+        # The player has moved to position, so nothing elsewhere in the world is needed now.
+        keys = [key for key in self._tasks if key[0] == id(world) and position not in self._covers[key]]
+        self._cancel(keys, "the player moved on")
+
+    def cancel_world(self, world: World):
+        keys = [key for key in self._tasks if key[0] == id(world)]
+        self._cancel(keys, "the world was replaced")
+
+    def report(self) -> dict[str, Any]:
+        return {"in_progress": len(self._tasks)}
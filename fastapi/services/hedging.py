@@ -0,0 +1,138 @@
+"""
+requirements:
+"""
+
+import asyncio
+import time
+
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from domain.config import HedgingConfig
+from services.aiengines import AiEngine
+from services.metrics import Metrics
+from services.scheduler import current_queue_listener
+
+T = TypeVar("T")
+
+class _WorkClock:
+    """
+    The time a request has been worked on, leaving out the time it has spent queued on a local lock (e.g. for
+    the one local image model), which says nothing about how slow the engine is.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queued_seconds = 0.0
+        self.queued_since: Optional[float] = None
+        self.working = asyncio.Event()
+        self.working.set()
+
+    def listen(self, queued: bool):
+        if queued:
+            self.queued_since = time.perf_counter()
+            self.working.clear()
+        elif self.queued_since is not None:
+            self.queued_seconds += time.perf_counter() - self.queued_since
+            self.queued_since = None
+            self.working.set()
+
+    def elapsed(self) -> float:
+        queued = self.queued_seconds + (time.perf_counter() - self.queued_since if self.queued_since is not None else 0.0)
+        return time.perf_counter() - self.start - queued
+
+class HedgedCaller:
+    """
+    Runs AI engine calls with a per entity kind deadline.  When a call takes longer than the configured
+    percentile of recent latencies for that kind, a duplicate (hedged) request is sent to the secondary
+    engine (or the same engine if there is none) and whichever answers first wins.  The loser is cancelled.
+
+    Time spent queued on an engine's local lock counts towards neither the deadline nor the hedge delay, and
+    images are not hedged against the same engine, where the duplicate would only queue behind the original.
+    """
+    def __init__(self, primary: AiEngine, secondary: AiEngine, config: HedgingConfig, metrics: Metrics):
+        self.primary = primary
+        self.secondary = secondary or primary
+        self.config = config
+        self.metrics = metrics
+
+    def _deadline(self, kind: str) -> float:
+        return self.config.deadline_seconds.get(kind, self.config.default_deadline_seconds)
+
+    def _hedge_delay(self, kind: str) -> float:
+        stats = self.metrics.latency(f"ai_{kind}")
+        if len(stats.samples) < self.config.min_samples:
+            return self.config.initial_hedge_seconds
+        return stats.percentile(self.config.hedge_percentile)
+
+    def _hedges(self, kind: str) -> bool:
+        if not self.config.enabled:
+            return False
+        return self.secondary is not self.primary or not kind.endswith("_image") or self.config.hedge_images_on_same_engine
+
+    def _send(self, engine: AiEngine, request: Callable[[AiEngine], Awaitable[T]], clock: Optional[_WorkClock] = None) -> asyncio.Future:
+        async def send() -> T:
+            # Only in this task's context, so each request is timed on it's own.
+            current_queue_listener.set(clock.listen if clock else None)
+            return await request(engine)
+        return asyncio.ensure_future(send())
+
+    async def _wait(self, tasks: set[asyncio.Future], clock: _WorkClock, seconds: float) -> set[asyncio.Future]:
+        # The tasks done once any is, or none if clock reaches seconds of work first.
+        while True:
+            if not clock.working.is_set():
+                working = asyncio.ensure_future(clock.working.wait())
+                try:
+                    done, _ = await asyncio.wait(tasks | {working}, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    working.cancel()
+                done.discard(working)
+            else:
+                remaining = seconds - clock.elapsed()
+                if remaining <= 0:
+                    return set()
+                done, _ = await asyncio.wait(tasks, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            if done:
+                return done
+
+    async def _race(self, kind: str, request: Callable[[AiEngine], Awaitable[T]], clock: _WorkClock) -> T:
+        deadline = self._deadline(kind)
+        primary = self._send(self.primary, request, clock)
+        tasks = [primary]
+        try:
+            if self._hedges(kind):
+                await self._wait({primary}, clock, min(deadline, self._hedge_delay(kind)))
+                if primary.done() and primary.exception() is None:
+                    return primary.result()
+
+                # The primary is slow (or has failed), so send a duplicate request and take whichever answers first.
+                tasks.append(self._send(self.secondary, request))
+                self.metrics.increment(f"hedge_sent_{kind}")
+
+            pending = {task for task in tasks if not task.done()}
+            while pending:
+                done = await self._wait(pending, clock, deadline)
+                if not done:
+                    break
+                pending -= done
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.metrics.increment(f"hedge_won_{kind}")
+                        return task.result()
+
+            if all(task.done() for task in tasks):
+                raise tasks[-1].exception()
+            raise TimeoutError(f"AI call for {kind} exceeded it's deadline of {deadline}s")
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    #
+    # PUBLIC METHODS
+    #
+
+    async def call(self, kind: str, request: Callable[[AiEngine], Awaitable[T]]) -> T:
+        clock = _WorkClock()
+        result = await self._race(kind, request, clock)
+        self.metrics.latency(f"ai_{kind}").record(clock.elapsed())
+        return result
@@ -0,0 +1,134 @@
+"""
+requirements:
+"""
+
+import hashlib
+import re
+
+from typing import Optional
+
+from domain.config import ImageReuseConfig
+from services.metrics import Metrics
+
+SHINGLE_SIZE = 5  # characters
+NUM_HASHES = 64
+BANDS = 16  # of NUM_HASHES // BANDS rows each, for locality sensitive hashing.
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 64) - 1
+
+def _seeded_coefficients(seed: str) -> list[int]:
+    return [
+        int.from_bytes(hashlib.blake2b(f"{seed}{index}".encode("utf-8"), digest_size=8).digest(), "little") % _PRIME
+        for index in range(NUM_HASHES)
+    ]
+
+_A = [max(1, a) for a in _seeded_coefficients("a")]
+_B = _seeded_coefficients("b")
+
+def _shingles(prompt: str) -> set[int]:
+    text = " ".join(re.findall(r"[a-z0-9]+", prompt.lower()))
+    if len(text) <= SHINGLE_SIZE:
+        pieces = {text}
+    else:
+        pieces = {text[index:index + SHINGLE_SIZE] for index in range(len(text) - SHINGLE_SIZE + 1)}
+    return {
+        int.from_bytes(hashlib.blake2b(piece.encode("utf-8"), digest_size=8).digest(), "little")
+        for piece in pieces
+    }
+
+def minhash(prompt: str) -> tuple[int, ...]:
+    shingles = _shingles(prompt)
+    return tuple(
+        min(((a * shingle + b) % _PRIME for shingle in shingles), default=_MAX_HASH)
+        for a, b in zip(_A, _B)
+    )
+
+class _Entry:
+    __slots__ = ("signature", "image")
+
+    def __init__(self, signature: tuple[int, ...], image: str):
+        self.signature = signature
+        self.image = image
+
+class ImageReuseIndex:
+    """
+    Remembers the image prompts generated so far (MinHash signatures of their character shingles, bucketed
+    with LSH) per scope, i.e. per world and item type, so that a near duplicate prompt can reuse the existing
+    image instead of generating a new one.
+    """
+    def __init__(self, config: ImageReuseConfig, metrics: Metrics):
+        self.config = config
+        self.metrics = metrics
+        self.buckets: dict[str, dict[tuple, list[_Entry]]] = {}
+        self.latest: dict[str, _Entry] = {}
+
+    def _bands(self, signature: tuple[int, ...]) -> list[tuple]:
+        rows = NUM_HASHES // BANDS
+        return [(band,) + signature[band * rows:(band + 1) * rows] for band in range(BANDS)]
+
+    #
+    # PUBLIC METHODS
+    #
+
+    def find(self, scope: str, prompt: str, kind: str) -> Optional[str]:
+        if not self.config.enabled:
+            return None
+
+        signature = minhash(prompt)
+        scope_buckets = self.buckets.get(scope, {})
+        best, best_similarity = None, 0.0
+        for band in self._bands(signature):
+            for entry in scope_buckets.get(band, []):
+                similarity = sum(x == y for x, y in zip(signature, entry.signature)) / NUM_HASHES
+                if similarity > best_similarity:
+                    best, best_similarity = entry, similarity
+
+        if best is None or best_similarity < self.config.threshold:
+            self.metrics.increment("image_reuse_misses")
+            return None
+
+        # Credit the time a fresh image of this kind typically takes.
+        saved_seconds = self.metrics.latency(f"ai_{kind}_image").percentile(50)
+        self.metrics.increment("image_reuse_hits")
+        self.metrics.increment("image_reuse_saved_ms", int(saved_seconds * 1000))
+        return best.image
+
+    def find_pooled(self, scope: str, prompt: str) -> Optional[str]:
+        """
+        The closest existing image however dissimilar, or failing that the latest one in scope; a stand in for
+        when there is no capacity to generate the real one (see services/admission.py).
+        """
+        if not self.config.enabled:
+            return None
+
+        signature = minhash(prompt)
+        scope_buckets = self.buckets.get(scope, {})
+        best, best_similarity = self.latest.get(scope), 0.0
+        for band in self._bands(signature):
+            for entry in scope_buckets.get(band, []):
+                similarity = sum(x == y for x, y in zip(signature, entry.signature)) / NUM_HASHES
+                if similarity > best_similarity:
+                    best, best_similarity = entry, similarity
+
+        if best is None:
+            return None
+        self.metrics.increment("image_pooled")
+        return best.image
+
+    def add(self, scope: str, prompt: str, image: str):
+        if not self.config.enabled:
+            return
+
+        entry = _Entry(minhash(prompt), image)
+        self.latest[scope] = entry
+        scope_buckets = self.buckets.setdefault(scope, {})
+        for band in self._bands(entry.signature):
+            scope_buckets.setdefault(band, []).append(entry)
+
+    def report(self) -> dict[str, float]:
+        hits = self.metrics.counters.get("image_reuse_hits", 0)
+        misses = self.metrics.counters.get("image_reuse_misses", 0)
+        return {
+            "reuse_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "saved_seconds": self.metrics.counters.get("image_reuse_saved_ms", 0) / 1000
+        }
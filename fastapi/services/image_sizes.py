@@ -0,0 +1,36 @@
+"""
+requirements:
+
+pip install Pillow
+
+"""
+
+from typing import Tuple
+
+def native_size(size: Tuple[int,int], min_side: int, multiple: int) -> Tuple[int,int]:
+    # The smallest size a model can generate natively that is no smaller than size.
+    def fit(side: int) -> int:
+        side = max(side, min_side)
+        return -(-side // multiple) * multiple
+    return fit(size[0]), fit(size[1])
+
+def fit_to_size(image, size: Tuple[int,int]):
+    # Downscales a PIL image generated larger than was asked for (because the model could not go that small).
+    if size is None or tuple(image.size) == tuple(size):
+        return image
+
+    from PIL import Image
+
+    return image.resize(tuple(size), Image.LANCZOS)
+
+def downscale_data_url(image: str, size: Tuple[int,int]) -> str:
+    # A base64 data URL image (as the engines return them) at size, as a PNG data URL.
+    import base64
+    from io import BytesIO
+    from PIL import Image
+
+    header, data = image.split(",", 1)
+    picture = fit_to_size(Image.open(BytesIO(base64.b64decode(data))), size)
+    buffer = BytesIO()
+    picture.save(buffer, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode("utf-8")
@@ -0,0 +1,164 @@
+"""
+requirements:
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+from domain.config import ImageStoreConfig
+from services.image_sizes import downscale_data_url
+
+REFERENCE_PREFIX = "stored:"
+REFERENCE_PATTERN = re.compile(REFERENCE_PREFIX + "[0-9a-f]{20}")
+
+class ImageStore:
+    """
+    Keeps images (base64 data URLs of a few hundred KB each) out of the world: they are written to disk once,
+    by content hash, and entities hold a short reference instead, so memory no longer grows with every image
+    explored, nor is every image rewritten with each save.  References are resolved back to the images only at
+    the response boundary, through a bounded cache of the recently used ones.
+    """
+    def __init__(self, config: ImageStoreConfig):
+        self.config = config
+        self._cache: OrderedDict[str, str] = OrderedDict()
+        self._cached_bytes = 0
+        self._lock = threading.Lock()  # images are stored from executor threads.
+        self.misses = 0
+        if config.enabled:
+            os.makedirs(config.directory, exist_ok=True)
+
+    def _path(self, reference: str) -> str:
+        return os.path.join(self.config.directory, reference[len(REFERENCE_PREFIX):])
+
+    def _remember(self, reference: str, image: str):
+        with self._lock:
+            if reference in self._cache:
+                self._cache.move_to_end(reference)
+                return
+            self._cache[reference] = image
+            self._cached_bytes += len(image)
+            while self._cached_bytes > self.config.cache_mb * 1024 * 1024 and len(self._cache) > 1:
+                _, evicted = self._cache.popitem(last=False)
+                self._cached_bytes -= len(evicted)
+
+    #
+    # PUBLIC METHODS
+    #
+
+    @staticmethod
+    def is_reference(image: Optional[str]) -> bool:
+        return bool(image) and image.startswith(REFERENCE_PREFIX)
+
+    def put(self, image: Optional[str]) -> Optional[str]:
+        # Returns the reference to hold instead of the image.  Blocking (it writes the file), and idempotent.
+        if not self.config.enabled or not image or self.is_reference(image):
+            return image
+
+        reference = REFERENCE_PREFIX + hashlib.sha1(image.encode("utf-8")).hexdigest()[:20]
+        path = self._path(reference)
+        if not os.path.exists(path):
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temp_path, "w") as file:
+                file.write(image)
+            os.replace(temp_path, path)
+        self._remember(reference, image)
+        return reference
+
+    def _cached(self, reference: str) -> Optional[str]:
+        with self._lock:
+            cached = self._cache.get(reference)
+            if cached is not None:
+                self._cache.move_to_end(reference)
+            return cached
+
+    def _read(self, reference: str) -> Optional[str]:
+        # Blocking.
+        self.misses += 1
+        try:
+            with open(self._path(reference), "r") as file:
+                image = file.read()
+        except FileNotFoundError:
+            return None
+        self._remember(reference, image)
+        return image
+
+    async def resolve_many(self, images: list[Optional[str]]) -> list[Optional[str]]:
+        # The images the references stand for; anything else (an inline image, "" or None) as it is.  Those that
+        # are not cached are read together, off the event loop.
+        resolved = [self._cached(image) if self.is_reference(image) else image for image in images]
+        missing = [index for index, image in enumerate(images) if self.is_reference(image) and resolved[index] is None]
+        if missing:
+            read = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: [self._read(images[index]) for index in missing]
+            )
+            for index, image in zip(missing, read):
+                resolved[index] = image
+        return resolved
+
+    async def resolve(self, image: Optional[str]) -> Optional[str]:
+        return (await self.resolve_many([image]))[0]
+
+    def _read_thumbnail(self, reference: str, size: Tuple[int, int]) -> Optional[str]:
+        # Blocking.  Made from the image the first time, and kept next to it.
+        path = f"{self._path(reference)}.{size[0]}x{size[1]}"
+        try:
+            with open(path, "r") as file:
+                thumbnail = file.read()
+        except FileNotFoundError:
+            image = self._cached(reference) or self._read(reference)
+            if image is None:
+                return None
+            thumbnail = downscale_data_url(image, size)
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temp_path, "w") as file:
+                file.write(thumbnail)
+            os.replace(temp_path, path)
+        self._remember(f"{reference}@{size[0]}x{size[1]}", thumbnail)
+        return thumbnail
+
+    async def resolve_thumbnail(self, image: Optional[str], size: Tuple[int, int]) -> Optional[str]:
+        # The image downscaled to size, e.g. for the tiles of the map.
+        if not image:
+            return image
+        if not self.is_reference(image):
+            return await asyncio.get_running_loop().run_in_executor(None, downscale_data_url, image, size)
+        cached = self._cached(f"{image}@{size[0]}x{size[1]}")
+        if cached is not None:
+            return cached
+        return await asyncio.get_running_loop().run_in_executor(None, self._read_thumbnail, image, size)
+
+    def collect(self, referenced: set[str]) -> int:
+        # Removes the images (and their thumbnails) not referenced, once they are keep_unreferenced_seconds old.
+        # Blocking.  Returns how many files were removed.
+        if not self.config.enabled:
+            return 0
+        removed = 0
+        cutoff = time.time() - self.config.keep_unreferenced_seconds
+        with os.scandir(self.config.directory) as entries:
+            for entry in entries:
+                reference = REFERENCE_PREFIX + entry.name.split(".")[0]
+                if reference in referenced or not entry.is_file() or entry.stat().st_mtime > cutoff:
+                    continue
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+                removed += 1
+                with self._lock:
+                    for key in [key for key in self._cache if key.startswith(reference)]:
+                        self._cached_bytes -= len(self._cache.pop(key))
+        return removed
+
+    def report(self) -> dict[str, Any]:
+        return {
+            "cached": len(self._cache),
+            "cached_mb": self._cached_bytes / (1024 * 1024),
+            "misses": self.misses
+        }
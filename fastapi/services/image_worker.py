@@ -0,0 +1,197 @@
+"""
+requirements:
+"""
+
+import atexit
+import importlib.util, os, sys
+import inspect
+import multiprocessing
+import queue
+import threading
+import time
+
+from io import BytesIO
+from multiprocessing import shared_memory
+from typing import Tuple
+
+from services.display import display
+from services.image_sizes import fit_to_size, native_size
+
+def _load_image_module(image_library: str):
+    module_dir = os.path.dirname(image_library)
+    sys.path.insert(0, module_dir)  # Add image.py's directory to sys.path, allowing it to load it's local sublibraries.
+
+    spec = importlib.util.spec_from_file_location(name="image_module", location=image_library)
+    image_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(image_module)
+
+    print(f"Dynamically loaded image model library: {image_library}")
+
+    sys.path.pop(0)  # Clean up after import
+    return image_module
+
+class ImageGenerationCancelled(Exception):
+    pass
+
+def _worker_main(image_library: str, shared_memory_name: str, requests: multiprocessing.Queue, results: multiprocessing.Queue, cancelled_id: multiprocessing.Value):
+    # Runs in the worker process, keeping the model resident between requests.
+    image_module = _load_image_module(image_library)
+    accepts_is_cancelled = "is_cancelled" in inspect.signature(image_module.generate_image).parameters
+    # A library can declare the smallest size, and the granularity, it generates at.
+    min_image_size = getattr(image_module, "MIN_IMAGE_SIZE", 256)
+    image_size_multiple = getattr(image_module, "IMAGE_SIZE_MULTIPLE", 64)
+    buffer = shared_memory.SharedMemory(name=shared_memory_name)
+    results.put(("ready", None, None))
+
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+
+        request_id, prompt, size = request
+        is_cancelled = lambda: cancelled_id.value == request_id
+        if is_cancelled():
+            results.put((request_id, "cancelled", None))
+            continue
+        try:
+            arguments = {"is_cancelled": is_cancelled} if accepts_is_cancelled else {}
+            image_pil = image_module.generate_image(
+                prompt=prompt,
+                image_size=native_size(size, min_image_size, image_size_multiple) if size else None,
+                **arguments
+            )
+            image_pil = fit_to_size(image_pil, size)  # here, to keep the resampling out of the server process.
+            if is_cancelled():
+                results.put((request_id, "cancelled", None))
+                continue
+            png = BytesIO()
+            image_pil.save(png, format="PNG")
+            data = png.getbuffer()
+
+            if len(data) <= buffer.size:
+                buffer.buf[:len(data)] = data
+                results.put((request_id, "shared_memory", len(data)))
+            else:
+                results.put((request_id, "bytes", bytes(data)))
+        except Exception as error:
+            if is_cancelled():
+                results.put((request_id, "cancelled", None))
+            else:
+                results.put((request_id, "error", repr(error)))
+
+    buffer.close()
+
+class ImageWorker:
+    """
+    Supervises a worker process that runs a local image library, so that model pre and post processing and
+    PNG encoding do not hold the GIL in the server process, and a crash or OOM in the model does not take the
+    server down.  Requests go over a queue, and the encoded image comes back through shared memory.
+    The worker is restarted automatically if it dies.
+
+    Requests are expected one at a time (the engine holds it's local image lock around generate()).
+
+    A request can be cancelled from another thread.  If the library's generate_image() takes an is_cancelled
+    callable, it can poll it to stop between diffusion steps (e.g. by setting pipe._interrupt from a diffusers
+    callback_on_step_end); otherwise the image is still generated, but not encoded or returned.
+    """
+    def __init__(self, image_library: str, shared_memory_mb: int = 64, start_timeout_seconds: float = 600):
+        self.image_library = image_library
+        self.start_timeout_seconds = start_timeout_seconds
+        self.context = multiprocessing.get_context("spawn")
+        self.buffer = shared_memory.SharedMemory(create=True, size=shared_memory_mb * 1024 * 1024)
+        self.cancelled_id = self.context.Value("q", -1)
+        self.process = None
+        self.restarts = 0
+        self.stopped = False
+        self._request_ids = iter(range(sys.maxsize))
+        self._start_lock = threading.Lock()
+        # The shared memory outlives the process unless unlinked, so stop at exit if nobody has by then.
+        atexit.register(self.stop)
+
+    def _start(self):
+        self.requests = self.context.Queue()
+        self.results = self.context.Queue()
+        self.process = self.context.Process(
+            target=_worker_main,
+            args=(self.image_library, self.buffer.name, self.requests, self.results, self.cancelled_id),
+            daemon=True
+        )
+        self.process.start()
+
+        status, _, _ = self._wait_for_result(self.start_timeout_seconds)
+        if status != "ready":
+            raise RuntimeError(f"Image worker did not start: {status}")
+        display(f"Image worker process {self.process.pid} ready for {self.image_library}")
+
+    def _ensure_running(self):
+        with self._start_lock:
+            if self.stopped:
+                raise RuntimeError("Image worker has been stopped.")
+            if self.process is None:
+                self._start()
+            elif not self.process.is_alive():
+                self.restarts += 1
+                display(f"Image worker exited with code {self.process.exitcode}; restarting (restart #{self.restarts}).")
+                self._start()
+
+    def _wait_for_result(self, timeout_seconds: float) -> Tuple:
+        deadline = time.monotonic() + timeout_seconds
+        while time.monotonic() < deadline:
+            try:
+                return self.results.get(timeout=1.0)
+            except queue.Empty:
+                if not self.process.is_alive():
+                    raise RuntimeError(f"Image worker died with exit code {self.process.exitcode}")
+        raise TimeoutError("Image worker did not answer in time.")
+
+    #
+    # PUBLIC METHODS
+    #
+
+    def start(self):
+        self._ensure_running()
+
+    def new_request_id(self) -> int:
+        return next(self._request_ids)
+
+    def generate(self, prompt: str, size: Tuple[int,int] = None, timeout_seconds: float = 600, request_id: int = None) -> bytes:
+        """Blocking; returns the generated image as PNG bytes, or raises ImageGenerationCancelled."""
+        self._ensure_running()
+
+        request_id = self.new_request_id() if request_id is None else request_id
+        self.requests.put((request_id, prompt, size))
+        while True:
+            try:
+                result_id, kind, payload = self._wait_for_result(timeout_seconds)
+            except RuntimeError:
+                # The worker crashed mid request, so bring it back for the next one.
+                self._ensure_running()
+                raise
+            if result_id == request_id:
+                break
+
+        if kind == "shared_memory":
+            return bytes(self.buffer.buf[:payload])
+        elif kind == "bytes":
+            return payload
+        elif kind == "cancelled":
+            raise ImageGenerationCancelled(f"Image generation request {request_id} was cancelled.")
+        else:
+            raise RuntimeError(f"Image generation failed in worker: {payload}")
+
+    def cancel(self, request_id: int):
+        # Thread safe; the worker notices at it's next check.
+        self.cancelled_id.value = request_id
+
+    def stop(self):
+        # Idempotent, as it is called at exit as well as by whoever stopped it first.
+        with self._start_lock:
+            if self.stopped:
+                return
+            self.stopped = True
+        atexit.unregister(self.stop)
+        if self.process and self.process.is_alive():
+            self.requests.put(None)
+            self.process.join(timeout=10)
+        self.buffer.close()
+        self.buffer.unlink()
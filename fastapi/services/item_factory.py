@@ -14,6 +14,8 @@ class ItemFactory:
     #
 
     def subtypify_item(self, item: Item) -> Item:
+        if type(item) is not Item:
+            return item  # already typed.
         constructor = getattr(domain.classes, item.item_type)
         subtypified_item = constructor(**item.dict())
         return subtypified_item
@@ -31,5 +33,3 @@ class ItemFactory:
         )
         return self.subtypify_item(item)
 
-
-
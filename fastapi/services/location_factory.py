@@ -2,52 +2,170 @@
 requirements:
 """
 
-import random
+import asyncio
 
-from typing import Tuple
+from typing import Callable, Iterable, Tuple
+from domain import dice
 from domain.classes import Location, World
+from domain.config import RegionsConfig
+from services.admission import UpgradeHook, apply_directly
 from services.ai_object_factory import AiObjectFactory
+from services.display import display
+from services.event_bus import EventBus
+from services.generation_tracker import GenerationCancelledError, GenerationTracker
 from services.item_factory import ItemFactory
+from services.scheduler import Priority, StaleJobError, current_priority, generation_priority
 
 class LocationFactory:
-    def __init__(self, ai_object_factory: AiObjectFactory, item_factory: ItemFactory):
+    def __init__(self, ai_object_factory: AiObjectFactory, item_factory: ItemFactory, event_bus: EventBus, generation_tracker: GenerationTracker, regions: RegionsConfig):
         self.ai_object_factory = ai_object_factory
         self.item_factory = item_factory
+        self.event_bus = event_bus
+        self.generation_tracker = generation_tracker
+        self.regions = regions
+        self.apply_change: UpgradeHook = apply_directly  # replaced by main.py, to go through the world actor.
+        self.is_replaced: Callable[[World], bool] = lambda world: False  # replaced by main.py.
+        self._image_tasks: set[asyncio.Task] = set()
+        self._region_tasks: set[asyncio.Task] = set()
 
-    async def _add_new_location(self, world: World, position: Tuple[int, int]) -> Location:
+    async def _generate_location(self, world: World, position: Tuple[int, int]) -> Location:
         exits = world.build_exits_message(
             position, include_description=True
         )
-        new_location = await self.ai_object_factory.create_location(
-            exits,
-            world.backstory,
-            world.locations
-        )
 
-        make_item = random.choice([True, False])
+        make_item = dice.choice([True, False])
         if make_item == True:
 
-            # might make an I/O call to an AI model.
-            item = await self.item_factory.create_item(world.backstory)
-            new_location.items.append(item)
+            # One chat completion for both the location and it's loot.
+            new_location, items = await self.ai_object_factory.create_location_with_items(
+                exits=exits,
+                backstory=world.lore(),
+                locations=world.locations,
+                item_types=[self.ai_object_factory.random_item_type()]
+            )
+            new_location.items.extend(self.item_factory.subtypify_item(item) for item in items)
 
-        world.locations[position] = new_location
+        else:
+            new_location = await self.ai_object_factory.create_location(
+                exits,
+                world.lore(),
+                world.locations
+            )
 
         return new_location
     
+    def _region_tiles(self, position: Tuple[int, int]) -> list[Tuple[int, int]]:
+        # The tiles of the region that position is in, from the north west corner.
+        size = self.regions.size
+        west, south = position[0] // size * size, position[1] // size * size
+        return [(x, y) for y in range(south + size - 1, south - 1, -1) for x in range(west, west + size)]
+
+    async def _generate_region(self, world: World, position: Tuple[int, int]) -> dict[Tuple[int, int], Location]:
+        tiles = self._region_tiles(position)
+        missing = [tile for tile in tiles if tile not in world.locations]
+        if self.regions.size == 1 or missing == [position]:
+            return {position: await self._generate_location(world, position)}
+
+        # The charted locations in the region, and around it.
+        around = {(x + dx, y + dy) for x, y in tiles for dx in (-1, 0, 1) for dy in (-1, 0, 1)}
+        charted = {tile: world.locations[tile] for tile in sorted(around) if tile in world.locations}
+        item_types = {tile: self.ai_object_factory.random_item_type() for tile in missing if dice.choice([True, False])}
+
+        backstory = world.lore()
+        region = await self.ai_object_factory.create_region(
+            backstory=backstory,
+            tiles=missing,
+            charted=charted,
+            taken_names=[location.name for location in world.locations.values()],
+            item_types=item_types
+        )
+
+        # The player waits for the images at their own tile, and those at the other tiles follow in the background.
+        location, image_prompt = region[position]
+        (await self.ai_object_factory.create_location_images(backstory, location, image_prompt))()
+        for tile, (neighbour, neighbour_prompt) in region.items():
+            if tile != position:
+                self._fill_images_later(world, backstory, neighbour, neighbour_prompt)
+
+        return {tile: location for tile, (location, _) in region.items()}
+
+    def _fill_images_later(self, world: World, backstory: str, location: Location, image_prompt: str):
+        async def fill():
+            try:
+                # Of no use once the world is replaced, so dropped if still queued by then.
+                with generation_priority(max(current_priority.get(), Priority.NEAR_FUTURE), lambda: self.is_replaced(world)):
+                    change = await self.ai_object_factory.create_location_images(backstory, location, image_prompt)
+                await self.apply_change(change)
+                self.event_bus.publish("location_images_ready", name=location.name)
+            except StaleJobError:
+                pass
+            except Exception as error:
+                display(f"Could not generate the images of {location.name}: {error!r}")
+
+        task = asyncio.create_task(fill())
+        self._image_tasks.add(task)
+        task.add_done_callback(self._image_tasks.discard)
+
+    async def _prefetch(self, world: World, position: Tuple[int, int], near: list[Tuple[int, int]]):
+        # Stays needed while the player is in the region being left (near) or the one being prefetched.
+        try:
+            with generation_priority(Priority.NEAR_FUTURE):
+                region = await self.generate_region(world, position, covers=near)
+            await self.apply_change(lambda: self.add_region(world, position, region))
+        except GenerationCancelledError:
+            pass
+        except Exception as error:
+            display(f"Could not prefetch the region at {position}: {error!r}")
+
     #
     # PUBLIC METHODS
     #
 
+    async def generate_region(self, world: World, position: Tuple[int, int], covers: Iterable[Tuple[int, int]] = ()) -> dict[Tuple[int, int], Location]:
+        """
+        The new locations of the region that position is in, including the one at position.  Does not add them
+        to the world, see add_region.  Tracked, so it can be cancelled if the player moves out of the region
+        (and covers) before it is done.
+        """
+        tiles = self._region_tiles(position)
+        return await self.generation_tracker.run(
+            world, tiles[0], "region",
+            lambda: self._generate_region(world=world, position=position),
+            covers=tiles + list(covers)
+        )
+
+    async def images_filled(self):
+        # Waits for the regions (and their images) being generated in the background, as far as there are any.
+        while self._region_tasks or self._image_tasks:
+            await asyncio.gather(*self._region_tasks, *self._image_tasks, return_exceptions=True)
+
+    def prefetch_ahead(self, world: World, position: Tuple[int, int], heading: Tuple[int, int]):
+        # When the player, at position and going towards heading, is at the edge of their region, starts
+        # generating the region ahead of them unless it is already charted.
+        if self.regions.size == 1 or not self.regions.prefetch:
+            return
+
+        region = self._region_tiles(position)
+        ahead = (position[0] + heading[0], position[1] + heading[1])
+        if ahead in region or ahead in world.locations:
+            return
+        task = asyncio.create_task(self._prefetch(world, ahead, region))
+        self._region_tasks.add(task)
+        task.add_done_callback(self._region_tasks.discard)
+
+    def add_region(self, world: World, position: Tuple[int, int], region: dict[Tuple[int, int], Location]) -> Location:
+        # Returns the location that ends up at position, which is the existing one if there already was one.
+        for tile, location in region.items():
+            if tile in world.locations:
+                continue
+            world.add_location(tile, location)
+            self.event_bus.publish("location_ready", position=list(tile), name=location.name)
+        return world.locations[position]
+
     async def get_location(self, world: World, position: Tuple[int, int]) -> Location:
         location = world.locations.get(position)
 
         if location is None:
-            location = await self._add_new_location( 
-                world=world, 
-                position=position
-            )
+            location = self.add_region(world, position, await self.generate_region(world, position))
 
         return location
-    
-
@@ -0,0 +1,101 @@
+"""
+requirements:
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+from collections import deque
+from typing import Any, Optional
+
+from domain.config import LoopMonitorConfig
+from services.display import display
+from services.metrics import Metrics
+
+def format_stack(frame, limit: int = 30) -> list[str]:
+    # Innermost frame last, as in a traceback.
+    return [
+        f"{os.path.basename(entry.filename)}:{entry.lineno} in {entry.name}"
+        for entry in traceback.extract_stack(frame, limit=limit)
+    ]
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop wakes up a heartbeat coroutine (the loop lag), and records every stall
+    (lag beyond stall_seconds) together with the stack of whatever was running on the loop at the time.  That
+    stack is captured from a watchdog thread, since the loop itself can not look while it is blocked.
+    """
+    def __init__(self, config: LoopMonitorConfig, metrics: Metrics):
+        self.config = config
+        self.metrics = metrics
+        self.stalls: deque[dict[str, Any]] = deque(maxlen=config.keep_stalls)
+        self._loop_thread_id: Optional[int] = None
+        self._last_tick = time.monotonic()
+        self._stalled_stack: Optional[list[str]] = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._heartbeat: asyncio.Task = None
+        self._watchdog: threading.Thread = None
+
+    async def _beat(self):
+        interval = self.config.interval_seconds
+        while True:
+            self._last_tick = time.monotonic()
+            await asyncio.sleep(interval)
+            lag = max(0.0, time.monotonic() - self._last_tick - interval)
+            self.metrics.latency("loop_lag").record(lag)
+
+            # Taken on every beat, so the stack of a beat that was late but no stall is never blamed for the next stall.
+            with self._lock:
+                stack, self._stalled_stack = self._stalled_stack, None
+            if lag >= self.config.stall_seconds:
+                self.metrics.increment("loop_stalls")
+                self.stalls.append({
+                    "at": time.time(),
+                    "seconds": lag,
+                    "stack": stack or ["(stall ended before the watchdog saw it)"]
+                })
+                if self.config.log_stalls:
+                    display(f"Event loop stalled for {lag:.3f}s in {stack[-1] if stack else 'unknown'}", level=logging.WARNING)
+
+    def _watch(self):
+        # Runs on it's own thread, looking at the loop thread's stack whenever the heartbeat is overdue.
+        while not self._stopped.wait(self.config.interval_seconds / 2):
+            overdue = time.monotonic() - self._last_tick - self.config.interval_seconds
+            if overdue >= self.config.stall_seconds / 2:
+                with self._lock:
+                    if self._stalled_stack is None:
+                        frame = sys._current_frames().get(self._loop_thread_id)
+                        if frame is not None:
+                            self._stalled_stack = format_stack(frame)
+
+    #
+    # PUBLIC METHODS
+    #
+
+    def start(self):
+        # Called on the event loop's thread.
+        if not self.config.enabled:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = asyncio.create_task(self._beat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._heartbeat:
+            self._heartbeat.cancel()
+
+    def report(self) -> dict[str, Any]:
+        lag = self.metrics.latency("loop_lag")
+        return {
+            "lag_seconds": lag.summary(),
+            "stalls": self.metrics.counters.get("loop_stalls", 0),
+            "worst_recent_stall_seconds": max((stall["seconds"] for stall in self.stalls), default=0.0)
+        }
@@ -0,0 +1,86 @@
+"""
+requirements:
+"""
+
+import time
+
+from collections import deque
+from contextlib import contextmanager
+
+class LatencyStats:
+    def __init__(self, window: int = 1000):
+        self.samples: deque[float] = deque(maxlen=window)
+        self.recorded_at: deque[float] = deque(maxlen=window)  # time.monotonic() of each sample.
+        self.count = 0
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+        self.recorded_at.append(time.monotonic())
+        self.count += 1
+
+    def percentile(self, percent: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def recent_percentile(self, percent: float, within_seconds: float) -> float:
+        # Over only the samples recorded in the last within_seconds.
+        since = time.monotonic() - within_seconds
+        recent = [sample for sample, at in zip(self.samples, self.recorded_at) if at >= since]
+        if not recent:
+            return 0.0
+        ordered = sorted(recent)
+        index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def mean(self) -> float:
+        return sum(self.samples) / len(self.samples) if self.samples else 0.0
+
+    def summary(self) -> dict[str, float]:
+        return {
+            "count": self.count,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": max(self.samples, default=0.0)
+        }
+
+class Metrics:
+    def __init__(self):
+        self.latencies: dict[str, LatencyStats] = {}
+        self.distributions: dict[str, LatencyStats] = {}  # of values that are not durations e.g. token counts.
+        self.counters: dict[str, int] = {}
+
+    #
+    # PUBLIC METHODS
+    #
+
+    def latency(self, name: str) -> LatencyStats:
+        if name not in self.latencies:
+            self.latencies[name] = LatencyStats()
+        return self.latencies[name]
+
+    def distribution(self, name: str) -> LatencyStats:
+        if name not in self.distributions:
+            self.distributions[name] = LatencyStats()
+        return self.distributions[name]
+
+    def increment(self, name: str, amount: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextmanager
+    def timed(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.latency(name).record(time.perf_counter() - start)
+
+    def report(self) -> dict:
+        return {
+            "latency_seconds": {name: stats.summary() for name, stats in sorted(self.latencies.items())},
+            "distributions": {name: stats.summary() | {"mean": stats.mean()} for name, stats in sorted(self.distributions.items())},
+            "counters": dict(sorted(self.counters.items()))
+        }
@@ -0,0 +1,55 @@
+"""
+requirements:
+"""
+
+import os
+import sys
+import threading
+import time
+
+from collections import Counter
+from typing import Optional
+
+class SamplingProfiler:
+    """
+    A wall clock sampling profiler for the running server: samples the stacks of it's threads at a fixed
+    interval for a while, and returns them in the folded format (one "frame;frame;...;frame count" line per
+    distinct stack) that flamegraph.pl, speedscope and inferno read.  Sampling happens on a thread of it's own,
+    so the event loop keeps serving (and is profiled) meanwhile.  One capture at a time.
+    """
+    def __init__(self):
+        self._capturing = threading.Lock()
+
+    def _fold(self, frame) -> str:
+        frames = []
+        while frame is not None:
+            frames.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+            frame = frame.f_back
+        return ";".join(reversed(frames))
+
+    #
+    # PUBLIC METHODS
+    #
+
+    def busy(self) -> bool:
+        return self._capturing.locked()
+
+    def capture(self, seconds: float, interval_seconds: float, thread_id: Optional[int] = None) -> str:
+        """Blocking.  Samples only the given thread (e.g. the event loop's) when thread_id is set."""
+        if not self._capturing.acquire(blocking=False):
+            raise RuntimeError("A profile is already being captured.")
+        try:
+            own_thread = threading.get_ident()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks: Counter[str] = Counter()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident == own_thread or (thread_id is not None and ident != thread_id):
+                        continue
+                    stacks[f"{names.get(ident, ident)};{self._fold(frame)}"] += 1
+                time.sleep(interval_seconds)
+        finally:
+            self._capturing.release()
+
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
@@ -0,0 +1,70 @@
+"""
+requirements:
+"""
+
+import asyncio
+import time
+
+from typing import Any, Awaitable
+
+from services.display import display
+
+class Readiness:
+    """
+    Tracks the startup steps that run in the background after the server has started accepting requests.
+    """
+    def __init__(self, started: float):
+        self.started = started  # time.perf_counter() when the process started.
+        self.steps: dict[str, str] = {}
+        self.errors: dict[str, str] = {}
+        self.ready = asyncio.Event()
+        self.first_request_seconds: float = None
+
+    async def _run_step(self, name: str, step: Awaitable[Any]):
+        start = time.perf_counter()
+        self.steps[name] = "running"
+        try:
+            await step
+        except Exception as error:
+            self.steps[name] = "failed"
+            self.errors[name] = repr(error)
+            display(f"Startup step {name} failed: {error!r}")
+            raise
+        self.steps[name] = "done"
+        display(f"Startup step {name} done in {time.perf_counter() - start:.2f}s")
+
+    #
+    # PUBLIC METHODS
+    #
+
+    def add_step(self, name: str):
+        self.steps[name] = "pending"
+
+    async def run(self, steps: dict[str, Awaitable[Any]]):
+        # Steps run concurrently; a failing step does not stop the others.
+        for name in steps:
+            self.add_step(name)
+        try:
+            await asyncio.gather(
+                *(self._run_step(name, step) for name, step in steps.items()),
+                return_exceptions=True
+            )
+        finally:
+            self.ready.set()
+
+    def is_ready(self) -> bool:
+        return self.ready.is_set() and not self.errors
+
+    def request_served(self):
+        if self.first_request_seconds is None:
+            self.first_request_seconds = time.perf_counter() - self.started
+            display(f"First request served {self.first_request_seconds:.2f}s after process start.")
+
+    def report(self) -> dict[str, Any]:
+        return {
+            "ready": self.is_ready(),
+            "steps": self.steps,
+            "errors": self.errors,
+            "seconds_since_start": time.perf_counter() - self.started,
+            "first_request_seconds": self.first_request_seconds
+        }
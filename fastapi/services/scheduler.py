@@ -0,0 +1,194 @@
+"""
+requirements:
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+from domain.config import SchedulerConfig
+from services.metrics import Metrics
+
+T = TypeVar("T")
+
+class Priority(IntEnum):
+    INTERACTIVE = 0  # the player is waiting on it right now.
+    NEAR_FUTURE = 1  # the player will probably want it soon.
+    SPECULATIVE = 2  # nice to have.
+
+class StaleJobError(Exception):
+    pass
+
+# The priority (and staleness check) of the generation work being done by the current task.
+# Background work sets these with generation_priority(), and everything it awaits inherits them.
+current_priority: ContextVar[Priority] = ContextVar("current_priority", default=Priority.INTERACTIVE)
+current_stale_check: ContextVar[Optional[Callable[[], bool]]] = ContextVar("current_stale_check", default=None)
+
+# Told (with True) when the current task has to queue for a PriorityLock, and (with False) once it holds it, so that
+# whoever is timing the work (see HedgedCaller) can leave the time spent queued out.
+current_queue_listener: ContextVar[Optional[Callable[[bool], None]]] = ContextVar("current_queue_listener", default=None)
+
+@contextmanager
+def generation_priority(priority: Priority, is_stale: Optional[Callable[[], bool]] = None):
+    priority_token = current_priority.set(priority)
+    stale_token = current_stale_check.set(is_stale)
+    try:
+        yield
+    finally:
+        current_priority.reset(priority_token)
+        current_stale_check.reset(stale_token)
+
+class _Waiter:
+    def __init__(self, priority: Priority, is_stale: Optional[Callable[[], bool]]):
+        self.priority = priority
+        self.is_stale = is_stale
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued = time.perf_counter()
+
+class PriorityLock:
+    """
+    An asyncio lock that hands itself to the highest priority waiter (FIFO within a priority),
+    so interactive work jumps the queue ahead of background work.
+    """
+    def __init__(self):
+        self._locked = False
+        self._waiters: list[tuple[int, int, _Waiter]] = []
+        self._sequence = itertools.count()
+
+    def locked(self) -> bool:
+        return self._locked
+
+    async def acquire(self):
+        if not self._locked and not self._waiters:
+            self._locked = True
+            return
+
+        waiter = _Waiter(current_priority.get(), None)
+        heapq.heappush(self._waiters, (waiter.priority, next(self._sequence), waiter))
+        listener = current_queue_listener.get()
+        if listener:
+            listener(True)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # We were handed the lock just as we were cancelled, so pass it on.
+                self.release()
+            raise
+        finally:
+            if listener:
+                listener(False)
+
+    def release(self):
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.future.done():
+                waiter.future.set_result(True)  # the lock stays held, by the waiter now.
+                return
+        self._locked = False
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+class GenerationScheduler:
+    """
+    Every generation job goes through here.  Jobs run in strict priority order, background (non interactive)
+    jobs may only occupy some of the slots, and queued jobs that have gone stale are cancelled instead of run.
+    """
+    def __init__(self, config: SchedulerConfig, metrics: Metrics):
+        self.config = config
+        self.metrics = metrics
+        self.running = {priority: 0 for priority in Priority}
+        self._queue: list[tuple[int, int, _Waiter]] = []
+        self._sequence = itertools.count()
+
+    def _total_running(self) -> int:
+        return sum(self.running.values())
+
+    def _can_start(self, priority: Priority) -> bool:
+        if self._total_running() >= self.config.max_concurrent_jobs:
+            return False
+        if priority != Priority.INTERACTIVE:
+            return self._total_running() - self.running[Priority.INTERACTIVE] < self.config.max_background_jobs
+        return True
+
+    def _start(self, waiter: _Waiter):
+        self.running[waiter.priority] += 1
+        self.metrics.latency(f"queue_wait_{waiter.priority.name.lower()}").record(time.perf_counter() - waiter.enqueued)
+
+    def _dispatch(self):
+        deferred = []
+        while self._queue:
+            entry = heapq.heappop(self._queue)
+            waiter = entry[2]
+            if waiter.future.done():
+                continue
+            if waiter.is_stale and waiter.is_stale():
+                self.metrics.increment(f"stale_cancelled_{waiter.priority.name.lower()}")
+                waiter.future.set_exception(StaleJobError("Generation job went stale while queued."))
+                continue
+            if not self._can_start(waiter.priority):
+                deferred.append(entry)
+                if waiter.priority == Priority.INTERACTIVE:
+                    break  # strict preference: nothing of lower priority may overtake a waiting interactive job.
+                continue
+            self._start(waiter)
+            waiter.future.set_result(True)
+        for entry in deferred:
+            heapq.heappush(self._queue, entry)
+
+    async def _acquire(self, priority: Priority, is_stale: Optional[Callable[[], bool]]):
+        waiter = _Waiter(priority, is_stale)
+        if not self._queue and self._can_start(priority):
+            self._start(waiter)
+            return
+
+        heapq.heappush(self._queue, (priority, next(self._sequence), waiter))
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release(priority)
+            raise
+
+    def _release(self, priority: Priority):
+        self.running[priority] -= 1
+        self._dispatch()
+
+    #
+    # PUBLIC METHODS
+    #
+
+    async def submit(self, job: Callable[[], Awaitable[T]], priority: Optional[Priority] = None, is_stale: Optional[Callable[[], bool]] = None) -> T:
+        priority = current_priority.get() if priority is None else priority
+        is_stale = is_stale or current_stale_check.get()
+
+        await self._acquire(priority, is_stale)
+        try:
+            with generation_priority(priority, is_stale):
+                return await job()
+        finally:
+            self._release(priority)
+
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, waiter in self._queue if not waiter.future.done())
+
+    def report(self) -> dict[str, Any]:
+        queued = {priority.name.lower(): 0 for priority in Priority}
+        for _, _, waiter in self._queue:
+            if not waiter.future.done():
+                queued[waiter.priority.name.lower()] += 1
+        return {
+            "running": {priority.name.lower(): count for priority, count in self.running.items()},
+            "queued": queued
+        }
@@ -0,0 +1,119 @@
+"""
+requirements:
+"""
+
+import asyncio
+import glob
+import os
+import time
+
+from typing import Any, Optional
+
+from domain.classes import World
+from domain.config import SpareWorldsConfig
+from services.admission import AdmissionController, Tier, apply_directly, upgrades_applied_by
+from services.display import display
+from services.location_factory import LocationFactory
+from services.metrics import Metrics
+from services.scheduler import Priority, generation_priority
+from services.world_factory import WorldFactory
+
+class SpareWorlds:
+    """
+    A small stock of ready to play worlds (backstory, player with their starter weapon, and starting location),
+    kept on disk in a directory of their own, so that a new game starts straight away instead of waiting on
+    every engine call that goes into a world.  Claiming a spare starts a refill, which builds the replacement
+    in the background at speculative priority, and not at all while the engines are overloaded.
+
+    location_factory is one of the spares' own, so that building a spare tells the live sessions nothing and
+    waits on nothing of the game in progress.
+    """
+    def __init__(self, config: SpareWorldsConfig, world_factory: WorldFactory, location_factory: LocationFactory, admission: AdmissionController, metrics: Metrics):
+        self.config = config
+        self.world_factory = world_factory
+        self.location_factory = location_factory
+        self.admission = admission
+        self.metrics = metrics
+        self._refill_task: Optional[asyncio.Task] = None
+        self._spares = 0  # as of the last time the directory was listed.
+        if config.enabled:
+            os.makedirs(config.directory, exist_ok=True)
+
+    async def _spare_files(self) -> list[str]:
+        # Oldest first, as they are named by the time they were built.
+        spare_files = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: sorted(glob.glob(os.path.join(self.config.directory, "*.json")))
+        )
+        self._spares = len(spare_files)
+        return spare_files
+
+    async def _build_spare(self):
+        # Content degraded under load is upgraded on the spare itself, not through the live world's actor.
+        with generation_priority(Priority.SPECULATIVE), upgrades_applied_by(apply_directly):
+            world = await self.world_factory.create_world()
+            position = world.player.get_position()
+            self.location_factory.add_region(world, position, await self.location_factory.generate_region(world, position))
+            # Including those of the rest of the starting region, which would otherwise be lost with the saved spare.
+            await self.location_factory.images_filled()
+
+        await self.world_factory.save_world(world, os.path.join(self.config.directory, f"{time.time_ns()}.json"))
+        self.metrics.increment("spare_worlds_built")
+
+    async def _refill(self):
+        while len(await self._spare_files()) < self.config.count:
+            if self.admission.tier() != Tier.FULL:
+                # A spare built now would be made of degraded content, and slow the players down meanwhile.
+                await asyncio.sleep(self.config.retry_seconds)
+                continue
+            try:
+                with self.metrics.timed("spare_world"):
+                    await self._build_spare()
+            except Exception as error:
+                self.metrics.increment("spare_worlds_failed")
+                display(f"Building a spare world failed: {error!r}")
+                await asyncio.sleep(self.config.retry_seconds)
+
+    #
+    # PUBLIC METHODS
+    #
+
+    def refill(self):
+        if not self.config.enabled or (self._refill_task and not self._refill_task.done()):
+            return
+        self._refill_task = asyncio.create_task(self._refill())
+
+    async def claim(self) -> Optional[World]:
+        # Takes the oldest spare off the disk, or None when there are none.
+        world = None
+        for spare_file in await self._spare_files():
+            try:
+                world = await self.world_factory.load_world(spare_file)
+            except Exception as error:
+                display(f"Discarding unreadable spare world {spare_file}: {error!r}")
+            await asyncio.get_running_loop().run_in_executor(None, os.remove, spare_file)
+            if world is not None:
+                break
+
+        self.refill()
+        return world
+
+    async def new_world(self) -> World:
+        # A claimed spare if there is one, otherwise a world created on the spot.
+        world = await self.claim()
+        if world is None:
+            self.metrics.increment("spare_worlds_missed")
+            return await self.world_factory.create_world()
+
+        self.metrics.increment("spare_worlds_claimed")
+        display("Claimed a spare world.")
+        return world
+
+    def stop(self):
+        if self._refill_task:
+            self._refill_task.cancel()
+
+    def report(self) -> dict[str, Any]:
+        return {
+            "spares": self._spares if self.config.enabled else 0,
+            "refilling": bool(self._refill_task and not self._refill_task.done())
+        }
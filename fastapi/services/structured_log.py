@@ -0,0 +1,140 @@
+"""
+requirements:
+"""
+
+import copy
+import json
+import logging
+import logging.handlers
+import math
+import queue
+import re
+import sys
+
+from typing import Any, Optional
+
+from domain.config import LoggingConfig
+
+ANSI_CODES = re.compile(r"\x1b\[[0-9;]*m")
+TRACEBACK_FORMATTER = logging.Formatter()
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, without the colours display() messages carry for the console."""
+    def format(self, record: logging.LogRecord) -> str:
+        entry: dict[str, Any] = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": ANSI_CODES.sub("", record.getMessage()).strip()
+        }
+        event = getattr(record, "event", None)
+        if event:
+            entry["event"] = event
+            entry["sample_rate"] = getattr(record, "sample_rate", 1.0)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class SamplingFilter(logging.Filter):
+    """
+    Passes the given fraction of the records of each sampled event.  Deterministic (every n-th record, starting
+    with the first) rather than random, so it does not draw on the game's dice.
+    """
+    def __init__(self, sample_rates: dict[str, float]):
+        super().__init__()
+        self.sample_rates = sample_rates
+        self.seen: dict[str, int] = {}
+        self.sampled_out = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, "event", None)
+        rate = self.sample_rates.get(event, 1.0) if event else 1.0
+        if rate >= 1.0:
+            return True
+
+        seen = self.seen.get(event, 0)
+        self.seen[event] = seen + 1
+        if math.floor(seen * rate) > math.floor((seen - 1) * rate):
+            record.sample_rate = rate
+            return True
+        self.sampled_out += 1
+        return False
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Drops (and counts) records when the queue is full, rather than blocking the logging thread."""
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # As QueueHandler.prepare, but with the traceback kept apart from the message, in exc_text, for the
+        # exception field of JsonFormatter, rather than formatted into the message.
+        if record.exc_info and not record.exc_text:
+            record.exc_text = TRACEBACK_FORMATTER.formatException(record.exc_info)
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class StructuredLog:
+    """
+    Routes all logging (and display()) through a queue to a listener thread that writes JSON lines to stdout,
+    so the thread that logs, usually the event loop, only ever pays for putting a record on the queue.
+    """
+    def __init__(self, config: LoggingConfig):
+        self.config = config
+        self.queue: queue.Queue = queue.Queue(maxsize=config.queue_size)
+        self.handler = DroppingQueueHandler(self.queue)
+        self.sampler = SamplingFilter(config.sample_rates)
+        self.handler.addFilter(self.sampler)
+        self._listener: Optional[logging.handlers.QueueListener] = None
+
+    #
+    # PUBLIC METHODS
+    #
+
+    def start(self):
+        global active
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(JsonFormatter())
+        self._listener = logging.handlers.QueueListener(self.queue, output, respect_handler_level=False)
+        self._listener.start()
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.handler)
+        root.setLevel(self.config.level)
+        for name, level in self.config.levels.items():
+            logging.getLogger(name).setLevel(level)
+        active = self
+
+    def stop(self):
+        # Writes out whatever is still queued.
+        global active
+        if active is self:
+            active = None
+        logging.getLogger().removeHandler(self.handler)
+        if self._listener:
+            self._listener.stop()
+            self._listener = None
+
+    def report(self) -> dict[str, Any]:
+        return {
+            "queued": self.queue.qsize(),
+            "dropped": self.handler.dropped,
+            "sampled_out": self.sampler.sampled_out
+        }
+
+# The started StructuredLog, which display() logs through; until one is started display() prints.
+active: Optional[StructuredLog] = None
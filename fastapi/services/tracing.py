@@ -0,0 +1,103 @@
+"""
+requirements:
+"""
+
+import json
+import os
+import random
+import threading
+import time
+
+from typing import Any, Optional, Tuple
+
+from domain import dice
+from services.aiengines import AiChatContext, AiEngine, chat_request_key, image_request_key
+from services.display import display
+
+class TraceRecorder:
+    """
+    Records a play session as JSON lines: a header (dice seed and the save file the session started from),
+    then every HTTP action and every AI engine response, for replaying offline with replay.py.
+    """
+    def __init__(self, trace_file: str):
+        self.trace_file = trace_file
+        self._file = None
+        self._lock = threading.Lock()  # AI responses may be recorded from executor threads.
+
+    def _write(self, event: dict[str, Any]):
+        with self._lock:
+            self._file.write(json.dumps(event) + "\n")
+            self._file.flush()
+
+    #
+    # PUBLIC METHODS
+    #
+
+    def begin(self, save_file: str):
+        seed = random.randrange(2**32)
+        dice.seed(seed)
+
+        initial_save = None
+        if os.path.exists(save_file):
+            with open(save_file, "r") as file:
+                initial_save = file.read()
+
+        self._file = open(self.trace_file, "w")
+        self._write({"type": "header", "seed": seed, "initial_save": initial_save, "recorded_at": time.time()})
+        display(f"Recording session trace to {self.trace_file}")
+
+    def record_http(self, method: str, path: str, query: str, body: str, status: int, seconds: float):
+        self._write({"type": "http", "method": method, "path": path, "query": query, "body": body, "status": status, "seconds": seconds})
+
+    def record_ai(self, key: str, response: str):
+        self._write({"type": "ai", "key": key, "response": response})
+
+    def close(self):
+        if self._file:
+            self._file.close()
+
+# Passes calls through to the real engine, recording every response.
+class AiEngineRecording(AiEngine):
+    def __init__(self, engine: AiEngine, recorder: TraceRecorder):
+        self.engine = engine
+        self.recorder = recorder
+
+    def chat_completion(self, context: AiChatContext) -> str:
+        response = self.engine.chat_completion(context)
+        self.recorder.record_ai(chat_request_key(context), response)
+        return response
+
+    async def chat_completion_async(self, context: AiChatContext) -> str:
+        response = await self.engine.chat_completion_async(context)
+        self.recorder.record_ai(chat_request_key(context), response)
+        return response
+
+    def text_to_image(self, prompt: str, size: Tuple[int,int] = None) -> str:
+        response = self.engine.text_to_image(prompt, size)
+        self.recorder.record_ai(image_request_key(prompt, size), response)
+        return response
+
+    async def text_to_image_async(self, prompt: str, size: Tuple[int,int] = None) -> str:
+        response = await self.engine.text_to_image_async(prompt, size)
+        self.recorder.record_ai(image_request_key(prompt, size), response)
+        return response
+
+def load_trace(trace_file: str) -> Tuple[dict[str, Any], list[dict[str, Any]]]:
+    """Returns the header and the HTTP actions of a recorded session."""
+    header: Optional[dict[str, Any]] = None
+    actions = []
+    with open(trace_file, "r") as file:
+        for line in file:
+            event = json.loads(line)
+            if event["type"] == "header":
+                header = event
+            elif event["type"] == "http":
+                actions.append(event)
+    if header is None:
+        raise ValueError(f"Not a session trace: {trace_file}")
+    return header, actions
+
+def begin_replay(trace_file: str):
+    header, _ = load_trace(trace_file)
+    dice.seed(header["seed"])
+    display(f"Replaying session trace {trace_file}")
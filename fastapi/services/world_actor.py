@@ -0,0 +1,104 @@
+"""
+requirements:
+"""
+
+import asyncio
+
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, Tuple, TypeVar
+
+from domain.classes import Enemy, Location, Player, World
+from services.generation_tracker import GenerationCancelledError
+from services.metrics import Metrics
+
+T = TypeVar("T")
+
+class WorldReplacedError(GenerationCancelledError):
+    """Raised to the commands of a world that was lost (or shut down) and is being replaced, which never run."""
+    pass
+
+@dataclass(frozen=True)
+class WorldSnapshot:
+    """
+    What the read endpoints see: copies taken after a command, never changed afterwards.
+    location is the one at the player's position, None while it is still being generated.
+    """
+    version: int
+    backstory: str
+    position: Tuple[int, int]
+    player: Player
+    enemy: Optional[Enemy]
+    location: Optional[Location]
+
+    @staticmethod
+    def of(world: World, version: int) -> "WorldSnapshot":
+        position = world.player.get_position()
+        location = world.locations.get(position)
+        return WorldSnapshot(
+            version=version,
+            backstory=world.backstory,
+            position=position,
+            player=world.player.model_copy(deep=True),
+            enemy=world.enemy.model_copy(deep=True) if world.enemy else None,
+            location=location.model_copy(deep=True) if location else None
+        )
+
+class WorldActor:
+    """
+    Owns a world: every mutation is a command, run one at a time in the order submitted, after which a fresh
+    snapshot is published for readers.  Commands are plain functions of the world and never await, so a
+    command can not interleave with another one, and slow generation happens outside (then is applied by a
+    command of it's own, which re-checks that it still applies).
+    """
+    def __init__(self, world: World, metrics: Metrics):
+        self.world = world
+        self.metrics = metrics
+        self.retired = False  # set once the world has been lost, and is being replaced.
+        self._stopped = False
+        self.snapshot = WorldSnapshot.of(world, version=0)
+        self._commands: asyncio.Queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            command, future = await self._commands.get()
+            if future.cancelled():
+                continue
+            with self.metrics.timed("world_command"):
+                try:
+                    result = command(self.world)
+                    error = None
+                except Exception as exception:
+                    error = exception
+                self.snapshot = WorldSnapshot.of(self.world, version=self.snapshot.version + 1)
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    #
+    # PUBLIC METHODS
+    #
+
+    async def execute(self, command: Callable[[World], T]) -> T:
+        if self.retired or self._stopped:
+            raise WorldReplacedError("The world was replaced, so the command did not run.")
+        future = asyncio.get_running_loop().create_future()
+        self._commands.put_nowait((command, future))
+        self.metrics.distribution("world_command_queue").record(self._commands.qsize())
+        return await future
+
+    def stop(self):
+        # Commands still queued never run: their callers are told, rather than left waiting.
+        self._stopped = True
+        self._task.cancel()
+        while not self._commands.empty():
+            _, future = self._commands.get_nowait()
+            if not future.done():
+                future.set_exception(WorldReplacedError("The world was replaced before the command ran."))
+
+    def report(self) -> dict[str, Any]:
+        return {
+            "version": self.snapshot.version,
+            "queued": self._commands.qsize()
+        }
@@ -5,11 +5,16 @@ pip install pydantic
 
 """
 
+import asyncio
+import glob
 import json
 import aiofiles
+import aiofiles.os
 import aiofiles.ospath
 import os
+import uuid
 
+from typing import Awaitable, Callable, Optional
 from pydantic import TypeAdapter
 
 from domain.classes import World
@@ -19,19 +24,63 @@ from services.ai_object_factory import AiObjectFactory
 from services.combatant_factory import CombatantFactory
 from services.item_factory import ItemFactory
 from services.display import display
+from services.image_store import REFERENCE_PATTERN, ImageStore
 
 class WorldFactory:
-    def __init__(self, ai_object_factory: AiObjectFactory, combatant_factory: CombatantFactory, item_factory: ItemFactory, config: Config):
+    def __init__(self, ai_object_factory: AiObjectFactory, combatant_factory: CombatantFactory, item_factory: ItemFactory, image_store: ImageStore, config: Config):
         self.ai_object_factory = ai_object_factory
         self.combatant_factory = combatant_factory
         self.item_factory = item_factory
+        self.image_store = image_store
         self.save_file = config.save_file
+        self.spares_directory = config.spare_worlds.directory
+        self._save_lock = asyncio.Lock()
+
+    def _entities(self, world: World) -> list:
+        # Everything in the world that has an image.
+        combatants = [world.player] + ([world.enemy] if world.enemy else [])
+        entities = list(world.locations.values()) + combatants
+        return entities + [item for entity in entities for item in entity.items]
+
+    def _saved_references(self) -> set[str]:
+        # Blocking.  The images referred to by the saved world and the spares.
+        referenced = set()
+        for save_file in [self.save_file] + glob.glob(os.path.join(self.spares_directory, "*.json")):
+            try:
+                with open(save_file, "r") as file:
+                    referenced.update(REFERENCE_PATTERN.findall(file.read()))
+            except FileNotFoundError:
+                pass  # claimed, or replaced, meanwhile.
+        return referenced
+
+    def _store_images(self, world: World) -> int:
+        # Moves the images saved inline (before the image store, or with it disabled) into the image store.
+        stored = 0
+        for entity in self._entities(world):
+            image = getattr(entity, "image", None)
+            if image and not self.image_store.is_reference(image):
+                entity.image = self.image_store.put(image)
+                stored += entity.image is not image
+        return stored
 
     async def _load_world(self) -> World:
-        async with aiofiles.open(self.save_file, "r") as file:
+        world = await self.load_world(self.save_file)
+        if world is None:
+            return await self.create_world()
+
+        display("Loaded world from disk.")
+        return world
+    
+    #
+    # PUBLIC METHODS
+    #
+
+    async def load_world(self, save_file: str) -> Optional[World]:
+        # None when the file is empty.
+        async with aiofiles.open(save_file, "r") as file:
             json_str = await file.read()
             if json_str.strip() == "":
-                return await self.create_world()
+                return None
             
             raw = json.loads(json_str)
 
@@ -41,49 +90,74 @@ class WorldFactory:
             for k, v in raw.get("locations", {}).items()
         } 
 
+        # Validating each Inventory also subtypifies it's items.
         adapter = TypeAdapter(World)
         world = adapter.validate_python(raw)
 
-        for location in world.locations.values():
-            location.items = [self.item_factory.subtypify_item(item) for item in location.items]
-
-        world.player.items = [self.item_factory.subtypify_item(item) for item in world.player.items]
-        
-        if world.enemy:
-            world.enemy.items = [self.item_factory.subtypify_item(item) for item in world.enemy.items]
-
-        display("Loaded world from disk.")
+        stored = await asyncio.get_running_loop().run_in_executor(None, self._store_images, world)
+        if stored:
+            display(f"Moved {stored} inline images into the image store.")
         return world
-    
-    #
-    # PUBLIC METHODS
-    #
 
-    async def save_world(self, world: World):
-        async with aiofiles.open(self.save_file, "w") as file:
-            json_str = world.model_dump_json(indent=4)
-            await file.write(json_str)
-            display("Saved world to disk.")
+    async def save_world(self, world: World, save_file: Optional[str] = None):
+        # Written to a temporary file of it's own first, so an interrupted save never leaves a half written world
+        # behind, and saves are taken one at a time, so concurrent ones (pregenerate's checkpoints) never interleave.
+        save_file = save_file or self.save_file
+        temp_file = f"{save_file}.{uuid.uuid4().hex}.tmp"
+        async with self._save_lock:
+            try:
+                async with aiofiles.open(temp_file, "w") as file:
+                    json_str = world.model_dump_json(indent=4)
+                    await file.write(json_str)
+                await aiofiles.os.replace(temp_file, save_file)
+            finally:
+                if await aiofiles.ospath.exists(temp_file):
+                    await aiofiles.os.remove(temp_file)
+        display(f"Saved world to {save_file}.")
+
+    async def collect_images(self, worlds: list[World]):
+        # Removes the stored images that neither the worlds in play, the saved world nor a spare refers to, e.g.
+        # once a world has been replaced or deleted.
+        if not self.image_store.config.enabled:
+            return
+        referenced = {
+            entity.image for world in worlds for entity in self._entities(world)
+            if self.image_store.is_reference(getattr(entity, "image", None))
+        }
+        try:
+            removed = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: self.image_store.collect(referenced | self._saved_references())
+            )
+        except OSError as error:
+            display(f"Could not collect the images no world refers to: {error!r}")
+            return
+        display(f"Collected {removed} images no world refers to any more.")
 
     def delete_world(self):
         if os.path.exists(self.save_file):
             os.remove(self.save_file)
-            print("Save file deleted successfully.")
+            display("Save file deleted successfully.")
         else:
-            print(f"Save file not found: {self.save_file}")
+            display(f"Save file not found: {self.save_file}")
 
     async def create_world(self) -> World:
         backstory = await self.ai_object_factory.create_backstory()
-        player = await self.combatant_factory.create_player(backstory)
-        world = World(backstory=backstory, player=player)
+        world_bible = await self.ai_object_factory.create_world_bible(backstory)
+        player = await self.combatant_factory.create_player(world_bible)
+        world = World(backstory=backstory, world_bible=world_bible, player=player)
         display("Generated new world.")
         return world
 
-    async def get_world(self) -> World:
+    async def get_world(self, create: Optional[Callable[[], Awaitable[World]]] = None) -> World:
+        # create makes the world when there is no saved one (create_world by default, see SpareWorlds.new_world).
         if await aiofiles.ospath.exists(self.save_file):
             world = await self._load_world()
+            if world.world_bible is None:
+                # Worlds saved before world bibles existed get one now, once.
+                world.world_bible = await self.ai_object_factory.create_world_bible(world.backstory)
+                await self.save_world(world)
         else:
-            world = await self.create_world()
+            world = await (create or self.create_world)()
             await self.save_world(world)
         return world
 
@@ -0,0 +1,37 @@
+import pytest
+
+from domain.classes import Enemy, Player, Weapon
+from services.combat_simulator import CombatSimulator, unarmed_outcome
+
+def _weapon() -> Weapon:
+    return Weapon(item_type="Weapon", name="sword", description=None, image_prompt=None, image="", damage=(5, 10, 0))
+
+def _player(armed: bool = True) -> Player:
+    player = Player(strength=10, agility=10, intelligence=10, consitution=10, level=5)
+    if armed:
+        player.items.append(_weapon())
+    return player
+
+def _enemy(armed: bool = True) -> Enemy:
+    enemy = Enemy(name="goblin", description="small", strength=5, agility=5, intelligence=5, consitution=5, level=2)
+    if armed:
+        enemy.items.append(_weapon())
+    return enemy
+
+def test_unarmed_player_is_not_simulated():
+    assert unarmed_outcome(_player(armed=False), _enemy()) == "NO_PLAYER_WEAPON"
+    assert unarmed_outcome(_player(armed=False), _enemy(armed=False)) == "NO_PLAYER_WEAPON"
+    with pytest.raises(ValueError):
+        CombatSimulator(seed=1).simulate(_player(armed=False), _enemy(), fights=10)
+
+def test_unarmed_enemy_is_not_simulated():
+    assert unarmed_outcome(_player(), _enemy(armed=False)) == "NO_ENEMY_WEAPON"
+    with pytest.raises(ValueError):
+        CombatSimulator(seed=1).simulate(_player(), _enemy(armed=False), fights=10)
+
+def test_armed_fight_is_simulated():
+    assert unarmed_outcome(_player(), _enemy()) is None
+    odds = CombatSimulator(seed=1).simulate(_player(), _enemy(), fights=1000)
+    assert odds["fights"] == 1000
+    assert odds["win_probability"] + odds["loss_probability"] + odds["unresolved_probability"] == pytest.approx(1.0)
+    assert odds["win_probability"] > 0.9
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from domain.config import HedgingConfig
+from services.hedging import HedgedCaller
+from services.metrics import Metrics
+
+class _Engine:
+    """Answers with it's name after the given delay, or raises error; remembers which calls were cancelled."""
+    def __init__(self, name: str, delay_seconds: float, error: Exception = None):
+        self.name = name
+        self.delay_seconds = delay_seconds
+        self.error = error
+        self.calls = 0
+        self.cancelled = 0
+
+    async def answer(self) -> str:
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay_seconds)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error:
+            raise self.error
+        return self.name
+
+def _config(**overrides) -> HedgingConfig:
+    return HedgingConfig(**{"initial_hedge_seconds": 0.05, "default_deadline_seconds": 1.0, **overrides})
+
+async def _request(engine: _Engine) -> str:
+    return await engine.answer()
+
+def test_fast_primary_is_not_hedged():
+    async def run():
+        primary, secondary = _Engine("primary", 0.0), _Engine("secondary", 0.0)
+        metrics = Metrics()
+        caller = HedgedCaller(primary, secondary, _config(), metrics)
+        assert await caller.call("location", _request) == "primary"
+        assert secondary.calls == 0
+        assert "hedge_sent_location" not in metrics.counters
+
+    asyncio.run(run())
+
+def test_slow_primary_loses_to_the_hedge_and_is_cancelled():
+    async def run():
+        primary, secondary = _Engine("primary", 0.5), _Engine("secondary", 0.0)
+        metrics = Metrics()
+        caller = HedgedCaller(primary, secondary, _config(), metrics)
+        assert await caller.call("location", _request) == "secondary"
+        await asyncio.sleep(0)  # lets the cancelled primary unwind.
+        assert primary.cancelled == 1
+        assert metrics.counters["hedge_sent_location"] == 1
+        assert metrics.counters["hedge_won_location"] == 1
+
+    asyncio.run(run())
+
+def test_primary_that_answers_first_after_the_hedge_wins():
+    async def run():
+        primary, secondary = _Engine("primary", 0.1), _Engine("secondary", 0.5)
+        metrics = Metrics()
+        caller = HedgedCaller(primary, secondary, _config(), metrics)
+        assert await caller.call("location", _request) == "primary"
+        await asyncio.sleep(0)
+        assert secondary.cancelled == 1
+        assert metrics.counters["hedge_sent_location"] == 1
+        assert "hedge_won_location" not in metrics.counters
+
+    asyncio.run(run())
+
+def test_failed_primary_is_hedged_straight_away():
+    async def run():
+        primary, secondary = _Engine("primary", 0.0, error=RuntimeError("down")), _Engine("secondary", 0.0)
+        caller = HedgedCaller(primary, secondary, _config(initial_hedge_seconds=10.0), Metrics())
+        assert await asyncio.wait_for(caller.call("location", _request), timeout=1) == "secondary"
+
+    asyncio.run(run())
+
+def test_both_failing_raises_the_last_error():
+    async def run():
+        primary = _Engine("primary", 0.0, error=RuntimeError("primary down"))
+        secondary = _Engine("secondary", 0.0, error=RuntimeError("secondary down"))
+        caller = HedgedCaller(primary, secondary, _config(), Metrics())
+        with pytest.raises(RuntimeError, match="secondary down"):
+            await caller.call("location", _request)
+
+    asyncio.run(run())
+
+def test_deadline_cancels_every_request():
+    async def run():
+        primary, secondary = _Engine("primary", 5.0), _Engine("secondary", 5.0)
+        caller = HedgedCaller(primary, secondary, _config(default_deadline_seconds=0.1), Metrics())
+        with pytest.raises(TimeoutError):
+            await caller.call("location", _request)
+        await asyncio.sleep(0)
+        assert primary.cancelled == 1
+        assert secondary.cancelled == 1
+
+    asyncio.run(run())
+
+def test_images_are_not_hedged_against_the_same_engine():
+    async def run():
+        engine = _Engine("only", 0.2)
+        caller = HedgedCaller(engine, None, _config(), Metrics())
+        assert await caller.call("location_image", _request) == "only"
+        assert engine.calls == 1
+
+    asyncio.run(run())
+
+def test_disabled_hedging_sends_one_request():
+    async def run():
+        primary, secondary = _Engine("primary", 0.2), _Engine("secondary", 0.0)
+        caller = HedgedCaller(primary, secondary, _config(enabled=False), Metrics())
+        assert await caller.call("location", _request) == "primary"
+        assert secondary.calls == 0
+
+    asyncio.run(run())
@@ -0,0 +1,21 @@
+import atexit
+
+import pytest
+
+from services.image_worker import ImageWorker
+
+def test_stop_is_idempotent_and_unregisters_the_exit_hook(monkeypatch):
+    unregistered = []
+    monkeypatch.setattr(atexit, "unregister", lambda hook: unregistered.append(hook))
+    worker = ImageWorker(image_library="unused.py", shared_memory_mb=1)
+
+    worker.stop()
+    worker.stop()
+    assert worker.stopped
+    assert unregistered == [worker.stop]
+
+def test_stopped_worker_does_not_restart():
+    worker = ImageWorker(image_library="unused.py", shared_memory_mb=1)
+    worker.stop()
+    with pytest.raises(RuntimeError):
+        worker.start()
@@ -0,0 +1,72 @@
+from domain.classes import Location
+from domain.map_index import CHUNK_SIZE, MapIndex
+
+def _location(name: str, image: str = None) -> Location:
+    return Location(name=name, description=f"{name} description", image=image)
+
+def test_query_returns_only_tiles_inside_the_box():
+    index = MapIndex()
+    for position in [(0, 0), (1, 0), (CHUNK_SIZE, 0), (-1, -1), (5, CHUNK_SIZE * 2)]:
+        index.add(position, _location(f"at {position}"))
+
+    result = index.query(-1, -1, CHUNK_SIZE, 0)
+    positions = [(x, y) for x, y, _, _ in result["tiles"]]
+    assert sorted(positions) == [(-1, -1), (0, 0), (1, 0), (CHUNK_SIZE, 0)]
+    assert result["total"] == 4
+    assert result["bbox"] == [-1, -1, CHUNK_SIZE, 0]
+
+def test_query_is_in_row_order_across_chunks():
+    index = MapIndex()
+    for position in [(CHUNK_SIZE, -CHUNK_SIZE), (-CHUNK_SIZE, CHUNK_SIZE), (0, CHUNK_SIZE), (-1, 0), (0, 0)]:
+        index.add(position, _location("somewhere"))
+
+    result = index.query(-CHUNK_SIZE, -CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE)
+    positions = [(x, y) for x, y, _, _ in result["tiles"]]
+    assert positions == [(-CHUNK_SIZE, CHUNK_SIZE), (0, CHUNK_SIZE), (-1, 0), (0, 0), (CHUNK_SIZE, -CHUNK_SIZE)]
+
+def test_query_shares_names_between_tiles():
+    index = MapIndex()
+    index.add((0, 0), _location("forest"))
+    index.add((1, 0), _location("forest"))
+    index.add((2, 0), _location("lake"))
+
+    result = index.query(0, 0, 2, 0)
+    assert result["names"] == ["forest", "lake"]
+    assert [name_index for _, _, name_index, _ in result["tiles"]] == [0, 0, 1]
+
+def test_query_pages_with_a_cursor():
+    index = MapIndex()
+    for x in range(5):
+        index.add((x, 0), _location(f"tile {x}"))
+
+    first = index.query(0, 0, 4, 0, limit=2)
+    second = index.query(0, 0, 4, 0, cursor=first["next_cursor"], limit=2)
+    last = index.query(0, 0, 4, 0, cursor=second["next_cursor"], limit=2)
+    assert [tile[0] for tile in first["tiles"] + second["tiles"] + last["tiles"]] == [0, 1, 2, 3, 4]
+    assert last["next_cursor"] is None
+
+def test_image_hash_follows_the_location_image():
+    index = MapIndex()
+    location = _location("castle")
+    index.add((3, 4), location)
+    assert index.image_hash((3, 4)) is None
+    assert index.image_hash((9, 9)) is None
+
+    location.image = "data:image/png;base64,first"
+    first = index.image_hash((3, 4))
+    assert first is not None
+    assert index.find_image(first) == location.image
+
+    location.image = "data:image/png;base64,second"
+    second = index.image_hash((3, 4))
+    assert second != first
+    assert index.find_image(second) == "data:image/png;base64,second"
+    assert index.find_image("unknown") is None
+
+def test_added_location_replaces_the_tile():
+    index = MapIndex()
+    index.add((0, 0), _location("old"))
+    index.add((0, 0), _location("new"))
+    result = index.query(0, 0, 0, 0)
+    assert result["names"] == ["new"]
+    assert result["total"] == 1
@@ -0,0 +1,174 @@
+import asyncio
+
+import pytest
+
+from domain.config import SchedulerConfig
+from services.metrics import Metrics
+from services.scheduler import GenerationScheduler, Priority, PriorityLock, StaleJobError, generation_priority
+
+async def _wait_queued(count: int):
+    # Lets the tasks started so far run up to where they queue.
+    for _ in range(count + 1):
+        await asyncio.sleep(0)
+
+def test_priority_lock_hands_over_by_priority_then_fifo():
+    async def run():
+        lock = PriorityLock()
+        order = []
+
+        async def worker(name: str, priority: Priority):
+            with generation_priority(priority):
+                async with lock:
+                    order.append(name)
+
+        await lock.acquire()
+        tasks = [
+            asyncio.create_task(worker("speculative", Priority.SPECULATIVE)),
+            asyncio.create_task(worker("near 1", Priority.NEAR_FUTURE)),
+            asyncio.create_task(worker("interactive", Priority.INTERACTIVE)),
+            asyncio.create_task(worker("near 2", Priority.NEAR_FUTURE))
+        ]
+        await _wait_queued(len(tasks))
+        lock.release()
+        await asyncio.gather(*tasks)
+        assert order == ["interactive", "near 1", "near 2", "speculative"]
+        assert not lock.locked()
+
+    asyncio.run(run())
+
+def test_priority_lock_cancelled_waiter_is_skipped():
+    async def run():
+        lock = PriorityLock()
+        order = []
+
+        async def worker(name: str):
+            async with lock:
+                order.append(name)
+
+        await lock.acquire()
+        first = asyncio.create_task(worker("first"))
+        second = asyncio.create_task(worker("second"))
+        await _wait_queued(2)
+        first.cancel()
+        await _wait_queued(1)
+        lock.release()
+        await second
+        assert first.cancelled()
+        assert order == ["second"]
+        assert not lock.locked()
+
+    asyncio.run(run())
+
+def test_scheduler_runs_queued_jobs_in_priority_order():
+    async def run():
+        scheduler = GenerationScheduler(SchedulerConfig(max_concurrent_jobs=1, max_background_jobs=1), Metrics())
+        order = []
+        blocker = asyncio.Event()
+
+        async def job(name: str):
+            order.append(name)
+            if name == "blocking":
+                await blocker.wait()
+
+        tasks = [asyncio.create_task(scheduler.submit(lambda: job("blocking"), Priority.INTERACTIVE))]
+        await _wait_queued(1)
+        for name, priority in [("speculative", Priority.SPECULATIVE), ("near", Priority.NEAR_FUTURE), ("interactive", Priority.INTERACTIVE)]:
+            tasks.append(asyncio.create_task(scheduler.submit(lambda name=name: job(name), priority)))
+        await _wait_queued(3)
+        assert scheduler.queue_depth() == 3
+
+        blocker.set()
+        await asyncio.gather(*tasks)
+        assert order == ["blocking", "interactive", "near", "speculative"]
+        assert scheduler.report()["running"] == {"interactive": 0, "near_future": 0, "speculative": 0}
+
+    asyncio.run(run())
+
+def test_scheduler_keeps_slots_for_interactive_jobs():
+    async def run():
+        scheduler = GenerationScheduler(SchedulerConfig(max_concurrent_jobs=2, max_background_jobs=1), Metrics())
+        blocker = asyncio.Event()
+        started = []
+
+        async def job(name: str):
+            started.append(name)
+            await blocker.wait()
+
+        tasks = [
+            asyncio.create_task(scheduler.submit(lambda: job("background 1"), Priority.SPECULATIVE)),
+            asyncio.create_task(scheduler.submit(lambda: job("background 2"), Priority.SPECULATIVE)),
+            asyncio.create_task(scheduler.submit(lambda: job("interactive"), Priority.INTERACTIVE))
+        ]
+        await _wait_queued(3)
+        assert started == ["background 1", "interactive"]
+
+        blocker.set()
+        await asyncio.gather(*tasks)
+        assert started == ["background 1", "interactive", "background 2"]
+
+    asyncio.run(run())
+
+def test_scheduler_cancels_stale_queued_jobs():
+    async def run():
+        metrics = Metrics()
+        scheduler = GenerationScheduler(SchedulerConfig(max_concurrent_jobs=1, max_background_jobs=1), metrics)
+        blocker = asyncio.Event()
+        stale = False
+        ran = []
+
+        async def job(name: str):
+            ran.append(name)
+            await blocker.wait()
+
+        running = asyncio.create_task(scheduler.submit(lambda: job("running"), Priority.INTERACTIVE))
+        await _wait_queued(1)
+        queued = asyncio.create_task(scheduler.submit(lambda: job("stale"), Priority.SPECULATIVE, is_stale=lambda: stale))
+        await _wait_queued(1)
+
+        stale = True
+        blocker.set()
+        await running
+        with pytest.raises(StaleJobError):
+            await queued
+        assert ran == ["running"]
+        assert metrics.counters["stale_cancelled_speculative"] == 1
+
+    asyncio.run(run())
+
+def test_scheduler_cancelled_job_frees_its_slot():
+    async def run():
+        scheduler = GenerationScheduler(SchedulerConfig(max_concurrent_jobs=1, max_background_jobs=1), Metrics())
+        blocker = asyncio.Event()
+
+        async def job():
+            await blocker.wait()
+            return "done"
+
+        running = asyncio.create_task(scheduler.submit(job, Priority.INTERACTIVE))
+        queued = asyncio.create_task(scheduler.submit(job, Priority.INTERACTIVE))
+        await _wait_queued(2)
+        running.cancel()
+        queued_after = asyncio.create_task(scheduler.submit(job, Priority.INTERACTIVE))
+        await _wait_queued(2)
+
+        blocker.set()
+        assert await queued == "done"
+        assert await queued_after == "done"
+        assert running.cancelled()
+        assert scheduler.report()["running"]["interactive"] == 0
+
+    asyncio.run(run())
+
+def test_submit_inherits_the_priority_of_the_context():
+    async def run():
+        scheduler = GenerationScheduler(SchedulerConfig(max_concurrent_jobs=1, max_background_jobs=1), Metrics())
+        seen = []
+
+        async def job():
+            seen.append(scheduler.running.copy())
+
+        with generation_priority(Priority.NEAR_FUTURE):
+            await scheduler.submit(job)
+        assert seen[0][Priority.NEAR_FUTURE] == 1
+
+    asyncio.run(run())
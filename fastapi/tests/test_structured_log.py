@@ -0,0 +1,37 @@
+import logging
+
+from services.structured_log import SamplingFilter
+
+def _record(event: str = None) -> logging.LogRecord:
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, "message", None, None)
+    if event:
+        record.event = event
+    return record
+
+def test_records_without_a_sampled_event_all_pass():
+    sampling = SamplingFilter({"move": 0.1})
+    assert all(sampling.filter(_record()) for _ in range(10))
+    assert all(sampling.filter(_record("attack")) for _ in range(10))
+    assert sampling.sampled_out == 0
+
+def test_passes_every_nth_record_starting_with_the_first():
+    sampling = SamplingFilter({"move": 0.25})
+    passed = [sampling.filter(_record("move")) for _ in range(8)]
+    assert passed == [True, False, False, False, True, False, False, False]
+    assert sampling.sampled_out == 6
+
+def test_passed_records_carry_their_sample_rate():
+    sampling = SamplingFilter({"move": 0.5})
+    record = _record("move")
+    assert sampling.filter(record)
+    assert record.sample_rate == 0.5
+
+def test_events_are_counted_apart():
+    sampling = SamplingFilter({"move": 0.5, "take": 0.5})
+    passed = [sampling.filter(_record(event)) for event in ["move", "take", "move", "take", "move"]]
+    assert passed == [True, True, False, False, True]
+
+def test_zero_rate_passes_nothing():
+    sampling = SamplingFilter({"move": 0.0})
+    assert not any(sampling.filter(_record("move")) for _ in range(5))
+    assert sampling.sampled_out == 5
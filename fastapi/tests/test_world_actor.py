@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from domain.classes import Player, World
+from services.metrics import Metrics
+from services.world_actor import WorldActor, WorldReplacedError
+
+def _world() -> World:
+    return World(backstory="A test world.", player=Player(x=0, y=0))
+
+def test_commands_run_in_submission_order():
+    async def run():
+        actor = WorldActor(_world(), Metrics())
+
+        def move(dir_x: int):
+            def command(world: World):
+                world.player.move(dir_x=dir_x)
+                return world.player.get_position()
+            return command
+
+        results = await asyncio.gather(*(actor.execute(move(1)) for _ in range(5)))
+        assert results == [(1, 0), (2, 0), (3, 0), (4, 0), (5, 0)]
+        assert actor.snapshot.version == 5
+        assert actor.snapshot.position == (5, 0)
+        actor.stop()
+
+    asyncio.run(run())
+
+def test_snapshot_is_a_copy():
+    async def run():
+        actor = WorldActor(_world(), Metrics())
+        await actor.execute(lambda world: world.player.move(dir_y=1))
+        snapshot = actor.snapshot
+        await actor.execute(lambda world: world.player.move(dir_y=1))
+        assert snapshot.player.get_position() == (0, 1)
+        assert actor.snapshot.player.get_position() == (0, 2)
+        actor.stop()
+
+    asyncio.run(run())
+
+def test_failing_command_raises_to_its_caller_only():
+    async def run():
+        actor = WorldActor(_world(), Metrics())
+
+        def fail(world: World):
+            raise ValueError("no")
+
+        with pytest.raises(ValueError):
+            await actor.execute(fail)
+        assert await actor.execute(lambda world: world.backstory) == "A test world."
+        actor.stop()
+
+    asyncio.run(run())
+
+def test_stop_fails_queued_commands():
+    async def run():
+        actor = WorldActor(_world(), Metrics())
+        ran = []
+        tasks = [asyncio.create_task(actor.execute(lambda world, n=n: ran.append(n))) for n in range(3)]
+        await asyncio.sleep(0)  # queued, but the actor has not run them yet.
+        actor.stop()
+
+        results = await asyncio.wait_for(asyncio.gather(*tasks, return_exceptions=True), timeout=1)
+        assert ran == []
+        assert all(isinstance(result, WorldReplacedError) for result in results)
+
+    asyncio.run(run())
+
+def test_execute_after_stop_raises():
+    async def run():
+        actor = WorldActor(_world(), Metrics())
+        actor.stop()
+        with pytest.raises(WorldReplacedError):
+            await asyncio.wait_for(actor.execute(lambda world: None), timeout=1)
+
+    asyncio.run(run())
+
+def test_execute_on_retired_actor_raises():
+    async def run():
+        actor = WorldActor(_world(), Metrics())
+        actor.retired = True
+        with pytest.raises(WorldReplacedError):
+            await asyncio.wait_for(actor.execute(lambda world: None), timeout=1)
+        actor.stop()
+
+    asyncio.run(run())